@@ -0,0 +1,25 @@
+// Loaded once per browser session; survives Streamlit reruns because it lives in <head>.
+(function () {
+    if (window.healthcareChatbotLoaded) {
+        return;
+    }
+    window.healthcareChatbotLoaded = true;
+
+    // Scroll to bottom of chat whenever new messages are rendered
+    function scrollChatToBottom() {
+        var messages = document.getElementById('chat-messages');
+        if (messages) {
+            messages.scrollTop = messages.scrollHeight;
+        }
+    }
+
+    new MutationObserver(scrollChatToBottom).observe(document.body, {childList: true, subtree: true});
+
+    document.addEventListener('toggle-chatbot', function () {
+        // This event will be caught by Streamlit and handled in Python
+        var frame = document.querySelector('iframe');
+        if (frame) {
+            frame.contentWindow.postMessage('toggle-chatbot', '*');
+        }
+    });
+})();
@@ -0,0 +1,3246 @@
+import mysql.connector
+import numpy as np
+import base64
+import csv
+import functools
+import hashlib
+import heapq
+import hmac
+import io
+import math
+import itertools
+import html
+import mimetypes
+import shutil
+import socket
+import socketserver
+import sqlite3
+from datetime import date, datetime, timedelta
+import os
+import re
+import sys
+import json
+import queue
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from PIL import Image, ImageOps
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def shared(func=None, *, maxsize=None):
+    # One instance per process for pools, caches and worker threads, shared by every
+    # session and by the CLI commands; concurrent first calls still build it only once
+    if func is None:
+        return functools.partial(shared, maxsize=maxsize)
+    cached = functools.lru_cache(maxsize=maxsize)(func)
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        with lock:
+            return cached(*args)
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+# Instrumentation
+PROFILING_ENABLED = os.environ.get("HEALTHCARE_PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("HEALTHCARE_PROFILE_DIR", os.path.join(APP_DIR, "profiles"))
+PROFILE_INTERVAL = float(os.environ.get("HEALTHCARE_PROFILE_INTERVAL", "0.005"))
+
+class Metrics:
+    # Process-wide counters and summaries, plus per-rerun tallies kept in a thread-local
+    # because Streamlit runs each session's rerun on its own script thread.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._summaries = {}
+        self._rerun = threading.local()
+        self._collectors = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("span_seconds", time.perf_counter() - started, span=name)
+
+    def begin_rerun(self):
+        self._rerun.stats = {"html_bytes": 0, "db_queries": 0, "connections_opened": 0}
+
+    def rerun_add(self, key, amount=1):
+        stats = getattr(self._rerun, "stats", None)
+        if stats is not None:
+            stats[key] += amount
+
+    def end_rerun(self, page):
+        stats = getattr(self._rerun, "stats", None)
+        self._rerun.stats = None
+        if stats is None:
+            return
+        self.inc("reruns_total", page=page)
+        for key, value in stats.items():
+            self.observe(f"rerun_{key}", value, page=page)
+
+    def register_collector(self, name, collect):
+        # collect() returns a flat dict; its numeric values are exported as gauges
+        self._collectors[name] = collect
+
+    def snapshot(self):
+        with self._lock:
+            counters = [(name, dict(labels), value) for (name, labels), value in self._counters.items()]
+            summaries = [(name, dict(labels), list(values)) for (name, labels), values in self._summaries.items()]
+        gauges = {}
+        for name, collect in list(self._collectors.items()):
+            try:
+                gauges[name] = {key: value for key, value in collect().items()
+                                if isinstance(value, (int, float))}
+            except Exception:
+                gauges[name] = {}
+        return {
+            "counters": [{"name": n, "labels": l, "value": v} for n, l, v in counters],
+            "summaries": [{"name": n, "labels": l, "count": c, "sum": total, "max": peak}
+                          for n, l, (c, total, peak) in summaries],
+            "gauges": gauges,
+        }
+
+    def prometheus(self):
+        def label_text(labels):
+            if not labels:
+                return ""
+            pairs = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for key, value in labels.items())
+            return "{" + ",".join(pairs) + "}"
+
+        snapshot = self.snapshot()
+        lines = []
+        for counter in snapshot["counters"]:
+            lines.append(f"healthcare_{counter['name']}{label_text(counter['labels'])} {counter['value']}")
+        for summary in snapshot["summaries"]:
+            name, labels = f"healthcare_{summary['name']}", label_text(summary["labels"])
+            lines.append(f"{name}_count{labels} {summary['count']}")
+            lines.append(f"{name}_sum{labels} {summary['sum']}")
+            lines.append(f"{name}_max{labels} {summary['max']}")
+        for collector, values in snapshot["gauges"].items():
+            for key, value in values.items():
+                lines.append(f"healthcare_{collector}{label_text({'stat': key})} {value}")
+        return "\n".join(lines) + "\n"
+
+@shared
+def get_metrics():
+    return Metrics()
+
+def traced(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class SamplingProfiler:
+    # Samples one thread's stack at a fixed interval and keeps collapsed-stack counts,
+    # written as "frame;frame;frame count" lines that flame graph tools read.
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="healthcare-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+
+DB_BACKEND = os.environ.get("HEALTHCARE_DB_BACKEND", "mysql")
+DB_CONFIG = {
+    "host": os.environ.get("HEALTHCARE_DB_HOST", "localhost"),
+    "user": os.environ.get("HEALTHCARE_DB_USER", "root"),
+    "password": os.environ.get("HEALTHCARE_DB_PASSWORD", "mysql"),
+    "database": os.environ.get("HEALTHCARE_DB_NAME", "healthcare"),
+}
+SQLITE_PATH = os.environ.get("HEALTHCARE_SQLITE_PATH", os.path.join(APP_DIR, "healthcare.db"))
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("HEALTHCARE_SQLITE_BUSY_TIMEOUT", "30"))
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    # NORMAL is durable across application crashes in WAL mode; only an OS crash
+    # can roll back the most recent commits
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA mmap_size=268435456",
+]
+DB_POOL_SIZE = int(os.environ.get("HEALTHCARE_DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.environ.get("HEALTHCARE_DB_POOL_TIMEOUT", "5"))
+# Idle connections older than this are pinged before being handed out again
+DB_HEALTHCHECK_INTERVAL = float(os.environ.get("HEALTHCARE_DB_HEALTHCHECK_INTERVAL", "30"))
+DB_ERRORS = (mysql.connector.Error, sqlite3.Error)
+# Errors that say nothing about the statement itself: lost connections, an exhausted
+# pool, a locked SQLite file, MySQL deadlocks (1213) and lock wait timeouts (1205)
+TRANSIENT_DB_ERRORS = (
+    mysql.connector.errors.OperationalError,
+    mysql.connector.errors.InterfaceError,
+    mysql.connector.errors.PoolError,
+    sqlite3.OperationalError,
+)
+
+def is_transient_db_error(err):
+    return isinstance(err, TRANSIENT_DB_ERRORS) or getattr(err, "errno", None) in (1205, 1213)
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_converter("DATE", lambda value: date.fromisoformat(value.decode()))
+
+@functools.lru_cache(maxsize=512)
+def to_qmark(query):
+    # Queries are written with mysql.connector's %s placeholders
+    return query.replace("%s", "?")
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._cursor.execute(to_qmark(query), params)
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(to_qmark(query), rows)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class SQLiteConnection:
+    # The slice of the mysql.connector connection API the app relies on, over sqlite3.
+    # Autocommit like the MySQL pool; start_transaction() takes the write lock up front.
+    def __init__(self, path, busy_timeout):
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None,
+                                     check_same_thread=False, cached_statements=512,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        for pragma in SQLITE_PRAGMAS:
+            self._conn.execute(pragma)
+
+    def cursor(self, *args, **kwargs):
+        return SQLiteCursor(self._conn.cursor())
+
+    def start_transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        self._conn.close()
+
+class MeteredCursor:
+    def __init__(self, cursor, pool):
+        self._cursor = cursor
+        self._pool = pool
+
+    def execute(self, *args, **kwargs):
+        with self._pool.round_trip():
+            return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        with self._pool.round_trip():
+            return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class MeteredConnection:
+    # Counts every statement and transaction control call as one round trip
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+        self.dialect = pool.dialect
+        self.broken = False
+
+    def mark_broken(self):
+        # Closed instead of returned to the pool, e.g. after abandoning an unread result
+        self.broken = True
+
+    def cursor(self, *args, **kwargs):
+        return MeteredCursor(self._conn.cursor(*args, **kwargs), self._pool)
+
+    def start_transaction(self, *args, **kwargs):
+        with self._pool.round_trip():
+            return self._conn.start_transaction(*args, **kwargs)
+
+    def commit(self):
+        with self._pool.round_trip():
+            return self._conn.commit()
+
+    def rollback(self):
+        with self._pool.round_trip():
+            return self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class ConnectionPool:
+    def __init__(self, size, timeout, healthcheck_interval, connect, dialect="mysql", metrics=None):
+        self.size = size
+        self.metrics = metrics
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.connect = connect
+        self.dialect = dialect
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+            "round_trips": 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _open(self):
+        try:
+            conn = self.connect()
+        except DB_ERRORS:
+            with self._lock:
+                self._opened -= 1
+            raise
+        if self.metrics:
+            self.metrics.inc("db_connections_opened_total")
+            self.metrics.rerun_add("connections_opened")
+        return conn
+
+    @contextmanager
+    def round_trip(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._count("round_trips")
+            if self.metrics:
+                self.metrics.observe("db_query_seconds", time.perf_counter() - started)
+                self.metrics.rerun_add("db_queries")
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                return True
+            return False
+
+    def get_connection(self):
+        try:
+            conn, last_used = self._idle.get_nowait()
+            self._count("hits")
+        except queue.Empty:
+            if self._reserve_slot():
+                self._count("misses")
+                return self._open()
+            self._count("waits")
+            started = time.monotonic()
+            try:
+                conn, last_used = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                self._count("timeouts")
+                raise mysql.connector.errors.PoolError(
+                    f"No database connection available after {self.timeout}s (pool size {self.size})"
+                )
+            finally:
+                self._count("wait_seconds", time.monotonic() - started)
+
+        if time.monotonic() - last_used > self.healthcheck_interval:
+            try:
+                conn.ping(reconnect=False)
+            except DB_ERRORS:
+                self._count("health_check_failures")
+                self._close_quietly(conn)
+                return self._open()
+        return conn
+
+    def release(self, conn):
+        self._idle.put((conn, time.monotonic()))
+
+    def discard(self, conn):
+        self._count("discarded")
+        with self._lock:
+            self._opened -= 1
+        self._close_quietly(conn)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except DB_ERRORS:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.get_connection()
+        metered = MeteredConnection(conn, self)
+        try:
+            yield metered
+        # BaseException: a streaming generator closed half way through exits here with
+        # GeneratorExit, and its connection must still go back or be discarded
+        except BaseException:
+            if metered.broken:
+                self.discard(conn)
+                raise
+            try:
+                conn.rollback()
+            except DB_ERRORS:
+                self.discard(conn)
+                raise
+            self.release(conn)
+            raise
+        else:
+            if metered.broken:
+                self.discard(conn)
+            else:
+                self.release(conn)
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["size"] = self.size
+            stats["open"] = self._opened
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["open"] - stats["idle"]
+        return stats
+
+# Versioned schema changes, applied in order and recorded in schema_migrations.
+# Never edit an applied migration; append a new version instead.
+MIGRATIONS = [
+    (1, "create patients table", {
+        "mysql": ["""
+            CREATE TABLE IF NOT EXISTS patients (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                age INT NOT NULL,
+                gender VARCHAR(20) NOT NULL,
+                locality VARCHAR(100) NOT NULL,
+                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """],
+        "sqlite": ["""
+            CREATE TABLE IF NOT EXISTS patients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name VARCHAR(100) NOT NULL,
+                age INT NOT NULL,
+                gender VARCHAR(20) NOT NULL,
+                locality VARCHAR(100) NOT NULL,
+                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """],
+    }),
+    (2, "index patients by locality, registration date and name", {
+        "mysql": [
+            "CREATE INDEX idx_patients_locality ON patients (locality)",
+            "CREATE INDEX idx_patients_registration_date ON patients (registration_date)",
+            "CREATE INDEX idx_patients_name ON patients (name)",
+        ],
+        "sqlite": [
+            "CREATE INDEX idx_patients_locality ON patients (locality)",
+            "CREATE INDEX idx_patients_registration_date ON patients (registration_date)",
+            "CREATE INDEX idx_patients_name ON patients (name)",
+        ],
+    }),
+    (3, "add idempotency key for queued registrations", {
+        "mysql": [
+            "ALTER TABLE patients ADD COLUMN client_token CHAR(36) NULL",
+            "CREATE UNIQUE INDEX uq_patients_client_token ON patients (client_token)",
+        ],
+        "sqlite": [
+            "ALTER TABLE patients ADD COLUMN client_token CHAR(36) NULL",
+            "CREATE UNIQUE INDEX uq_patients_client_token ON patients (client_token)",
+        ],
+    }),
+    (4, "create doctors, slots and appointments tables", {
+        "mysql": [
+            """
+            CREATE TABLE IF NOT EXISTS doctors (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL UNIQUE,
+                specialty VARCHAR(100) NOT NULL,
+                image VARCHAR(255) NOT NULL,
+                description VARCHAR(500) NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS slots (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                doctor_id INT NOT NULL,
+                starts_at DATETIME NOT NULL,
+                is_booked TINYINT(1) NOT NULL DEFAULT 0,
+                UNIQUE KEY uq_slots_doctor_start (doctor_id, starts_at),
+                KEY idx_slots_free (doctor_id, is_booked, starts_at),
+                FOREIGN KEY (doctor_id) REFERENCES doctors (id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS appointments (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                slot_id INT NOT NULL,
+                patient_name VARCHAR(100) NOT NULL,
+                booked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY uq_appointments_slot (slot_id),
+                FOREIGN KEY (slot_id) REFERENCES slots (id)
+            )
+            """,
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS doctors (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name VARCHAR(100) NOT NULL UNIQUE,
+                specialty VARCHAR(100) NOT NULL,
+                image VARCHAR(255) NOT NULL,
+                description VARCHAR(500) NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS slots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doctor_id INT NOT NULL REFERENCES doctors (id),
+                starts_at TIMESTAMP NOT NULL,
+                is_booked INT NOT NULL DEFAULT 0,
+                UNIQUE (doctor_id, starts_at)
+            )
+            """,
+            "CREATE INDEX idx_slots_free ON slots (doctor_id, is_booked, starts_at)",
+            """
+            CREATE TABLE IF NOT EXISTS appointments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                slot_id INT NOT NULL UNIQUE REFERENCES slots (id),
+                patient_name VARCHAR(100) NOT NULL,
+                booked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+        ],
+    }),
+    (5, "add normalized name key and search indexes", {
+        "mysql": [
+            "ALTER TABLE patients ADD COLUMN name_key VARCHAR(100) NULL",
+            "UPDATE patients SET name_key = LOWER(TRIM(name))",
+            "CREATE INDEX idx_patients_name_key ON patients (name_key, id)",
+            "CREATE INDEX idx_patients_locality_name_key ON patients (locality, name_key, id)",
+        ],
+        "sqlite": [
+            "ALTER TABLE patients ADD COLUMN name_key VARCHAR(100) NULL",
+            "UPDATE patients SET name_key = LOWER(TRIM(name))",
+            "CREATE INDEX idx_patients_name_key ON patients (name_key, id)",
+            "CREATE INDEX idx_patients_locality_name_key ON patients (locality, name_key, id)",
+        ],
+    }),
+    # Left NULL on existing rows so the unique index can be created whatever duplicates
+    # the table already holds; `python registration.py dedup` keys and merges those rows
+    (6, "add unique identity key", {
+        "mysql": [
+            "ALTER TABLE patients ADD COLUMN identity_key VARCHAR(255) NULL",
+            "CREATE UNIQUE INDEX uq_patients_identity_key ON patients (identity_key)",
+        ],
+        "sqlite": [
+            "ALTER TABLE patients ADD COLUMN identity_key VARCHAR(255) NULL",
+            "CREATE UNIQUE INDEX uq_patients_identity_key ON patients (identity_key)",
+        ],
+    }),
+    # Covers the export date range scan and lets the reporting GROUP BYs run index-only
+    (7, "index patients for date-range exports and reports", {
+        "mysql": ["CREATE INDEX idx_patients_reporting ON patients (registration_date, locality, gender)"],
+        "sqlite": ["CREATE INDEX idx_patients_reporting ON patients (registration_date, locality, gender)"],
+    }),
+    # Dashboard counters kept current by triggers, which fire once per row actually written
+    # (never for an upsert that did nothing) whichever code path or process wrote it
+    (8, "add trigger-maintained registration and open slot counters", {
+        "mysql": [
+            """
+            CREATE TABLE IF NOT EXISTS registration_counts (
+                day DATE NOT NULL,
+                locality VARCHAR(100) NOT NULL,
+                registrations INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, locality)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS slot_counts (
+                day DATE NOT NULL,
+                doctor_id INT NOT NULL,
+                open_slots INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, doctor_id)
+            )
+            """,
+            """
+            CREATE TRIGGER trg_patients_count_insert AFTER INSERT ON patients FOR EACH ROW
+                INSERT INTO registration_counts (day, locality, registrations)
+                VALUES (DATE(NEW.registration_date), NEW.locality, 1)
+                ON DUPLICATE KEY UPDATE registrations = registrations + 1
+            """,
+            """
+            CREATE TRIGGER trg_patients_count_delete AFTER DELETE ON patients FOR EACH ROW
+                UPDATE registration_counts SET registrations = registrations - 1
+                WHERE day = DATE(OLD.registration_date) AND locality = OLD.locality
+            """,
+            """
+            CREATE TRIGGER trg_slots_count_insert AFTER INSERT ON slots FOR EACH ROW
+                INSERT INTO slot_counts (day, doctor_id, open_slots)
+                VALUES (DATE(NEW.starts_at), NEW.doctor_id, 1 - NEW.is_booked)
+                ON DUPLICATE KEY UPDATE open_slots = open_slots + 1 - NEW.is_booked
+            """,
+            """
+            CREATE TRIGGER trg_slots_count_update AFTER UPDATE ON slots FOR EACH ROW
+                UPDATE slot_counts SET open_slots = open_slots + OLD.is_booked - NEW.is_booked
+                WHERE day = DATE(NEW.starts_at) AND doctor_id = NEW.doctor_id
+            """,
+            """
+            CREATE TRIGGER trg_slots_count_delete AFTER DELETE ON slots FOR EACH ROW
+                UPDATE slot_counts SET open_slots = open_slots - (1 - OLD.is_booked)
+                WHERE day = DATE(OLD.starts_at) AND doctor_id = OLD.doctor_id
+            """,
+            # Backfill after the triggers exist: rows written in between are counted by the
+            # trigger and then overwritten with the full count, never missed
+            """
+            INSERT INTO registration_counts (day, locality, registrations)
+            SELECT DATE(registration_date), locality, COUNT(*) FROM patients
+            GROUP BY DATE(registration_date), locality
+            ON DUPLICATE KEY UPDATE registrations = VALUES(registrations)
+            """,
+            """
+            INSERT INTO slot_counts (day, doctor_id, open_slots)
+            SELECT DATE(starts_at), doctor_id, SUM(1 - is_booked) FROM slots
+            GROUP BY DATE(starts_at), doctor_id
+            ON DUPLICATE KEY UPDATE open_slots = VALUES(open_slots)
+            """,
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS registration_counts (
+                day DATE NOT NULL,
+                locality VARCHAR(100) NOT NULL,
+                registrations INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, locality)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS slot_counts (
+                day DATE NOT NULL,
+                doctor_id INT NOT NULL,
+                open_slots INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, doctor_id)
+            )
+            """,
+            # The whole migration holds the write lock, so backfill and triggers are atomic
+            """
+            INSERT INTO registration_counts (day, locality, registrations)
+            SELECT DATE(registration_date), locality, COUNT(*) FROM patients
+            GROUP BY DATE(registration_date), locality
+            """,
+            """
+            INSERT INTO slot_counts (day, doctor_id, open_slots)
+            SELECT DATE(starts_at), doctor_id, SUM(1 - is_booked) FROM slots
+            GROUP BY DATE(starts_at), doctor_id
+            """,
+            """
+            CREATE TRIGGER trg_patients_count_insert AFTER INSERT ON patients BEGIN
+                INSERT INTO registration_counts (day, locality, registrations)
+                VALUES (DATE(NEW.registration_date), NEW.locality, 1)
+                ON CONFLICT (day, locality) DO UPDATE SET registrations = registrations + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER trg_patients_count_delete AFTER DELETE ON patients BEGIN
+                UPDATE registration_counts SET registrations = registrations - 1
+                WHERE day = DATE(OLD.registration_date) AND locality = OLD.locality;
+            END
+            """,
+            """
+            CREATE TRIGGER trg_slots_count_insert AFTER INSERT ON slots BEGIN
+                INSERT INTO slot_counts (day, doctor_id, open_slots)
+                VALUES (DATE(NEW.starts_at), NEW.doctor_id, 1 - NEW.is_booked)
+                ON CONFLICT (day, doctor_id) DO UPDATE SET open_slots = open_slots + 1 - NEW.is_booked;
+            END
+            """,
+            """
+            CREATE TRIGGER trg_slots_count_update AFTER UPDATE OF is_booked ON slots BEGIN
+                UPDATE slot_counts SET open_slots = open_slots + OLD.is_booked - NEW.is_booked
+                WHERE day = DATE(NEW.starts_at) AND doctor_id = NEW.doctor_id;
+            END
+            """,
+            """
+            CREATE TRIGGER trg_slots_count_delete AFTER DELETE ON slots BEGIN
+                UPDATE slot_counts SET open_slots = open_slots - (1 - OLD.is_booked)
+                WHERE day = DATE(OLD.starts_at) AND doctor_id = OLD.doctor_id;
+            END
+            """,
+        ],
+    }),
+    # Reminder outbox written in the booking transaction; the scheduler reads only the
+    # pending rows due soon through (sent_at, due_at), never the appointments table
+    (9, "add appointment reminder outbox", {
+        "mysql": [
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                appointment_id INT NOT NULL,
+                kind VARCHAR(16) NOT NULL,
+                due_at DATETIME NOT NULL,
+                sent_at DATETIME NULL,
+                outcome VARCHAR(16) NULL,
+                attempts INT NOT NULL DEFAULT 0,
+                UNIQUE KEY uq_reminders_appointment_kind (appointment_id, kind),
+                KEY idx_reminders_pending (sent_at, due_at),
+                FOREIGN KEY (appointment_id) REFERENCES appointments (id)
+            )
+            """,
+            """
+            INSERT INTO reminders (appointment_id, kind, due_at)
+            SELECT a.id, '24h', s.starts_at - INTERVAL 24 HOUR FROM appointments a
+            JOIN slots s ON s.id = a.slot_id WHERE s.starts_at - INTERVAL 24 HOUR > NOW()
+            """,
+            """
+            INSERT INTO reminders (appointment_id, kind, due_at)
+            SELECT a.id, '1h', s.starts_at - INTERVAL 1 HOUR FROM appointments a
+            JOIN slots s ON s.id = a.slot_id WHERE s.starts_at - INTERVAL 1 HOUR > NOW()
+            """,
+        ],
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                appointment_id INT NOT NULL REFERENCES appointments (id),
+                kind VARCHAR(16) NOT NULL,
+                due_at TIMESTAMP NOT NULL,
+                sent_at TIMESTAMP NULL,
+                outcome VARCHAR(16) NULL,
+                attempts INT NOT NULL DEFAULT 0,
+                UNIQUE (appointment_id, kind)
+            )
+            """,
+            "CREATE INDEX idx_reminders_pending ON reminders (sent_at, due_at)",
+            """
+            INSERT INTO reminders (appointment_id, kind, due_at)
+            SELECT a.id, '24h', DATETIME(s.starts_at, '-24 hours') FROM appointments a
+            JOIN slots s ON s.id = a.slot_id WHERE DATETIME(s.starts_at, '-24 hours') > DATETIME('now', 'localtime')
+            """,
+            """
+            INSERT INTO reminders (appointment_id, kind, due_at)
+            SELECT a.id, '1h', DATETIME(s.starts_at, '-1 hours') FROM appointments a
+            JOIN slots s ON s.id = a.slot_id WHERE DATETIME(s.starts_at, '-1 hours') > DATETIME('now', 'localtime')
+            """,
+        ],
+    }),
+]
+MIGRATION_LOCK = "healthcare_schema_migrations"
+AUTO_MIGRATE = os.environ.get("HEALTHCARE_AUTO_MIGRATE", "1") == "1"
+
+@contextmanager
+def migration_lock(conn, cursor):
+    # Serialise concurrent cold starts so only one process applies each version
+    if conn.dialect == "sqlite":
+        # SQLite DDL is transactional; holding the write lock covers the whole run
+        conn.start_transaction()
+        try:
+            yield
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return
+
+    cursor.execute("SELECT GET_LOCK(%s, 60)", (MIGRATION_LOCK,))
+    if cursor.fetchone()[0] != 1:
+        raise mysql.connector.errors.DatabaseError("Timed out waiting for the schema migration lock")
+    try:
+        yield
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        cursor.fetchone()
+
+# MySQL commits every DDL statement on its own, so a migration that fails halfway
+# leaves its earlier statements applied. Each step is recorded as it completes, and a
+# schema change whose object is already in the catalog (applied just before a crash
+# lost its step record, or made by hand) is skipped instead of failing the rerun.
+MYSQL_SCHEMA_CHECKS = [
+    (re.compile(r"\s*ALTER TABLE (\w+) ADD COLUMN (\w+)", re.IGNORECASE), """
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """),
+    (re.compile(r"\s*CREATE (?:UNIQUE )?INDEX (\w+) ON (\w+)", re.IGNORECASE), """
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND INDEX_NAME = %s AND TABLE_NAME = %s
+    """),
+    (re.compile(r"\s*CREATE TRIGGER (\w+)", re.IGNORECASE), """
+        SELECT 1 FROM information_schema.TRIGGERS
+        WHERE TRIGGER_SCHEMA = DATABASE() AND TRIGGER_NAME = %s
+    """),
+]
+MYSQL_DDL = re.compile(r"\s*(CREATE|ALTER|DROP)\b", re.IGNORECASE)
+
+def mysql_schema_object_exists(cursor, statement):
+    for pattern, check in MYSQL_SCHEMA_CHECKS:
+        match = pattern.match(statement)
+        if match:
+            cursor.execute(check, match.groups())
+            return bool(cursor.fetchall())
+    return False
+
+def apply_mysql_steps(conn, cursor, version, statements):
+    cursor.execute("SELECT step FROM schema_migration_steps WHERE version = %s", (version,))
+    done = {row[0] for row in cursor.fetchall()}
+    record = "INSERT INTO schema_migration_steps (version, step) VALUES (%s, %s)"
+    for step, statement in enumerate(statements):
+        if step in done:
+            continue
+        if MYSQL_DDL.match(statement):
+            if not mysql_schema_object_exists(cursor, statement):
+                cursor.execute(statement)
+            cursor.execute(record, (version, step))
+            continue
+        # Data steps commit together with their record, so they run exactly once
+        conn.start_transaction()
+        try:
+            cursor.execute(statement)
+            cursor.execute(record, (version, step))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def run_migrations(conn):
+    cursor = conn.cursor()
+    try:
+        with migration_lock(conn, cursor):
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(200) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            if conn.dialect == "mysql":
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migration_steps (
+                        version INT NOT NULL,
+                        step INT NOT NULL,
+                        PRIMARY KEY (version, step)
+                    )
+                """)
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cursor.fetchall()}
+
+            newly_applied = []
+            for version, description, statements in MIGRATIONS:
+                if version in applied:
+                    continue
+                if conn.dialect == "mysql":
+                    apply_mysql_steps(conn, cursor, version, statements["mysql"])
+                else:
+                    for statement in statements[conn.dialect]:
+                        cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                if conn.dialect == "mysql":
+                    cursor.execute("DELETE FROM schema_migration_steps WHERE version = %s", (version,))
+                    conn.commit()
+                newly_applied.append(version)
+            return newly_applied
+    finally:
+        cursor.close()
+
+def create_database(pool_size=DB_POOL_SIZE, pool_timeout=DB_POOL_TIMEOUT, metrics=None):
+    if DB_BACKEND == "sqlite":
+        return ConnectionPool(pool_size, pool_timeout, DB_HEALTHCHECK_INTERVAL,
+                              lambda: SQLiteConnection(SQLITE_PATH, SQLITE_BUSY_TIMEOUT),
+                              dialect="sqlite", metrics=metrics)
+    if DB_BACKEND != "mysql":
+        raise ValueError(f"Unknown HEALTHCARE_DB_BACKEND {DB_BACKEND!r}; expected 'mysql' or 'sqlite'")
+    # Autocommit keeps a single-statement write to one round trip; multi-statement
+    # writes open their own transaction with conn.start_transaction()
+    return ConnectionPool(pool_size, pool_timeout, DB_HEALTHCHECK_INTERVAL,
+                          lambda: mysql.connector.connect(autocommit=True, **DB_CONFIG),
+                          dialect="mysql", metrics=metrics)
+
+# One pool per Streamlit server process, shared by every session and rerun
+@shared
+def get_database():
+    database = create_database(metrics=get_metrics())
+    get_metrics().register_collector("db_pool", database.snapshot)
+    if AUTO_MIGRATE:
+        with database.connection() as conn:
+            run_migrations(conn)
+    return database
+
+def get_pool_stats():
+    return get_database().snapshot()
+
+SEARCH_PAGE_SIZE = int(os.environ.get("HEALTHCARE_SEARCH_PAGE_SIZE", "20"))
+SEARCH_CACHE_SIZE = int(os.environ.get("HEALTHCARE_SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.environ.get("HEALTHCARE_SEARCH_CACHE_TTL", "30"))
+
+# Every insert is idempotent on client_token and identity_key: a resubmitted form, a
+# double click or a replayed queue batch leaves exactly one row, and rowcount says
+# whether this call created it
+PATIENT_SQL = {
+    "insert": {
+        "mysql": """
+            INSERT INTO patients (name, age, gender, locality, registration_date, client_token, name_key, identity_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """,
+        "sqlite": """
+            INSERT INTO patients (name, age, gender, locality, registration_date, client_token, name_key, identity_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT DO NOTHING
+        """,
+    },
+    "insert_many": {
+        "mysql": """
+            INSERT INTO patients (name, age, gender, locality, registration_date, name_key, identity_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """,
+        "sqlite": """
+            INSERT INTO patients (name, age, gender, locality, registration_date, name_key, identity_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT DO NOTHING
+        """,
+    },
+    "insert_queued": {
+        "mysql": """
+            INSERT INTO patients (name, age, gender, locality, registration_date, client_token, name_key, identity_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = id
+        """,
+        "sqlite": """
+            INSERT INTO patients (name, age, gender, locality, registration_date, client_token, name_key, identity_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT DO NOTHING
+        """,
+    },
+    # MySQL's case-insensitive collation ranks punctuation below letters, so a computed
+    # upper bound is unsafe there; LIKE with a constant prefix is a range scan on both
+    "name_prefix": {
+        "mysql": "name_key LIKE %s",
+        "sqlite": "name_key >= %s AND name_key < %s",
+    },
+}
+
+def normalize_name(name):
+    # Must agree with the LOWER(TRIM(name)) backfill in migration 5
+    return name.strip().lower()
+
+def identity_key(name, age, gender, locality):
+    # The same person typed with different spacing or capitalisation maps to one key
+    return "|".join((" ".join(name.split()).lower(), str(int(age)), gender.strip().lower(),
+                     " ".join(locality.split()).lower()))
+
+def name_prefix_params(dialect, prefix):
+    if dialect == "mysql":
+        return (prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)
+    return (prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+class LRUCache:
+    # Bounded, thread-safe LRU shared across sessions. With a ttl, entries expire so data
+    # changed by other processes shows up; set_version() drops everything computed
+    # from an older version of the source (a reloaded rules file, say).
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or now - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["misses"] += 1
+
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
+
+    def invalidate(self, predicate):
+        # Drops only the entries whose key matches; returns how many went
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self.stats["invalidations"] += 1
+        return len(stale)
+
+    def set_version(self, version):
+        if version == self.version:
+            return
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self._entries.clear()
+                    self.stats["invalidations"] += 1
+                self.version = version
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(self.stats, entries=len(self._entries),
+                        hit_rate=self.stats["hits"] / lookups if lookups else 0.0)
+
+@shared
+def get_search_cache():
+    cache = LRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+    get_metrics().register_collector("patient_search_cache", cache.snapshot)
+    return cache
+
+def search_page_affected(key, name_key, age, locality):
+    # key is the search cache key; a new row can only change pages it would appear on
+    name_prefix, key_locality, min_age, max_age, after, _ = key
+    return (name_key.startswith(name_prefix)
+            and (not key_locality or key_locality.lower() == locality)
+            and (min_age is None or age >= min_age)
+            and (max_age is None or age <= max_age)
+            and (after is None or name_key >= after[0]))
+
+class PatientRepository:
+    def __init__(self, database, search_cache=None):
+        self.database = database
+        self.search_cache = search_cache
+
+    def _sql(self, conn, name):
+        return PATIENT_SQL[name][conn.dialect]
+
+    def _changed(self, rows):
+        # rows start with (name, age, gender, locality)
+        if not self.search_cache:
+            return
+        written = [(normalize_name(row[0]), int(row[1]), row[3].strip().lower()) for row in rows]
+        self.search_cache.invalidate(
+            lambda key: any(search_page_affected(key, *patient) for patient in written)
+        )
+
+    @staticmethod
+    def _now():
+        # Always written from here: SQLite's CURRENT_TIMESTAMP default is UTC, while MySQL's
+        # follows the session time zone and queued registrations carry local time
+        return datetime.now().replace(microsecond=0)
+
+    def add(self, name, age, gender, locality, client_token=None):
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self._sql(conn, "insert"), (
+                    name, age, gender, locality, self._now(), client_token, normalize_name(name),
+                    identity_key(name, age, gender, locality)
+                ))
+                created = cursor.rowcount == 1
+            finally:
+                cursor.close()
+        if created:
+            self._changed([(name, age, gender, locality)])
+        return created
+
+    def add_many(self, rows):
+        # One transaction per call; mysql.connector rewrites executemany into a multi-row INSERT.
+        # Returns how many rows were new.
+        registered_at = self._now()
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                cursor.executemany(self._sql(conn, "insert_many"), [
+                    tuple(row) + (registered_at, normalize_name(row[0]), identity_key(*row)) for row in rows
+                ])
+                created = cursor.rowcount
+                conn.commit()
+            finally:
+                cursor.close()
+        if created:
+            self._changed(rows)
+        return created
+
+    def add_queued(self, rows):
+        # rows are (name, age, gender, locality, registration_date, client_token)
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                conn.start_transaction()
+                cursor.executemany(self._sql(conn, "insert_queued"), [
+                    tuple(row) + (normalize_name(row[0]), identity_key(*row[:4])) for row in rows
+                ])
+                conn.commit()
+            finally:
+                cursor.close()
+        self._changed(rows)
+
+    def exists(self, key, client_token=None):
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT 1 FROM patients WHERE identity_key = %s OR client_token = %s LIMIT 1",
+                               (key, client_token))
+                return cursor.fetchone() is not None
+            finally:
+                cursor.close()
+
+    def iter_identity_keys(self, batch_size=10000):
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT identity_key FROM patients WHERE identity_key IS NOT NULL")
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row[0]
+            finally:
+                cursor.close()
+
+    @traced("db.search_patients")
+    def search_uncached(self, name_prefix="", locality="", min_age=None, max_age=None,
+                        after=None, limit=SEARCH_PAGE_SIZE):
+        # Keyset pagination over (name_key, id): every page is an index seek from the
+        # last row of the previous one, so page 500 costs the same as page 1.
+        # Served by idx_patients_locality_name_key when a locality is given,
+        # otherwise by idx_patients_name_key.
+        with self.database.connection() as conn:
+            clauses, params = [], []
+            name_prefix = normalize_name(name_prefix)
+            if name_prefix:
+                clauses.append(self._sql(conn, "name_prefix"))
+                params.extend(name_prefix_params(conn.dialect, name_prefix))
+            if locality:
+                clauses.append("locality = %s")
+                params.append(locality.strip())
+            if min_age is not None:
+                clauses.append("age >= %s")
+                params.append(min_age)
+            if max_age is not None:
+                clauses.append("age <= %s")
+                params.append(max_age)
+            if after is not None:
+                clauses.append("(name_key, id) > (%s, %s)")
+                params.extend(after)
+            query = "SELECT id, name, name_key, age, gender, locality, registration_date FROM patients"
+            if clauses:
+                query += " WHERE " + " AND ".join(clauses)
+            query += " ORDER BY name_key, id LIMIT %s"
+            params.append(limit + 1)
+
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, tuple(params))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        patients = [
+            {"id": row[0], "name": row[1], "age": row[3], "gender": row[4], "locality": row[5],
+             "registration_date": row[6]}
+            for row in rows[:limit]
+        ]
+        next_after = (rows[limit - 1][2], rows[limit - 1][0]) if len(rows) > limit else None
+        return patients, next_after
+
+    def search(self, name_prefix="", locality="", min_age=None, max_age=None,
+               after=None, limit=SEARCH_PAGE_SIZE):
+        if self.search_cache is None:
+            return self.search_uncached(name_prefix, locality, min_age, max_age, after, limit)
+        key = (normalize_name(name_prefix), locality.strip(), min_age, max_age, after, limit)
+        return self.search_cache.get(
+            key, lambda: self.search_uncached(name_prefix, locality, min_age, max_age, after, limit)
+        )
+
+def get_patients():
+    return PatientRepository(get_database(), get_search_cache())
+
+IDENTITY_FILTER_CAPACITY = int(os.environ.get("HEALTHCARE_IDENTITY_FILTER_CAPACITY", "1000000"))
+IDENTITY_FILTER_FP_RATE = float(os.environ.get("HEALTHCARE_IDENTITY_FILTER_FP_RATE", "0.01"))
+
+class IdentityFilter:
+    # Bloom filter over identity keys and client tokens of registered patients. A miss
+    # proves the registration is new, so the common case goes straight to the insert;
+    # a hit is confirmed with one index lookup before a submit is treated as a repeat.
+    def __init__(self, capacity, fp_rate):
+        self.bits = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._array = bytearray((self.bits + 7) // 8)
+        self._lock = threading.Lock()
+        self.ready = False
+        self.stats = {"keys": 0, "checks": 0, "maybe_present": 0, "confirmed_duplicates": 0}
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        positions = self._positions(key)
+        with self._lock:
+            for position in positions:
+                self._array[position >> 3] |= 1 << (position & 7)
+            self.stats["keys"] += 1
+
+    def might_contain(self, key):
+        self.stats["checks"] += 1
+        found = all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+        if found:
+            self.stats["maybe_present"] += 1
+        return found
+
+    def load(self, keys):
+        for key in keys:
+            self.add(key)
+        self.ready = True
+
+    def snapshot(self):
+        return dict(self.stats, ready=self.ready, bits=self.bits, hashes=self.hashes)
+
+def load_identity_filter(identity_filter):
+    # Runs on its own thread, database connection included, so a registration never
+    # waits on (or fails with) an unreachable database just to build the filter
+    try:
+        identity_filter.load(get_patients().iter_identity_keys())
+    except DB_ERRORS:
+        # Stay not-ready: registration then relies on the unique indexes alone
+        pass
+
+@shared
+def get_identity_filter():
+    identity_filter = IdentityFilter(IDENTITY_FILTER_CAPACITY, IDENTITY_FILTER_FP_RATE)
+    get_metrics().register_collector("identity_filter", identity_filter.snapshot)
+    threading.Thread(target=load_identity_filter, args=(identity_filter,),
+                     name="identity-filter-load", daemon=True).start()
+    return identity_filter
+
+def is_repeat_registration(key, client_token):
+    identity_filter = get_identity_filter()
+    if not identity_filter.ready:
+        return False
+    if not identity_filter.might_contain(key) and not (client_token and identity_filter.might_contain(client_token)):
+        return False
+    try:
+        repeat = get_patients().exists(key, client_token)
+    except DB_ERRORS:
+        return False
+    if repeat:
+        identity_filter.stats["confirmed_duplicates"] += 1
+    return repeat
+
+def remember_registration(key, client_token):
+    identity_filter = get_identity_filter()
+    identity_filter.add(key)
+    if client_token:
+        identity_filter.add(client_token)
+
+WRITE_MODE = os.environ.get("HEALTHCARE_WRITE_MODE", "sync")
+QUEUE_PATH = os.environ.get("HEALTHCARE_QUEUE_PATH", os.path.join(APP_DIR, "registration_queue.db"))
+QUEUE_BATCH_SIZE = int(os.environ.get("HEALTHCARE_QUEUE_BATCH_SIZE", "200"))
+QUEUE_POLL_INTERVAL = float(os.environ.get("HEALTHCARE_QUEUE_POLL_INTERVAL", "1"))
+QUEUE_MAX_BACKOFF = float(os.environ.get("HEALTHCARE_QUEUE_MAX_BACKOFF", "60"))
+# Rows the database keeps rejecting are moved to dead_registrations after this many tries
+QUEUE_MAX_ATTEMPTS = int(os.environ.get("HEALTHCARE_QUEUE_MAX_ATTEMPTS", "5"))
+
+class RegistrationQueue:
+    # Durable local write-ahead queue: registrations are committed to SQLite (WAL,
+    # synchronous=FULL) before being acknowledged and drained to the database in the background.
+    def __init__(self, path, max_attempts=QUEUE_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pending_registrations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_token TEXT NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                gender TEXT NOT NULL,
+                locality TEXT NOT NULL,
+                registered_at TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS dead_registrations (
+                id INTEGER PRIMARY KEY,
+                client_token TEXT NOT NULL,
+                name TEXT NOT NULL,
+                age INTEGER NOT NULL,
+                gender TEXT NOT NULL,
+                locality TEXT NOT NULL,
+                registered_at TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_error TEXT,
+                failed_at TEXT NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.stats = {"enqueued": 0, "drained": 0, "failed_batches": 0, "failed_rows": 0, "dead_lettered": 0}
+
+    def enqueue(self, name, age, gender, locality, client_token):
+        registered_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO pending_registrations "
+                "(client_token, name, age, gender, locality, registered_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (client_token, name, age, gender, locality, registered_at)
+            )
+            self.stats["enqueued"] += cursor.rowcount
+        self._wakeup.set()
+
+    def peek(self, limit):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, name, age, gender, locality, registered_at, client_token "
+                "FROM pending_registrations ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def ack(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_registrations WHERE id = ?", [(i,) for i in ids])
+            self.stats["drained"] += len(ids)
+
+    def record_failure(self, row_id, error):
+        # Returns True when the row has used up its attempts and was dead-lettered
+        failed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE pending_registrations SET attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (str(error), row_id)
+                )
+                moved = self._conn.execute(
+                    "INSERT INTO dead_registrations "
+                    "SELECT id, client_token, name, age, gender, locality, registered_at, attempts, last_error, ? "
+                    "FROM pending_registrations WHERE id = ? AND attempts >= ?",
+                    (failed_at, row_id, self.max_attempts)
+                ).rowcount
+                if moved:
+                    self._conn.execute("DELETE FROM pending_registrations WHERE id = ?", (row_id,))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.stats["failed_rows"] += 1
+            self.stats["dead_lettered"] += moved
+        return bool(moved)
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending_registrations").fetchone()[0]
+
+    def dead(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead_registrations").fetchone()[0]
+
+    def drain_once(self, batch_size):
+        rows = self.peek(batch_size)
+        if not rows:
+            return 0
+        patients = get_patients()
+        try:
+            patients.add_queued([row[1:] for row in rows])
+        except DB_ERRORS as err:
+            if is_transient_db_error(err):
+                raise
+            # One bad row fails the whole batch: replay row by row so the rest still land
+            # and only the offender is charged an attempt
+            with self._lock:
+                self.stats["failed_batches"] += 1
+            return self.drain_rows(patients, rows)
+        self.ack([row[0] for row in rows])
+        return len(rows)
+
+    def drain_rows(self, patients, rows):
+        drained = 0
+        for row in rows:
+            try:
+                patients.add_queued([row[1:]])
+            except DB_ERRORS as err:
+                if is_transient_db_error(err):
+                    raise
+                self.record_failure(row[0], err)
+                continue
+            self.ack([row[0]])
+            drained += 1
+        return drained
+
+    def run_worker(self, batch_size, poll_interval, max_backoff):
+        failures = 0
+        while True:
+            try:
+                drained = self.drain_once(batch_size)
+                failures = 0
+            except DB_ERRORS:
+                failures += 1
+                time.sleep(min(max_backoff, poll_interval * 2 ** failures))
+                continue
+            if drained < batch_size:
+                self._wakeup.wait(poll_interval)
+                self._wakeup.clear()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pending"] = self.pending()
+        stats["dead"] = self.dead()
+        return stats
+
+@shared
+def get_registration_queue():
+    registration_queue = RegistrationQueue(QUEUE_PATH)
+    get_metrics().register_collector("registration_queue", registration_queue.snapshot)
+    threading.Thread(
+        target=registration_queue.run_worker,
+        args=(QUEUE_BATCH_SIZE, QUEUE_POLL_INTERVAL, QUEUE_MAX_BACKOFF),
+        name="registration-queue-drain",
+        daemon=True
+    ).start()
+    return registration_queue
+
+GENDERS = ["Male", "Female", "Other"]
+IMPORT_BATCH_SIZE = int(os.environ.get("HEALTHCARE_IMPORT_BATCH_SIZE", "1000"))
+
+# Shared by the registration form and the bulk importer so both accept the same rows
+def validate_patient(name, age, gender, locality):
+    if not (name and age and gender and locality):
+        return "Please fill out all fields."
+    if len(name) > 100 or len(locality) > 100:
+        return "Name and locality must be at most 100 characters."
+    if not 0 < age <= 120:
+        return "Age must be between 1 and 120."
+    if gender not in GENDERS:
+        return f"Gender must be one of: {', '.join(GENDERS)}."
+    return None
+
+def clean_patient_record(record):
+    name = str(record.get("name") or "").strip()
+    gender = str(record.get("gender") or "").strip().capitalize()
+    locality = str(record.get("locality") or "").strip()
+    try:
+        age = int(str(record.get("age") or "0").strip())
+    except ValueError:
+        return None, "Age must be a whole number."
+    error = validate_patient(name, age, gender, locality)
+    if error:
+        return None, error
+    return (name, age, gender, locality), None
+
+def read_patient_records(path):
+    # Yields (line number, record, parse error) one row at a time so memory stays flat
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as err:
+                    yield line_no, {"raw": line.rstrip("\n")}, f"Invalid JSON: {err}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, {"raw": record}, "Expected a JSON object."
+                    continue
+                yield line_no, record, None
+        else:
+            reader = csv.DictReader(f)
+            for record in reader:
+                record = {(key or "").strip().lower(): value for key, value in record.items()}
+                yield reader.line_num, record, None
+
+def iter_patient_batches(records, batch_size, on_reject):
+    batch = []
+    for line_no, record, error in records:
+        values = None
+        if error is None:
+            values, error = clean_patient_record(record)
+        if error:
+            on_reject(line_no, record, error)
+            continue
+        batch.append(values)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def bulk_import_patients(path, batch_size=IMPORT_BATCH_SIZE, rejects_path=None, progress=None):
+    stats = {"imported": 0, "duplicates": 0, "rejected": 0, "batches": 0, "seconds": 0.0, "rows_per_second": 0.0}
+    rejects_file = open(rejects_path, "w", encoding="utf-8") if rejects_path else None
+
+    def on_reject(line_no, record, error):
+        stats["rejected"] += 1
+        if rejects_file:
+            rejects_file.write(json.dumps({"line": line_no, "error": error, "record": record}) + "\n")
+
+    patients = get_patients()
+    started = time.monotonic()
+    try:
+        for batch in iter_patient_batches(read_patient_records(path), batch_size, on_reject):
+            created = patients.add_many(batch)
+            stats["imported"] += created
+            stats["duplicates"] += len(batch) - created
+            stats["batches"] += 1
+            if progress:
+                progress(stats)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+        stats["seconds"] = time.monotonic() - started
+        if stats["seconds"] > 0:
+            stats["rows_per_second"] = stats["imported"] / stats["seconds"]
+    return stats
+
+DEDUP_BATCH_SIZE = int(os.environ.get("HEALTHCARE_DEDUP_BATCH_SIZE", "5000"))
+DEDUP_RETRIES = 3
+
+def dedup_batch(conn, after_id, batch_size):
+    # Keys one batch of legacy rows (identity_key IS NULL), in id order. Of each set of
+    # rows that share a key the lowest id, the original registration, is kept; the others
+    # are deleted and a client_token they carried moves to the survivor.
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        cursor.execute("""
+            SELECT id, name, age, gender, locality, client_token FROM patients
+            WHERE identity_key IS NULL AND id > %s ORDER BY id LIMIT %s
+        """, (after_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return None, 0, 0
+
+        survivors = {}
+        doomed = []
+        for row_id, name, age, gender, locality, client_token in rows:
+            key = identity_key(name, age, gender, locality)
+            if key in survivors:
+                doomed.append(row_id)
+                survivors[key][1] = survivors[key][1] or client_token
+            else:
+                survivors[key] = [row_id, client_token]
+
+        keys = list(survivors)
+        cursor.execute(
+            f"SELECT id, identity_key, client_token FROM patients WHERE identity_key IN ({', '.join(['%s'] * len(keys))})",
+            tuple(keys)
+        )
+        for keyed_id, key, client_token in cursor.fetchall():
+            survivor = survivors[key]
+            if keyed_id < survivor[0]:
+                # Keyed by an earlier batch: this batch's row is the duplicate
+                doomed.append(survivor[0])
+                survivor[0] = keyed_id
+            else:
+                # Registered after the upgrade; the legacy row is older and wins
+                doomed.append(keyed_id)
+            survivor[1] = survivor[1] or client_token
+
+        updates = [(key, client_token, row_id) for key, (row_id, client_token) in survivors.items()]
+        # Deletes go first: the doomed rows hold the keys and tokens being moved
+        if doomed:
+            cursor.executemany("DELETE FROM patients WHERE id = %s", [(row_id,) for row_id in doomed])
+        cursor.executemany(
+            "UPDATE patients SET identity_key = %s, client_token = COALESCE(client_token, %s) WHERE id = %s",
+            updates
+        )
+        conn.commit()
+        return rows[-1][0], len(rows), len(doomed)
+    finally:
+        cursor.close()
+
+def dedup_patients(database, batch_size=DEDUP_BATCH_SIZE, progress=None):
+    stats = {"scanned": 0, "merged": 0, "batches": 0, "seconds": 0.0}
+    started = time.monotonic()
+    after_id = 0
+    with database.connection() as conn:
+        while True:
+            for attempt in range(DEDUP_RETRIES):
+                try:
+                    last_id, scanned, merged = dedup_batch(conn, after_id, batch_size)
+                    break
+                except (mysql.connector.errors.IntegrityError, sqlite3.IntegrityError):
+                    # A live registration took one of this batch's keys; redo the batch
+                    conn.rollback()
+                    if attempt == DEDUP_RETRIES - 1:
+                        raise
+            if last_id is None:
+                break
+            after_id = last_id
+            stats["scanned"] += scanned
+            stats["merged"] += merged
+            stats["batches"] += 1
+            if progress:
+                progress(stats)
+    stats["seconds"] = time.monotonic() - started
+    return stats
+
+EXPORT_CHUNK_SIZE = int(os.environ.get("HEALTHCARE_EXPORT_CHUNK_SIZE", "10000"))
+EXPORT_COLUMNS = ["id", "name", "age", "gender", "locality", "registration_date"]
+REPORT_DIMENSIONS = ("locality", "gender")
+
+def export_window(start=None, end=None):
+    # Inclusive calendar days; defaults to yesterday, the daily export
+    start = start or date.today() - timedelta(days=1)
+    end = end or start
+    return datetime(start.year, start.month, start.day), datetime(end.year, end.month, end.day) + timedelta(days=1)
+
+def stream_patients(database, start, end, locality=None, gender=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # Yields lists of up to chunk_size rows. mysql.connector cursors are unbuffered by
+    # default and sqlite3 steps lazily, so only one chunk is ever held in memory.
+    clauses, params = ["registration_date >= %s", "registration_date < %s"], [start, end]
+    if locality:
+        clauses.append("locality = %s")
+        params.append(locality)
+    if gender:
+        clauses.append("gender = %s")
+        params.append(gender)
+    query = (f"SELECT {', '.join(EXPORT_COLUMNS)} FROM patients WHERE {' AND '.join(clauses)} "
+             "ORDER BY registration_date, id")
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        finished = False
+        try:
+            cursor.execute(query, tuple(params))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                get_metrics().inc("export_rows_total", len(rows))
+                yield rows
+            finished = True
+        finally:
+            if not finished:
+                # The rest of an unbuffered result is still on the wire
+                conn.mark_broken()
+            try:
+                cursor.close()
+            except DB_ERRORS:
+                pass
+
+def write_csv_export(chunks, out):
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    written = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        written += len(rows)
+    return written
+
+def write_parquet_export(chunks, out):
+    # One row group per chunk; pyarrow writes sequentially, so out may be a socket
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("name", pa.string()), ("age", pa.int32()), ("gender", pa.string()),
+        ("locality", pa.string()), ("registration_date", pa.timestamp("s")),
+    ])
+    written = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in chunks:
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(zip(*rows), schema)],
+                schema=schema
+            ))
+            written += len(rows)
+    return written
+
+EXPORT_WRITERS = {"csv": write_csv_export, "parquet": write_parquet_export}
+
+def registration_report(database, start, end, dimensions=("locality",)):
+    # Registrations per day per dimension value, aggregated in the database
+    for dimension in dimensions:
+        if dimension not in REPORT_DIMENSIONS:
+            raise ValueError(f"Unknown report dimension {dimension!r}; expected one of {', '.join(REPORT_DIMENSIONS)}")
+    columns = ", ".join(dimensions)
+    query = (f"SELECT DATE(registration_date) AS day, {columns}, COUNT(*) FROM patients "
+             f"WHERE registration_date >= %s AND registration_date < %s "
+             f"GROUP BY DATE(registration_date), {columns} ORDER BY day, {columns}")
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, (start, end))
+            return [(str(row[0]),) + tuple(row[1:]) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+DOCTORS = [
+    {"name": "Dr. AK Verma", "specialty": "Cardiologist", "image": r"C:\Users\itsga\Downloads\04431a327584e47601fe1c895bd46a24.jpg", "description": "Specialist in heart-related issues with 10+ years of experience."},
+    {"name": "Dr. Kabir Singh", "specialty": "Dermatologist", "image": r"C:\Users\itsga\Downloads\d3.jpg", "description": "Expert in skin care and treatments with 8+ years of experience."},
+    {"name": "Dr. Ashi", "specialty": "Surgeon", "image": r"C:\Users\itsga\Downloads\d2.jpg", "description": "Specialist in surgical procedures with 8+ years of experience."}
+]
+SLOT_TIMES = ["09:00", "11:00", "13:00", "15:00", "17:00"]
+BOOKING_DAYS = int(os.environ.get("HEALTHCARE_BOOKING_DAYS", "7"))
+REMINDER_LEADS = {"24h": timedelta(hours=24), "1h": timedelta(hours=1)}
+
+SEED_DOCTORS_SQL = {
+    "mysql": """
+        INSERT INTO doctors (name, specialty, image, description) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE specialty = VALUES(specialty), image = VALUES(image),
+                                description = VALUES(description)
+    """,
+    "sqlite": """
+        INSERT INTO doctors (name, specialty, image, description) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (name) DO UPDATE SET specialty = excluded.specialty, image = excluded.image,
+                                         description = excluded.description
+    """,
+}
+ENSURE_SLOTS_SQL = {
+    "mysql": "INSERT IGNORE INTO slots (doctor_id, starts_at) VALUES (%s, %s)",
+    "sqlite": "INSERT OR IGNORE INTO slots (doctor_id, starts_at) VALUES (%s, %s)",
+}
+
+def seed_doctors(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(SEED_DOCTORS_SQL[conn.dialect], [(d["name"], d["specialty"], d["image"], d["description"]) for d in DOCTORS])
+        cursor.execute("SELECT id, name FROM doctors")
+        return {name: doctor_id for doctor_id, name in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+def ensure_slots(conn, doctor_ids, start_day, days):
+    rows = []
+    for doctor_id in doctor_ids:
+        for offset in range(days):
+            day = start_day + timedelta(days=offset)
+            for slot_time in SLOT_TIMES:
+                hour, minute = map(int, slot_time.split(":"))
+                rows.append((doctor_id, datetime(day.year, day.month, day.day, hour, minute)))
+    cursor = conn.cursor()
+    try:
+        # Existing (doctor, start) pairs are skipped by the unique key
+        cursor.executemany(ENSURE_SLOTS_SQL[conn.dialect], rows)
+    finally:
+        cursor.close()
+
+# Rolls the slot calendar forward once per day per server process
+@shared(maxsize=1)
+def prepare_booking_calendar(day):
+    with get_database().connection() as conn:
+        doctor_ids = seed_doctors(conn)
+        ensure_slots(conn, doctor_ids.values(), day, BOOKING_DAYS)
+    return doctor_ids
+
+def get_doctor_ids():
+    return prepare_booking_calendar(date.today())
+
+@traced("db.find_free_slots")
+def find_free_slots(conn, doctor_id, day):
+    start = datetime(day.year, day.month, day.day)
+    cursor = conn.cursor()
+    try:
+        # Served entirely from idx_slots_free (doctor_id, is_booked, starts_at)
+        cursor.execute("""
+            SELECT id, starts_at FROM slots
+            WHERE doctor_id = %s AND is_booked = 0 AND starts_at >= %s AND starts_at < %s
+            ORDER BY starts_at
+        """, (doctor_id, max(start, datetime.now()), start + timedelta(days=1)))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+@traced("db.book_slot")
+def book_slot(conn, slot_id, patient_name):
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction()
+        # The conditional UPDATE is the reservation: exactly one concurrent booker sees
+        # rowcount 1, everyone else sees 0 and backs off without waiting on a lock queue
+        cursor.execute("UPDATE slots SET is_booked = 1 WHERE id = %s AND is_booked = 0", (slot_id,))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return None
+        cursor.execute("INSERT INTO appointments (slot_id, patient_name) VALUES (%s, %s)",
+                       (slot_id, patient_name))
+        appointment_id = cursor.lastrowid
+        # Reminders commit with the booking, so none is lost if the process dies after it
+        cursor.execute("SELECT starts_at FROM slots WHERE id = %s", (slot_id,))
+        starts_at = cursor.fetchone()[0]
+        now = datetime.now()
+        reminders = [(appointment_id, kind, starts_at - lead) for kind, lead in REMINDER_LEADS.items()
+                     if starts_at - lead > now]
+        if reminders:
+            cursor.executemany("INSERT INTO reminders (appointment_id, kind, due_at) VALUES (%s, %s, %s)",
+                               reminders)
+        conn.commit()
+        return appointment_id
+    finally:
+        cursor.close()
+
+REMINDER_NOTIFIER = os.environ.get("HEALTHCARE_REMINDER_NOTIFIER", "stdout")
+REMINDER_LOOKAHEAD = timedelta(seconds=int(os.environ.get("HEALTHCARE_REMINDER_LOOKAHEAD", "3600")))
+REMINDER_POLL_INTERVAL = float(os.environ.get("HEALTHCARE_REMINDER_POLL_INTERVAL", "30"))
+REMINDER_BATCH_SIZE = int(os.environ.get("HEALTHCARE_REMINDER_BATCH_SIZE", "500"))
+REMINDER_MAX_BACKOFF = 300
+
+def reminder_text(reminder):
+    return (f"Reminder for {reminder['patient_name']}: your appointment with {reminder['doctor']} "
+            f"is at {reminder['starts_at']:%Y-%m-%d %I:%M %p}.")
+
+class StdoutNotifier:
+    def send(self, reminders):
+        for reminder in reminders:
+            print(reminder_text(reminder), flush=True)
+
+class FileNotifier:
+    # One JSON line per reminder, for whatever actually delivers SMS or email to pick up
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, reminders):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for reminder in reminders:
+                f.write(json.dumps({**reminder, "starts_at": reminder["starts_at"].isoformat(" "),
+                                    "text": reminder_text(reminder)}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def create_notifier(spec):
+    if spec == "stdout":
+        return StdoutNotifier()
+    if spec.startswith("file:"):
+        return FileNotifier(spec[len("file:"):])
+    raise ValueError(f"unsupported reminder notifier {spec!r}")
+
+REMINDER_COLUMNS = """
+    SELECT r.id, r.appointment_id, r.kind, r.due_at, a.patient_name, d.name, s.starts_at
+    FROM reminders r
+    JOIN appointments a ON a.id = r.appointment_id
+    JOIN slots s ON s.id = a.slot_id
+    JOIN doctors d ON d.id = s.doctor_id
+"""
+
+class ReminderScheduler:
+    # Pending reminders due within the lookahead window sit in a min-heap keyed by due
+    # time, so scheduling and dispatching each cost O(log n). Every refresh re-reads all
+    # pending rows due before the horizon from the outbox's (sent_at, due_at) index and
+    # skips the ones already queued. There is no id or time watermark to fall behind: MySQL
+    # hands out AUTO_INCREMENT ids before commit, so a booking can become visible after a
+    # higher id already was. A restart rebuilds the heap from the pending rows alone.
+    def __init__(self, database, notifier, lookahead=REMINDER_LOOKAHEAD, batch_size=REMINDER_BATCH_SIZE,
+                 poll_interval=REMINDER_POLL_INTERVAL):
+        self.database = database
+        self.notifier = notifier
+        self.lookahead = lookahead
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._heap = []
+        self._queued = set()
+        self._failures = 0
+        self.stats = {"loaded": 0, "sent": 0, "expired": 0, "failed_batches": 0}
+
+    def _push(self, due_at, reminder):
+        self._queued.add(reminder["reminder_id"])
+        heapq.heappush(self._heap, (due_at, reminder["reminder_id"], reminder))
+        self.stats["loaded"] += 1
+
+    def refresh(self, now):
+        # Also picks up anything that fell due while the scheduler was down
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(REMINDER_COLUMNS + "WHERE r.sent_at IS NULL AND r.due_at < %s",
+                               (now + self.lookahead,))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        added = 0
+        for reminder_id, appointment_id, kind, due_at, patient_name, doctor, starts_at in rows:
+            if reminder_id in self._queued:
+                continue
+            self._push(due_at, {"reminder_id": reminder_id, "appointment_id": appointment_id, "kind": kind,
+                                "patient_name": patient_name, "doctor": doctor, "starts_at": starts_at})
+            added += 1
+        return added
+
+    def _mark(self, reminder_ids, outcome, now):
+        if not reminder_ids:
+            return
+        with self.database.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany("UPDATE reminders SET sent_at = %s, outcome = %s, attempts = attempts + 1 "
+                                   "WHERE id = %s", [(now, outcome, reminder_id) for reminder_id in reminder_ids])
+                conn.commit()
+            finally:
+                cursor.close()
+
+    def dispatch_due(self, now):
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._heap))
+        if not batch:
+            return 0
+        # A reminder still queued when its appointment has begun is recorded, not sent
+        expired = [reminder for _, _, reminder in batch if reminder["starts_at"] <= now]
+        due = [reminder for _, _, reminder in batch if reminder["starts_at"] > now]
+        try:
+            if due:
+                self.notifier.send(due)
+        except Exception:
+            self._failures += 1
+            self.stats["failed_batches"] += 1
+            retry_at = now + timedelta(seconds=min(REMINDER_MAX_BACKOFF, 2 ** self._failures))
+            for _, reminder_id, reminder in batch:
+                heapq.heappush(self._heap, (retry_at, reminder_id, reminder))
+            raise
+        self._failures = 0
+        for _, reminder_id, _ in batch:
+            self._queued.discard(reminder_id)
+        # Delivery is at least once: if the batch cannot be marked (or the process dies
+        # first), the heap is rebuilt from the outbox and the batch is sent again
+        try:
+            self._mark([reminder["reminder_id"] for reminder in due], "sent", now)
+            self._mark([reminder["reminder_id"] for reminder in expired], "expired", now)
+        except DB_ERRORS:
+            self.reset()
+            raise
+        self.stats["sent"] += len(due)
+        self.stats["expired"] += len(expired)
+        return len(batch)
+
+    def reset(self):
+        self._heap.clear()
+        self._queued.clear()
+
+    def run_once(self, now=None):
+        now = now or datetime.now()
+        self.refresh(now)
+        dispatched = 0
+        while True:
+            count = self.dispatch_due(now)
+            dispatched += count
+            if count < self.batch_size:
+                return dispatched
+
+    def run(self):
+        next_refresh = datetime.now()
+        while True:
+            now = datetime.now()
+            try:
+                if now >= next_refresh:
+                    self.refresh(now)
+                    next_refresh = now + timedelta(seconds=self.poll_interval)
+                while self.dispatch_due(now) == self.batch_size:
+                    pass
+            except DB_ERRORS as err:
+                print(f"Reminder scheduler database error: {err}", file=sys.stderr)
+                next_refresh = now + timedelta(seconds=self.poll_interval)
+            except Exception as err:
+                print(f"Reminder delivery failed, retrying: {err}", file=sys.stderr)
+            wake_at = next_refresh if not self._heap else min(next_refresh, self._heap[0][0])
+            time.sleep(max(0.05, (wake_at - datetime.now()).total_seconds()))
+
+    def snapshot(self):
+        return {**self.stats, "queued": len(self._heap)}
+
+DIRECTORY_PAGE_SIZE = int(os.environ.get("HEALTHCARE_DIRECTORY_PAGE_SIZE", "10"))
+
+class Directory:
+    # Entries are numbered in name order; each facet index maps a value to the ascending
+    # list of entry numbers carrying it, so filtered results come out already sorted.
+    def __init__(self, entries, facets):
+        self.entries = tuple(sorted(entries, key=lambda entry: entry["name"].lower()))
+        self.facets = facets
+        self._indexes = {}
+        for facet, key in facets.items():
+            index = {}
+            for position, entry in enumerate(self.entries):
+                values = key(entry)
+                if isinstance(values, (list, tuple, set, frozenset)):
+                    for value in set(values):
+                        index.setdefault(value, []).append(position)
+                else:
+                    index.setdefault(values, []).append(position)
+            self._indexes[facet] = index
+        self._index_sets = {
+            facet: {value: frozenset(positions) for value, positions in index.items()}
+            for facet, index in self._indexes.items()
+        }
+
+    def values(self, facet):
+        return sorted(self._indexes[facet], key=str)
+
+    def match(self, **filters):
+        # Positions of matching entries, in name order
+        filters = {facet: value for facet, value in filters.items() if value is not None}
+        if not filters:
+            return range(len(self.entries))
+        postings = sorted((self._indexes[facet].get(value, []) for facet, value in filters.items()), key=len)
+        others = [self._index_sets[facet].get(value, frozenset()) for facet, value in filters.items()]
+        return [position for position in postings[0] if all(position in other for other in others)]
+
+    def page(self, matches, page=1, page_size=DIRECTORY_PAGE_SIZE):
+        start = (page - 1) * page_size
+        return [self.entries[position] for position in matches[start:start + page_size]]
+
+    def query(self, page=1, page_size=DIRECTORY_PAGE_SIZE, **filters):
+        matches = self.match(**filters)
+        return self.page(matches, page, page_size), len(matches)
+
+DOCTOR_FACETS = {"specialty": lambda doctor: doctor["specialty"]}
+HOSPITAL_FACETS = {
+    "specialty": lambda hospital: hospital["specialties"],
+    "locality": lambda hospital: hospital["address"],
+    "available": lambda hospital: bool(hospital["available"]),
+}
+
+@shared
+def get_doctor_directory():
+    return Directory(DOCTORS, DOCTOR_FACETS)
+
+HOSPITALS_PATH = os.environ.get("HEALTHCARE_HOSPITALS_PATH", os.path.join(APP_DIR, "hospitals.json"))
+HOSPITALS_REFRESH_INTERVAL = float(os.environ.get("HEALTHCARE_HOSPITALS_REFRESH_INTERVAL", "30"))
+
+LOCALITIES_PATH = os.environ.get("HEALTHCARE_LOCALITIES_PATH", os.path.join(APP_DIR, "localities.json"))
+EARTH_RADIUS_KM = 6371.0
+COORDINATES_PATTERN = re.compile(r"\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*")
+
+def unit_vector(lat, lon):
+    # Points on the unit sphere: straight-line (chord) distance orders places exactly as
+    # great-circle distance does, so the tree needs no map projection
+    phi, lam = math.radians(lat), math.radians(lon)
+    return (math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi))
+
+def chord_to_km(chord_sq):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord_sq) / 2))
+
+class KDTree:
+    # Balanced 3-d tree stored as parallel node lists, split on the axis of widest spread.
+    # A k-nearest query descends towards the point and only crosses a split plane while
+    # that plane is nearer than the k-th best match so far.
+    def __init__(self, points, items):
+        self.items = list(items)
+        self._points, self._items, self._axes, self._left, self._right = [], [], [], [], []
+        self._root = self._build(list(zip(points, range(len(self.items)))))
+
+    def _build(self, entries):
+        if not entries:
+            return -1
+        spreads = [max(point[axis] for point, _ in entries) - min(point[axis] for point, _ in entries)
+                   for axis in range(3)]
+        axis = spreads.index(max(spreads))
+        entries.sort(key=lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        node = len(self._points)
+        self._points.append(entries[middle][0])
+        self._items.append(entries[middle][1])
+        self._axes.append(axis)
+        self._left.append(-1)
+        self._right.append(-1)
+        self._left[node] = self._build(entries[:middle])
+        self._right[node] = self._build(entries[middle + 1:])
+        return node
+
+    def __len__(self):
+        return len(self.items)
+
+    def nearest(self, point, k, accept=None):
+        best = []
+        px, py, pz = point
+
+        def visit(node):
+            x, y, z = self._points[node]
+            dist_sq = (px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2
+            if len(best) < k or dist_sq < -best[0][0]:
+                item = self._items[node]
+                if accept is None or accept(self.items[item]):
+                    if len(best) < k:
+                        heapq.heappush(best, (-dist_sq, item))
+                    else:
+                        heapq.heapreplace(best, (-dist_sq, item))
+            delta = point[self._axes[node]] - self._points[node][self._axes[node]]
+            near, far = (self._left[node], self._right[node]) if delta < 0 else (self._right[node], self._left[node])
+            if near >= 0:
+                visit(near)
+            if far >= 0 and (len(best) < k or delta * delta < -best[0][0]):
+                visit(far)
+
+        if self._root >= 0 and k > 0:
+            visit(self._root)
+        return [(self.items[item], chord_to_km(-neg_dist_sq)) for neg_dist_sq, item in sorted(best, reverse=True)]
+
+def linear_nearest(points, items, point, k, accept=None):
+    px, py, pz = point
+    scored = (((px - x) ** 2 + (py - y) ** 2 + (pz - z) ** 2, index)
+              for index, (x, y, z) in enumerate(points) if accept is None or accept(items[index]))
+    return [(items[index], chord_to_km(dist_sq)) for dist_sq, index in heapq.nsmallest(k, scored)]
+
+def build_hospital_tree(hospitals):
+    located = [hospital for hospital in hospitals if hospital.get("lat") is not None and hospital.get("lon") is not None]
+    return KDTree([unit_vector(hospital["lat"], hospital["lon"]) for hospital in located], located)
+
+def hospital_filter(specialty=None, locality=None, min_beds=1):
+    def accept(hospital):
+        return (hospital["available"] and hospital["beds"] >= min_beds
+                and (specialty is None or specialty in hospital["specialties"])
+                and (locality is None or hospital["address"] == locality))
+    return accept
+
+@shared
+def load_localities(path, mtime):
+    with open(path, encoding="utf-8") as f:
+        return {normalize_name(place["name"]): (place["lat"], place["lon"]) for place in json.load(f)}
+
+def resolve_location(text):
+    # A known locality name, or "lat, lon" typed directly
+    match = COORDINATES_PATTERN.fullmatch(text)
+    if match:
+        lat, lon = float(match.group(1)), float(match.group(2))
+        return (lat, lon) if -90 <= lat <= 90 and -180 <= lon <= 180 else None
+    try:
+        localities = load_localities(LOCALITIES_PATH, os.stat(LOCALITIES_PATH).st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+    return localities.get(normalize_name(text))
+
+def clean_hospital_record(record):
+    # The file is edited by hand; one bad record rejects the whole reload, so the
+    # snapshot never serves a half-valid list
+    if not isinstance(record, dict):
+        raise ValueError(f"Hospital record must be an object, got {type(record).__name__}")
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError(f"Hospital record without a name: {record!r}")
+    if not isinstance(record.get("address"), str):
+        raise ValueError(f"{name}: address must be a string")
+    beds = record.get("beds")
+    if isinstance(beds, bool) or not isinstance(beds, int) or beds < 0:
+        raise ValueError(f"{name}: beds must be a non-negative whole number")
+    if not isinstance(record.get("available"), bool):
+        raise ValueError(f"{name}: available must be true or false")
+    specialties = record.get("specialties", [])
+    if not isinstance(specialties, list) or not all(isinstance(specialty, str) for specialty in specialties):
+        raise ValueError(f"{name}: specialties must be a list of strings")
+    lat, lon = record.get("lat"), record.get("lon")
+    if (lat is None) != (lon is None):
+        raise ValueError(f"{name}: lat and lon must be given together")
+    if lat is not None:
+        if any(isinstance(value, bool) or not isinstance(value, (int, float)) for value in (lat, lon)):
+            raise ValueError(f"{name}: lat and lon must be numbers")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"{name}: lat/lon out of range")
+    return dict(record, specialties=tuple(specialties))
+
+HospitalState = namedtuple("HospitalState", "directory tree version loaded_at")
+
+class HospitalSnapshot:
+    # Readers take self.state without locking: the refresher builds a complete new
+    # HospitalState (directory, tree, version) and swaps it in with one assignment. A
+    # page that needs several parts reads self.state once, so they always match.
+    def __init__(self, path, refresh_interval):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.state = HospitalState(Directory((), HOSPITAL_FACETS), KDTree((), ()), None, None)
+        self.stats = {"checks": 0, "reloads": 0, "errors": 0}
+        self.refresh()
+
+    def refresh(self):
+        self.stats["checks"] += 1
+        version = os.stat(self.path).st_mtime_ns
+        if version == self.state.version:
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            records = json.load(f)
+        if not isinstance(records, list):
+            raise ValueError(f"{self.path}: expected a list of hospitals")
+        directory = Directory([clean_hospital_record(record) for record in records], HOSPITAL_FACETS)
+        self.state = HospitalState(directory, build_hospital_tree(directory.entries), version, datetime.now())
+        self.stats["reloads"] += 1
+        return True
+
+    def run_refresher(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh()
+            except (OSError, ValueError, KeyError, TypeError) as err:
+                # Keep serving the last good snapshot until the source is fixed
+                self.stats["errors"] += 1
+                print(f"Hospital snapshot reload failed, keeping the previous one: {err!r}", file=sys.stderr)
+
+    @property
+    def hospitals(self):
+        return self.state.directory.entries
+
+@shared
+def get_hospital_snapshot():
+    snapshot = HospitalSnapshot(HOSPITALS_PATH, HOSPITALS_REFRESH_INTERVAL)
+    get_metrics().register_collector("hospital_snapshot", lambda: snapshot.stats)
+    threading.Thread(target=snapshot.run_refresher, name="hospital-snapshot-refresh", daemon=True).start()
+    return snapshot
+
+STATIC_DIR = os.path.join(APP_DIR, "static")
+ASSET_CACHE_MAX_BYTES = int(os.environ.get("HEALTHCARE_ASSET_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Loopback by default: /metrics and the token-gated routes are for the local scraper and
+# operators; set HEALTHCARE_HTTP_HOST to expose them
+HTTP_HOST = os.environ.get("HEALTHCARE_HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("HEALTHCARE_HTTP_PORT", "0"))
+# Published files are content-addressed, so they are safe to cache for a year
+STATIC_MAX_AGE = 365 * 24 * 3600
+# Where browsers fetch published images from. "app/static" is Streamlit's own static
+# route (server.enableStaticServing), reachable wherever the app is. To use the built-in
+# HTTP server's long Cache-Control instead, point this at the URL browsers reach it on
+# (e.g. "https://assets.example.org/static"). An empty value falls back to data URIs.
+ASSET_BASE_URL = os.environ.get("HEALTHCARE_ASSET_BASE_URL", "app/static").rstrip("/")
+
+class AssetCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_path = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, path, loader):
+        info = os.stat(path)
+        path = os.path.abspath(path)
+        key = (path, info.st_mtime_ns, info.st_size)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+
+        value = loader(path)
+        with self._lock:
+            self.stats["misses"] += 1
+            stale_key = self._keys_by_path.get(path)
+            if stale_key is not None and stale_key != key:
+                self._evict(stale_key)
+            if key not in self._entries:
+                self._entries[key] = value
+                self._keys_by_path[path] = key
+                self._bytes += len(value)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._evict(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+        return value
+
+    def _evict(self, key):
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self._bytes -= len(value)
+            if self._keys_by_path.get(key[0]) == key:
+                del self._keys_by_path[key[0]]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+
+@shared
+def get_asset_cache():
+    cache = AssetCache(ASSET_CACHE_MAX_BYTES)
+    get_metrics().register_collector("asset_cache", cache.snapshot)
+    return cache
+
+def get_base64_of_image(image_path):
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode()
+
+def static_stem(source_name):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return "".join(c if c.isalnum() or c in "-_" else "-" for c in stem).strip("-") or "asset"
+
+def write_static_file(relative_path, data):
+    target = os.path.join(STATIC_DIR, relative_path)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+    return relative_path
+
+def publish_static_file(data, source_name, subdir="media"):
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    ext = os.path.splitext(source_name)[1].lower()
+    return write_static_file(f"{subdir}/{static_stem(source_name)}-{digest}{ext}", data)
+
+def load_asset_url(path):
+    if not ASSET_BASE_URL:
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return f"data:{mime_type};base64,{get_base64_of_image(path)}"
+    with open(path, "rb") as f:
+        data = f.read()
+    return f"{ASSET_BASE_URL}/{publish_static_file(data, path)}"
+
+def get_asset_url(image_path):
+    try:
+        return get_asset_cache().get(image_path, load_asset_url)
+    except OSError:
+        return None
+
+# Doctor and hospital photos are shown at THUMBNAIL_WIDTH css pixels; a derivative is
+# kept for each device pixel ratio instead of shipping the original
+THUMBNAIL_WIDTH = 150
+THUMBNAIL_DENSITIES = (1, 2)
+THUMBNAIL_FORMAT = os.environ.get("HEALTHCARE_THUMBNAIL_FORMAT", "webp")
+THUMBNAIL_QUALITY = int(os.environ.get("HEALTHCARE_THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_FORMATS = {"webp": ("WEBP", "webp", "image/webp"), "jpeg": ("JPEG", "jpg", "image/jpeg")}
+
+def thumbnail_paths(source_hash, source_name):
+    # Named after the source's content hash: an edited photo gets new names (and URLs),
+    # an unchanged one is never decoded again
+    ext = THUMBNAIL_FORMATS[THUMBNAIL_FORMAT][1]
+    stem = static_stem(source_name)
+    return [(density, f"thumbs/{stem}-{source_hash}-{THUMBNAIL_WIDTH * density}.{ext}")
+            for density in THUMBNAIL_DENSITIES]
+
+def make_thumbnail(image, width):
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, THUMBNAIL_FORMATS[THUMBNAIL_FORMAT][0], quality=THUMBNAIL_QUALITY)
+    return out.getvalue()
+
+def load_thumbnail_srcset(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    source_hash = hashlib.sha256(data).hexdigest()[:16]
+    image = None
+    candidates = []
+    for density, relative_path in thumbnail_paths(source_hash, path):
+        if ASSET_BASE_URL and os.path.exists(os.path.join(STATIC_DIR, relative_path)):
+            candidates.append(f"{ASSET_BASE_URL}/{relative_path} {density}x")
+            continue
+        if image is None:
+            image = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+        thumbnail = make_thumbnail(image, THUMBNAIL_WIDTH * density)
+        get_metrics().inc("thumbnails_generated_total")
+        if ASSET_BASE_URL:
+            candidates.append(f"{ASSET_BASE_URL}/{write_static_file(relative_path, thumbnail)} {density}x")
+        else:
+            mime_type = THUMBNAIL_FORMATS[THUMBNAIL_FORMAT][2]
+            candidates.append(f"data:{mime_type};base64,{base64.b64encode(thumbnail).decode()} {density}x")
+    return ", ".join(candidates)
+
+@shared
+def get_thumbnail_cache():
+    cache = AssetCache(ASSET_CACHE_MAX_BYTES)
+    get_metrics().register_collector("thumbnail_cache", cache.snapshot)
+    return cache
+
+def get_thumbnail_srcset(image_path):
+    try:
+        return get_thumbnail_cache().get(image_path, load_thumbnail_srcset)
+    except (OSError, Image.UnidentifiedImageError):
+        return None
+
+# Small side HTTP server for things Streamlit's own server cannot do, such as long-lived
+# cache headers. Routes map a path prefix to handler(request, remainder).
+HTTP_ROUTES = {}
+
+class HealthcareHTTPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        for prefix in sorted(HTTP_ROUTES, key=len, reverse=True):
+            if path.startswith(prefix):
+                return HTTP_ROUTES[prefix](self, path[len(prefix):])
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_static(request, relative_path):
+    root = os.path.realpath(STATIC_DIR)
+    file_path = os.path.realpath(os.path.join(root, relative_path))
+    if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+        return request.send_error(404)
+
+    info = os.stat(file_path)
+    etag = f'"{info.st_mtime_ns:x}-{info.st_size:x}"'
+    if request.headers.get("If-None-Match") == etag:
+        request.send_response(304)
+        request.send_header("ETag", etag)
+        request.end_headers()
+        return
+
+    request.send_response(200)
+    request.send_header("Content-Type", mimetypes.guess_type(file_path)[0] or "application/octet-stream")
+    request.send_header("Content-Length", str(info.st_size))
+    request.send_header("ETag", etag)
+    request.send_header("Cache-Control", f"public, max-age={STATIC_MAX_AGE}, immutable")
+    request.send_header("Access-Control-Allow-Origin", "*")
+    request.end_headers()
+    with open(file_path, "rb") as f:
+        shutil.copyfileobj(f, request.wfile)
+
+def send_text(request, body, content_type):
+    payload = body.encode("utf-8")
+    request.send_response(200)
+    request.send_header("Content-Type", content_type)
+    request.send_header("Content-Length", str(len(payload)))
+    request.send_header("Cache-Control", "no-store")
+    request.end_headers()
+    request.wfile.write(payload)
+
+def serve_metrics(request, remainder):
+    if remainder == ".json":
+        return send_text(request, json.dumps(get_metrics().snapshot()), "application/json")
+    if remainder:
+        return request.send_error(404)
+    send_text(request, get_metrics().prometheus(), "text/plain; version=0.0.4")
+
+EXPORT_TOKEN = os.environ.get("HEALTHCARE_EXPORT_TOKEN", "")
+
+def authorized_for_export(request):
+    # Patient exports are off unless a token is configured, and then need it as a bearer token
+    supplied = request.headers.get("Authorization", "")
+    if EXPORT_TOKEN and hmac.compare_digest(supplied.encode(), f"Bearer {EXPORT_TOKEN}".encode()):
+        return True
+    request.send_error(403 if EXPORT_TOKEN else 404)
+    return False
+
+def export_query_window(request):
+    params = parse_qs(urlsplit(request.path).query)
+    first = lambda name: params.get(name, [None])[0]
+    start = date.fromisoformat(first("from")) if first("from") else None
+    end = date.fromisoformat(first("to")) if first("to") else None
+    return export_window(start, end), first
+
+def serve_export(request, remainder):
+    if not authorized_for_export(request):
+        return
+    export_format = remainder.removeprefix("patients.")
+    if export_format not in EXPORT_WRITERS:
+        return request.send_error(404)
+    try:
+        (start, end), first = export_query_window(request)
+    except ValueError:
+        return request.send_error(400, "from/to must be YYYY-MM-DD")
+
+    # Length is unknown up front: stream until the connection closes (HTTP/1.0)
+    request.send_response(200)
+    request.send_header("Content-Type", "text/csv; charset=utf-8" if export_format == "csv"
+                        else "application/vnd.apache.parquet")
+    request.send_header("Content-Disposition", f'attachment; filename="patients-{start:%Y%m%d}.{export_format}"')
+    request.send_header("Cache-Control", "no-store")
+    request.end_headers()
+    chunks = stream_patients(get_database(), start, end, first("locality"), first("gender"))
+    try:
+        if export_format == "csv":
+            out = io.TextIOWrapper(request.wfile, encoding="utf-8", newline="", write_through=True)
+            write_csv_export(chunks, out)
+            out.detach()
+        else:
+            write_parquet_export(chunks, request.wfile)
+    finally:
+        chunks.close()
+
+def serve_report(request, remainder):
+    if not authorized_for_export(request):
+        return
+    if remainder not in ("registrations.csv", "registrations.json"):
+        return request.send_error(404)
+    try:
+        (start, end), first = export_query_window(request)
+        dimensions = tuple((first("by") or "locality").split(","))
+        rows = registration_report(get_database(), start, end, dimensions)
+    except ValueError as err:
+        return request.send_error(400, str(err))
+    header = ["day", *dimensions, "registrations"]
+    if remainder.endswith(".json"):
+        return send_text(request, json.dumps([dict(zip(header, row)) for row in rows]), "application/json")
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(header)
+    writer.writerows(rows)
+    send_text(request, out.getvalue(), "text/csv; charset=utf-8")
+
+HTTP_ROUTES["/static/"] = serve_static
+HTTP_ROUTES["/metrics"] = serve_metrics
+HTTP_ROUTES["/export/"] = serve_export
+HTTP_ROUTES["/reports/"] = serve_report
+
+@shared
+def start_http_server():
+    if not HTTP_PORT:
+        return None
+    server = ThreadingHTTPServer((HTTP_HOST, HTTP_PORT), HealthcareHTTPHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="healthcare-http", daemon=True).start()
+    return server
+
+ASSETS_DIR = os.path.join(APP_DIR, "assets")
+STATIC_ASSETS = {"css": "healthcare.css", "js": "chatbot.js"}
+
+def minify_css(source):
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r"\s*([{}:;,>])\s*", r"\1", source)
+    return source.replace(";}", "}").strip()
+
+def minify_js(source):
+    # Conservative: drop whole-line comments and indentation, keep statements intact
+    lines = (line.strip() for line in source.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+# Built once per server process: minified, fingerprinted and published to static/
+@shared
+def build_static_assets():
+    minifiers = {"css": minify_css, "js": minify_js}
+    built = {}
+    for kind, filename in STATIC_ASSETS.items():
+        with open(os.path.join(ASSETS_DIR, filename), encoding="utf-8") as f:
+            minified = minifiers[kind](f.read())
+        stem, ext = os.path.splitext(filename)
+        relative_url = publish_static_file(minified.encode("utf-8"), f"{stem}.min{ext}", kind)
+        built[kind] = {"url": f"{ASSET_BASE_URL}/{relative_url}", "source": minified}
+    return built
+
+# Chatbot functionality
+CHAT_HISTORY_LIMIT = int(os.environ.get("HEALTHCARE_CHAT_HISTORY_LIMIT", "50"))
+CHAT_RENDER_WINDOW = int(os.environ.get("HEALTHCARE_CHAT_RENDER_WINDOW", "20"))
+# Optional SQLite file that receives messages pushed out of the in-memory history
+CHAT_ARCHIVE_PATH = os.environ.get("HEALTHCARE_CHAT_ARCHIVE_PATH", "")
+
+class ChatMessage:
+    __slots__ = ("text", "is_user", "sent_at", "html")
+
+    def __init__(self, text, is_user, sent_at=None):
+        self.text = text
+        self.is_user = is_user
+        self.sent_at = time.time() if sent_at is None else sent_at
+        # Rendered once here, so a rerun only joins the cached fragments
+        css_class = "user-message" if is_user else "bot-message"
+        body = html.escape(text).replace("\n", "<br>")
+        self.html = f'<div class="message-container"><div class="{css_class}">{body}</div></div>'
+
+class ChatArchive:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_archive (
+                session_id TEXT NOT NULL,
+                sent_at REAL NOT NULL,
+                is_user INTEGER NOT NULL,
+                text TEXT NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()
+
+    def save(self, session_id, message):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chat_archive (session_id, sent_at, is_user, text) VALUES (?, ?, ?, ?)",
+                (session_id, message.sent_at, int(message.is_user), message.text)
+            )
+
+@shared
+def get_chat_archive():
+    return ChatArchive(CHAT_ARCHIVE_PATH) if CHAT_ARCHIVE_PATH else None
+
+class ChatHistory:
+    # Ring buffer of the most recent messages for one session
+    def __init__(self, session_id, limit=CHAT_HISTORY_LIMIT, archive=None):
+        self.session_id = session_id
+        self.archive = archive
+        self._messages = deque(maxlen=limit)
+
+    def append(self, text, is_user):
+        if self.archive is not None and len(self._messages) == self._messages.maxlen:
+            self.archive.save(self.session_id, self._messages[0])
+        self._messages.append(ChatMessage(text, is_user))
+
+    def recent(self, count):
+        start = max(0, len(self._messages) - count)
+        return list(itertools.islice(self._messages, start, None))
+
+    def render_html(self, window=CHAT_RENDER_WINDOW):
+        return "".join(message.html for message in self.recent(window))
+
+    def __len__(self):
+        return len(self._messages)
+
+    def to_state(self):
+        return [self.session_id, [[m.text, m.is_user, m.sent_at] for m in self._messages]]
+
+    @classmethod
+    def from_state(cls, state, archive=None):
+        session_id, messages = state
+        history = cls(session_id, archive=archive)
+        history._messages.extend(ChatMessage(text, is_user, sent_at) for text, is_user, sent_at in messages)
+        return history
+
+# Session state that outlives one server process: "sqlite:<path>" shares a file between
+# processes on one host, "redis://host:port/db" shares a Redis (or `serve-sessions`)
+# between replicas. Empty keeps state in the process, as before.
+SESSION_STORE = os.environ.get("HEALTHCARE_SESSION_STORE", "")
+SESSION_TTL = int(os.environ.get("HEALTHCARE_SESSION_TTL", str(24 * 3600)))
+SESSION_COMPRESS_THRESHOLD = 1024
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{16,64}")
+# Only plain navigation and booking state travels; widget values and per-connection
+# bookkeeping such as static_assets_version stay local to the process
+PERSISTED_SESSION_KEYS = (
+    "page", "selected_doctor", "selected_date", "selected_time", "appointment_id", "selected_hospital",
+    "patient_name", "patient_locality", "registration_token", "doctor_specialty_filter", "search_criteria",
+    "search_cursors", "chat_open", "chat_history",
+)
+
+def pack_session_value(value):
+    if isinstance(value, ChatHistory):
+        return {"$chat": value.to_state()}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if isinstance(value, tuple):
+        return {"$tuple": [pack_session_value(item) for item in value]}
+    if isinstance(value, list):
+        return [pack_session_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: pack_session_value(item) for key, item in value.items()}
+    return value
+
+def unpack_session_object(obj):
+    if len(obj) == 1:
+        tag, body = next(iter(obj.items()))
+        if tag == "$chat":
+            return ChatHistory.from_state(body, archive=get_chat_archive())
+        if tag == "$datetime":
+            return datetime.fromisoformat(body)
+        if tag == "$date":
+            return date.fromisoformat(body)
+        if tag == "$tuple":
+            return tuple(body)
+    return obj
+
+def encode_session_value(value):
+    data = json.dumps(pack_session_value(value), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    # JSON never starts with "z", so the marker cannot be confused with a plain value
+    if len(data) > SESSION_COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(data)
+    return data
+
+def decode_session_value(data):
+    if data[:1] == b"z":
+        data = zlib.decompress(data[1:])
+    return json.loads(data, object_hook=unpack_session_object)
+
+def session_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+class SQLiteSessionStore:
+    def __init__(self, path, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                     timeout=SQLITE_BUSY_TIMEOUT)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_state (
+                session_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (session_id, key)
+            ) WITHOUT ROWID
+        """)
+        self._lock = threading.Lock()
+        self.purge()
+
+    def load(self, session_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM session_state WHERE session_id = ? AND expires_at > ?",
+                (session_id, time.time())
+            ).fetchall()
+        return dict(rows)
+
+    def save(self, session_id, changed, removed):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO session_state (session_id, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (session_id, key) DO UPDATE SET value = excluded.value",
+                    [(session_id, key, value, expires_at) for key, value in changed.items()]
+                )
+                self._conn.executemany("DELETE FROM session_state WHERE session_id = ? AND key = ?",
+                                       [(session_id, key) for key in removed])
+                self._conn.execute("UPDATE session_state SET expires_at = ? WHERE session_id = ?",
+                                   (expires_at, session_id))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def purge(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM session_state WHERE expires_at <= ?", (time.time(),))
+
+class RespError(Exception):
+    pass
+
+def encode_resp_command(args):
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+def read_resp_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed by the session store")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body
+    if kind == b"-":
+        return RespError(body.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("connection closed by the session store")
+        return data[:-2]
+    if kind == b"*":
+        length = int(body)
+        return None if length < 0 else [read_resp_reply(reader) for _ in range(length)]
+    raise RespError(f"unexpected reply {line!r}")
+
+class RespClient:
+    # Minimal Redis protocol client: one socket per thread, commands sent as pipelines
+    def __init__(self, url, timeout=5.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.password = parts.password
+        self.db = int(parts.path.strip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        setup = ([("AUTH", self.password)] if self.password else []) + ([("SELECT", self.db)] if self.db else [])
+        if setup:
+            self._send(setup)
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _send(self, commands):
+        self._local.sock.sendall(b"".join(encode_resp_command(command) for command in commands))
+        replies = [read_resp_reply(self._local.reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def pipeline(self, commands):
+        # Every command this app sends is idempotent, so a dropped connection is retried once
+        for attempt in range(2):
+            try:
+                if getattr(self._local, "sock", None) is None:
+                    self._connect()
+                return self._send(commands)
+            except (OSError, ConnectionError):
+                self._close()
+                if attempt:
+                    raise
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+class RespSessionStore:
+    # One hash per session, so a save touches only the fields that changed
+    def __init__(self, url, ttl=SESSION_TTL, prefix="healthcare:session:"):
+        self.client = RespClient(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, session_id):
+        reply = self.client.execute("HGETALL", self.prefix + session_id) or []
+        return {reply[i].decode("utf-8"): reply[i + 1] for i in range(0, len(reply), 2)}
+
+    def save(self, session_id, changed, removed):
+        key = self.prefix + session_id
+        commands = []
+        if changed:
+            commands.append(["HSET", key, *itertools.chain.from_iterable(changed.items())])
+        if removed:
+            commands.append(["HDEL", key, *removed])
+        commands.append(["EXPIRE", key, self.ttl])
+        self.client.pipeline(commands)
+
+    def purge(self):
+        pass
+
+def encode_resp_reply(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, RespError):
+        return f"-ERR {value}\r\n".encode("utf-8")
+    return b"*%d\r\n" % len(value) + b"".join(encode_resp_reply(item) for item in value)
+
+class RespStandInHandler(socketserver.StreamRequestHandler):
+    # Pipelined replies are written one by one; Nagle would hold each behind an ACK
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        while True:
+            try:
+                command = read_resp_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError, RespError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            self.wfile.write(self.server.dispatch(command))
+
+class RespStandInServer(socketserver.ThreadingTCPServer):
+    # Just enough of Redis for RespSessionStore, so replicas can share sessions in
+    # development and benchmarks without a Redis install
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, RespStandInHandler)
+        self._hashes = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._hashes.pop(key, None)
+            self._expires.pop(key, None)
+        return self._hashes.get(key)
+
+    def dispatch(self, command):
+        name, args = command[0].upper(), command[1:]
+        with self._lock:
+            if name == b"PING":
+                return b"+PONG\r\n"
+            if name in (b"AUTH", b"SELECT"):
+                return b"+OK\r\n"
+            if name == b"HSET" and len(args) >= 3 and len(args) % 2 == 1:
+                fields = self._live(args[0])
+                if fields is None:
+                    fields = self._hashes[args[0]] = {}
+                added = 0
+                for field, value in zip(args[1::2], args[2::2]):
+                    added += field not in fields
+                    fields[field] = value
+                return encode_resp_reply(added)
+            if name == b"HGETALL" and len(args) == 1:
+                fields = self._live(args[0]) or {}
+                return encode_resp_reply(list(itertools.chain.from_iterable(fields.items())))
+            if name == b"HDEL" and len(args) >= 2:
+                fields = self._live(args[0]) or {}
+                removed = sum(fields.pop(field, None) is not None for field in args[1:])
+                if not fields:
+                    self._hashes.pop(args[0], None)
+                    self._expires.pop(args[0], None)
+                return encode_resp_reply(removed)
+            if name == b"EXPIRE" and len(args) == 2:
+                if self._live(args[0]) is None:
+                    return encode_resp_reply(0)
+                self._expires[args[0]] = time.time() + int(args[1])
+                return encode_resp_reply(1)
+            if name == b"DEL" and args:
+                removed = 0
+                for key in args:
+                    removed += self._live(key) is not None
+                    self._hashes.pop(key, None)
+                    self._expires.pop(key, None)
+                return encode_resp_reply(removed)
+        return encode_resp_reply(RespError(f"unsupported command {name.decode('utf-8', 'replace')}"))
+
+def create_session_store(url, ttl=SESSION_TTL):
+    if url.startswith("sqlite:"):
+        return SQLiteSessionStore(url[len("sqlite:"):], ttl)
+    if url.startswith("redis://"):
+        return RespSessionStore(url, ttl)
+    raise ValueError(f"unsupported session store {url!r}")
+
+@shared
+def get_session_store():
+    return create_session_store(SESSION_STORE) if SESSION_STORE else None
+
+def restore_session_state(store, session_id, state):
+    digests = {}
+    for key, data in store.load(session_id).items():
+        if key not in PERSISTED_SESSION_KEYS:
+            continue
+        try:
+            state[key] = decode_session_value(data)
+        except (ValueError, TypeError, zlib.error):
+            continue
+        digests[key] = session_digest(data)
+    return digests
+
+def persist_session_state(store, session_id, state, digests):
+    # Values are compared by digest, so in-place edits (a chat message appended, a
+    # search cursor popped) are caught while untouched keys are never rewritten
+    changed = {}
+    for key in PERSISTED_SESSION_KEYS:
+        if key in state:
+            data = encode_session_value(state[key])
+            digest = session_digest(data)
+            if digests.get(key) != digest:
+                changed[key] = data
+                digests[key] = digest
+    removed = [key for key in digests if key not in state]
+    for key in removed:
+        del digests[key]
+    if changed or removed:
+        store.save(session_id, changed, removed)
+    return sum(len(data) for data in changed.values())
+
+CHATBOT_RULES_PATH = os.environ.get("HEALTHCARE_CHATBOT_RULES", os.path.join(APP_DIR, "chatbot_rules.json"))
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def plural(token):
+    if token.endswith(("s", "x", "z", "ch", "sh")):
+        return token + "es"
+    if token.endswith("y") and token[-2:-1] not in ("a", "e", "i", "o", "u"):
+        return token[:-1] + "ies"
+    return token + "s"
+
+class IntentMatcher:
+    # Keywords are compiled into a trie over whole tokens, so "this" never matches "hi"
+    # and a lookup walks the input once regardless of how many rules are loaded.
+    def __init__(self, rules):
+        self.fallback = rules["fallback"]
+        self._trie = {}
+        self._keyword_ids = {}
+        self._intents_by_keyword = []
+        self._intents = []
+        for order, intent in enumerate(rules["intents"]):
+            required = frozenset(self._keyword_id(k) for k in intent.get("requires", []))
+            # Higher priority wins; earlier rules win ties
+            rank = (intent.get("priority", 0), -order)
+            index = len(self._intents)
+            self._intents.append((rank, intent["name"], intent["response"], required))
+            for keyword in intent["keywords"]:
+                self._intents_by_keyword[self._keyword_id(keyword)].append(index)
+        self.max_phrase_length = self._max_depth(self._trie)
+
+    def _keyword_id(self, phrase):
+        tokens = tuple(tokenize(phrase))
+        if not tokens:
+            raise ValueError(f"Keyword {phrase!r} has no matchable words")
+        if tokens not in self._keyword_ids:
+            keyword_id = len(self._intents_by_keyword)
+            self._keyword_ids[tokens] = keyword_id
+            self._intents_by_keyword.append([])
+            node = self._trie
+            for token in tokens[:-1]:
+                node = node.setdefault(token, {})
+            node.setdefault(tokens[-1], {})[None] = keyword_id
+            # "medicines" answers to the "medicine" keyword. Short words are left alone so
+            # "hi" never picks up "his"; a keyword spelled out in the rules takes precedence.
+            if len(tokens[-1]) >= 4:
+                node.setdefault(plural(tokens[-1]), {}).setdefault(None, keyword_id)
+        return self._keyword_ids[tokens]
+
+    def _max_depth(self, node):
+        children = [child for token, child in node.items() if token is not None]
+        return 1 + max(map(self._max_depth, children)) if children else 0
+
+    def find_keywords(self, tokens):
+        found = set()
+        trie = self._trie
+        for start in range(len(tokens)):
+            node = trie
+            for token in tokens[start:start + self.max_phrase_length]:
+                node = node.get(token)
+                if node is None:
+                    break
+                if None in node:
+                    found.add(node[None])
+        return found
+
+    def match(self, text):
+        found = self.find_keywords(tokenize(text))
+        best = None
+        for keyword_id in found:
+            for index in self._intents_by_keyword[keyword_id]:
+                intent = self._intents[index]
+                if intent[3] <= found and (best is None or intent[0] > best[0]):
+                    best = intent
+        return best
+
+    def respond(self, text):
+        intent = self.match(text)
+        return intent[2] if intent else self.fallback
+
+    @property
+    def rule_count(self):
+        return len(self._intents)
+
+def load_chatbot_rules(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+# Recompiled only when the rules file changes on disk
+@shared(maxsize=1)
+def compile_intent_matcher(path, mtime_ns):
+    return IntentMatcher(load_chatbot_rules(path))
+
+def get_intent_matcher():
+    return compile_intent_matcher(CHATBOT_RULES_PATH, os.stat(CHATBOT_RULES_PATH).st_mtime_ns)
+
+CHAT_RESPONSE_CACHE_SIZE = int(os.environ.get("HEALTHCARE_CHAT_RESPONSE_CACHE_SIZE", "4096"))
+
+@shared
+def get_response_cache():
+    cache = LRUCache(CHAT_RESPONSE_CACHE_SIZE)
+    get_metrics().register_collector("chat_response_cache", cache.snapshot)
+    return cache
+
+DISEASE_MODEL_PATH = os.environ.get("HEALTHCARE_DISEASE_MODEL", os.path.join(APP_DIR, "disease_model.json"))
+PREDICTION_TOP_K = 3
+PREDICTION_CHUNK_SIZE = int(os.environ.get("HEALTHCARE_PREDICTION_CHUNK_SIZE", "65536"))
+
+class DiseaseModel:
+    # A linear model over binary symptom indicators: scores = x @ weights + bias, softmaxed
+    # across diseases. weights is a dense (symptoms x diseases) float32 matrix, so one
+    # patient costs a sum of a few rows and a batch is a single matrix product.
+    def __init__(self, spec):
+        self.symptoms = list(spec["symptoms"])
+        symptom_ids = {name: i for i, name in enumerate(self.symptoms)}
+        self._phrases = {}
+        for name, phrases in spec["symptoms"].items():
+            for phrase in phrases:
+                tokens = tuple(tokenize(phrase))
+                if not tokens:
+                    raise ValueError(f"Symptom phrase {phrase!r} has no matchable words")
+                self._phrases[tokens] = symptom_ids[name]
+        self.max_phrase_length = max(len(tokens) for tokens in self._phrases)
+
+        diseases = spec["diseases"]
+        self.diseases = [disease["name"] for disease in diseases]
+        self.specialties = [disease.get("specialty", "") for disease in diseases]
+        self.weights = np.zeros((len(self.symptoms), len(diseases)), dtype=np.float32)
+        self.bias = np.array([disease.get("bias", 0.0) for disease in diseases], dtype=np.float32)
+        for column, disease in enumerate(diseases):
+            for symptom, weight in disease["weights"].items():
+                self.weights[symptom_ids[symptom], column] = weight
+
+    def find_symptoms(self, text):
+        tokens = tokenize(text)
+        found = set()
+        for start in range(len(tokens)):
+            for end in range(start + 1, min(len(tokens), start + self.max_phrase_length) + 1):
+                symptom = self._phrases.get(tuple(tokens[start:end]))
+                if symptom is not None:
+                    found.add(symptom)
+        return sorted(found)
+
+    def predict(self, symptom_ids, top_k=PREDICTION_TOP_K):
+        # Single patient: no indicator vector, just the rows for the symptoms present
+        if not symptom_ids:
+            return []
+        scores = self.bias + self.weights[symptom_ids].sum(axis=0)
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        best = np.argsort(probabilities)[::-1][:top_k]
+        return [(self.diseases[i], float(probabilities[i]), self.specialties[i]) for i in best]
+
+    def predict_text(self, text, top_k=PREDICTION_TOP_K):
+        return self.predict(self.find_symptoms(text), top_k)
+
+    def encode(self, texts):
+        indicators = np.zeros((len(texts), len(self.symptoms)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            indicators[row, self.find_symptoms(text)] = 1.0
+        return indicators
+
+    def predict_batch(self, indicators):
+        # Returns the most likely disease index and its probability for every row;
+        # rows without any known symptom get index -1
+        scores = indicators @ self.weights
+        scores += self.bias
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        best = scores.argmax(axis=1)
+        confidence = scores[np.arange(len(scores)), best] / scores.sum(axis=1)
+        best[~indicators.any(axis=1)] = -1
+        return best, confidence
+
+def load_disease_model(path):
+    with open(path, encoding="utf-8") as f:
+        return DiseaseModel(json.load(f))
+
+# Rebuilt only when the model file changes on disk
+@shared(maxsize=1)
+def compile_disease_model(path, mtime_ns):
+    return load_disease_model(path)
+
+def get_disease_model():
+    return compile_disease_model(DISEASE_MODEL_PATH, os.stat(DISEASE_MODEL_PATH).st_mtime_ns)
+
+def normalize_query(text):
+    # Responses depend only on the token sequence, so phrasings that differ in case,
+    # spacing or punctuation share one cache entry
+    return " ".join(tokenize(text))
+
+@traced("prediction.single")
+def predict_diseases(text):
+    return get_disease_model().predict_text(text)
+
+def format_prediction(predictions):
+    lines = [f"- {name} ({probability:.0%})" for name, probability, _ in predictions]
+    specialty = predictions[0][2] or "General Medicine"
+    return ("Based on the symptoms you described, the closest matches are:\n" + "\n".join(lines) +
+            f"\n\nThis is not a diagnosis. Please book an appointment with a {specialty} doctor.")
+
+def compute_chatbot_response(query, matcher, model):
+    intent = matcher.match(query)
+    if intent:
+        return intent[2]
+    # Messages that match no intent but describe symptoms get a prediction instead
+    predictions = model.predict_text(query)
+    return format_prediction(predictions) if predictions else matcher.fallback
+
+@traced("chatbot.response")
+def get_chatbot_response(user_input):
+    rules_version = os.stat(CHATBOT_RULES_PATH).st_mtime_ns
+    model_version = os.stat(DISEASE_MODEL_PATH).st_mtime_ns
+    cache = get_response_cache()
+    # Editing either file recompiles it and empties the cache on the next message
+    cache.set_version((rules_version, model_version))
+    query = normalize_query(user_input)
+    return cache.get(query, lambda: compute_chatbot_response(
+        query,
+        compile_intent_matcher(CHATBOT_RULES_PATH, rules_version),
+        compile_disease_model(DISEASE_MODEL_PATH, model_version)
+    ))
+
+DASHBOARD_REFRESH_INTERVAL = float(os.environ.get("HEALTHCARE_DASHBOARD_REFRESH_INTERVAL", "10"))
+
+def read_dashboard_counters(database, day):
+    # Primary-key range reads on the counter tables: cost follows the number of localities
+    # and doctors, not the number of patients or slots
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT locality, registrations FROM registration_counts
+                WHERE day = %s AND registrations > 0 ORDER BY registrations DESC, locality
+            """, (day,))
+            localities = cursor.fetchall()
+            cursor.execute("""
+                SELECT d.name, SUM(c.open_slots) FROM slot_counts c JOIN doctors d ON d.id = c.doctor_id
+                WHERE c.day >= %s GROUP BY d.name ORDER BY d.name
+            """, (day,))
+            open_slots = [(name, int(count)) for name, count in cursor.fetchall()]
+        finally:
+            cursor.close()
+    return {
+        "registrations_today": sum(count for _, count in localities),
+        "localities": localities,
+        "open_slots": open_slots,
+    }
+
+# Every open dashboard polls; a short-lived shared entry turns N sessions into one read
+@shared
+def get_dashboard_cache():
+    cache = LRUCache(4, DASHBOARD_REFRESH_INTERVAL / 2)
+    get_metrics().register_collector("dashboard_cache", cache.snapshot)
+    return cache
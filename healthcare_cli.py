@@ -0,0 +1,822 @@
+import numpy as np
+import argparse
+import csv
+import hashlib
+import itertools
+import multiprocessing
+import socket
+import uuid
+from datetime import date, datetime, timedelta
+import os
+import random
+import sys
+import tempfile
+import json
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import healthcare
+from healthcare import (
+    APP_DIR, run_migrations, create_database, get_pool_stats, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+    LRUCache, PatientRepository, QUEUE_PATH, QUEUE_BATCH_SIZE, RegistrationQueue, GENDERS,
+    IMPORT_BATCH_SIZE, bulk_import_patients, DEDUP_BATCH_SIZE, dedup_patients, EXPORT_CHUNK_SIZE,
+    export_window, stream_patients, write_csv_export, EXPORT_WRITERS, registration_report, DOCTORS,
+    REMINDER_LEADS, get_doctor_ids, book_slot, REMINDER_NOTIFIER, create_notifier,
+    ReminderScheduler, get_doctor_directory, get_hospital_snapshot, HOSPITALS_PATH, unit_vector,
+    linear_nearest, build_hospital_tree, hospital_filter, STATIC_DIR, ASSET_BASE_URL,
+    THUMBNAIL_WIDTH, THUMBNAIL_DENSITIES, thumbnail_paths, load_thumbnail_srcset, ChatHistory,
+    PERSISTED_SESSION_KEYS, encode_session_value, RespStandInServer, create_session_store,
+    restore_session_state, persist_session_state, IntentMatcher, CHAT_RESPONSE_CACHE_SIZE,
+    DISEASE_MODEL_PATH, PREDICTION_CHUNK_SIZE, load_disease_model, normalize_query,
+)
+
+# Commands run as "python registration.py <command>"
+APP_SCRIPT = os.path.join(APP_DIR, "registration.py")
+
+def cli_thumbnails(args):
+    parser = argparse.ArgumentParser(prog="registration.py thumbnails",
+                                     description="Generate thumbnails for every doctor and hospital photo")
+    parser.add_argument("--prune", action="store_true", help="delete thumbnails no current photo uses")
+    options = parser.parse_args(args)
+    if not ASSET_BASE_URL:
+        parser.error("HEALTHCARE_ASSET_BASE_URL is empty, so thumbnails are inlined and never stored")
+
+    with open(HOSPITALS_PATH, encoding="utf-8") as f:
+        paths = [doctor["image"] for doctor in DOCTORS] + [hospital["image"] for hospital in json.load(f)]
+    in_use = set()
+    original_bytes = thumbnail_bytes = 0
+    for path in dict.fromkeys(paths):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            load_thumbnail_srcset(path)
+        except (OSError, Image.UnidentifiedImageError) as err:
+            print(f"skipped {path}: {err}")
+            continue
+        relative_paths = [relative for _, relative in thumbnail_paths(hashlib.sha256(data).hexdigest()[:16], path)]
+        in_use.update(relative_paths)
+        original_bytes += len(data)
+        thumbnail_bytes += os.path.getsize(os.path.join(STATIC_DIR, relative_paths[0]))
+    print(f"{len(in_use) // len(THUMBNAIL_DENSITIES)} photos: {original_bytes:,} bytes of originals, "
+          f"{thumbnail_bytes:,} bytes of {THUMBNAIL_WIDTH}px thumbnails")
+
+    if options.prune:
+        thumbs_dir = os.path.join(STATIC_DIR, "thumbs")
+        stale = [name for name in (os.listdir(thumbs_dir) if os.path.isdir(thumbs_dir) else [])
+                 if f"thumbs/{name}" not in in_use]
+        for name in stale:
+            os.remove(os.path.join(thumbs_dir, name))
+        print(f"Pruned {len(stale)} stale thumbnails.")
+
+def cli_migrate(args):
+    parser = argparse.ArgumentParser(prog="registration.py migrate",
+                                     description="Apply pending schema migrations")
+    parser.parse_args(args)
+    with create_database(pool_size=1).connection() as conn:
+        applied = run_migrations(conn)
+    if applied:
+        print(f"Applied migrations: {', '.join(str(v) for v in applied)}")
+    else:
+        print("Schema is up to date.")
+
+def cli_drain_queue(args):
+    parser = argparse.ArgumentParser(prog="registration.py drain-queue",
+                                     description="Flush queued registrations to the database and exit")
+    parser.add_argument("--batch-size", type=int, default=QUEUE_BATCH_SIZE)
+    options = parser.parse_args(args)
+
+    registration_queue = RegistrationQueue(QUEUE_PATH)
+    total = 0
+    while True:
+        drained = registration_queue.drain_once(options.batch_size)
+        total += drained
+        if drained == 0:
+            break
+    print(f"Drained {total} queued registrations.")
+    stats = registration_queue.snapshot()
+    if stats["pending"] or stats["dead_lettered"]:
+        print(f"{stats['pending']} still pending, {stats['dead_lettered']} moved to dead_registrations.")
+
+def cli_import(args):
+    parser = argparse.ArgumentParser(prog="registration.py import",
+                                     description="Bulk import patients from a CSV or JSONL file")
+    parser.add_argument("path", help="CSV with a header row, or JSONL with one object per line")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--rejects", help="write rejected rows to this JSONL file")
+    options = parser.parse_args(args)
+
+    def progress(stats):
+        print(f"\r{stats['imported']} imported, {stats['rejected']} rejected", end="", flush=True)
+
+    stats = bulk_import_patients(options.path, options.batch_size, options.rejects, progress)
+    print(f"\rImported {stats['imported']} patients in {stats['batches']} batches "
+          f"({stats['duplicates']} already registered, {stats['rejected']} rejected) in {stats['seconds']:.1f}s, "
+          f"{stats['rows_per_second']:.0f} rows/s")
+    if stats["rejected"] and options.rejects:
+        print(f"Rejected rows written to {options.rejects}")
+
+def parse_day(value):
+    return date.fromisoformat(value)
+
+def cli_export(args):
+    parser = argparse.ArgumentParser(prog="registration.py export",
+                                     description="Stream registrations for a date range to CSV or Parquet")
+    parser.add_argument("--from", dest="start", type=parse_day, help="first day, YYYY-MM-DD (default: yesterday)")
+    parser.add_argument("--to", dest="end", type=parse_day, help="last day, inclusive (default: --from)")
+    parser.add_argument("--locality")
+    parser.add_argument("--gender", choices=GENDERS)
+    parser.add_argument("--format", choices=sorted(EXPORT_WRITERS), default="csv")
+    parser.add_argument("--output", help="file to write (default: stdout; required for parquet)")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    options = parser.parse_args(args)
+    if options.format == "parquet" and not options.output:
+        parser.error("--output is required for parquet")
+
+    start, end = export_window(options.start, options.end)
+    started = time.perf_counter()
+    chunks = stream_patients(create_database(pool_size=1), start, end, options.locality, options.gender,
+                             options.chunk_size)
+    if options.output:
+        mode = "w" if options.format == "csv" else "wb"
+        with open(options.output, mode, **({"newline": "", "encoding": "utf-8"} if mode == "w" else {})) as out:
+            written = EXPORT_WRITERS[options.format](chunks, out)
+    else:
+        written = write_csv_export(chunks, sys.stdout)
+    print(f"Exported {written} patients registered {start:%Y-%m-%d} to {end - timedelta(days=1):%Y-%m-%d} "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def cli_report(args):
+    parser = argparse.ArgumentParser(prog="registration.py report",
+                                     description="Registrations per day, grouped by locality and/or gender")
+    parser.add_argument("--from", dest="start", type=parse_day, help="first day, YYYY-MM-DD (default: yesterday)")
+    parser.add_argument("--to", dest="end", type=parse_day, help="last day, inclusive (default: --from)")
+    parser.add_argument("--by", default="locality", help="comma-separated: locality, gender")
+    options = parser.parse_args(args)
+
+    dimensions = tuple(options.by.split(","))
+    try:
+        rows = registration_report(create_database(pool_size=1), *export_window(options.start, options.end),
+                                   dimensions)
+    except ValueError as err:
+        parser.error(str(err))
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["day", *dimensions, "registrations"])
+    writer.writerows(rows)
+
+def cli_dedup(args):
+    parser = argparse.ArgumentParser(prog="registration.py dedup",
+                                     description="Key legacy patient rows and merge duplicate registrations")
+    parser.add_argument("--batch-size", type=int, default=DEDUP_BATCH_SIZE)
+    options = parser.parse_args(args)
+
+    def progress(stats):
+        print(f"\r{stats['scanned']} scanned, {stats['merged']} duplicates", end="", flush=True)
+
+    database = create_database(pool_size=1)
+    with database.connection() as conn:
+        run_migrations(conn)
+    stats = dedup_patients(database, options.batch_size, progress)
+    print(f"\rMerged {stats['merged']} duplicates among {stats['scanned']} legacy rows "
+          f"in {stats['batches']} batches, {stats['seconds']:.1f}s")
+
+def generate_benchmark_rules(rule_count, vocabulary_size, rng):
+    vocabulary = [f"w{i}" for i in range(vocabulary_size)]
+    intents = []
+    for i in range(rule_count):
+        keywords = [" ".join(rng.sample(vocabulary, rng.randint(1, 3))) for _ in range(3)]
+        intents.append({"name": f"intent{i}", "priority": rng.randint(0, 100),
+                        "keywords": keywords, "response": f"response {i}"})
+    return {"fallback": "fallback", "intents": intents}, vocabulary
+
+def cli_bench_intents(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-intents",
+                                     description="Measure chatbot intent matching throughput")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=12, help="words per query")
+    parser.add_argument("--distinct", type=int, default=50, help="distinct phrasings in the cached run")
+    parser.add_argument("--seed", type=int, default=7)
+    options = parser.parse_args(args)
+
+    rng = random.Random(options.seed)
+    for rule_count in options.rules:
+        rules, vocabulary = generate_benchmark_rules(rule_count, max(1000, rule_count), rng)
+        started = time.perf_counter()
+        matcher = IntentMatcher(rules)
+        compile_seconds = time.perf_counter() - started
+
+        queries = [" ".join(rng.choices(vocabulary, k=options.words)) for _ in range(options.queries)]
+        started = time.perf_counter()
+        matched = sum(1 for query in queries if matcher.match(query))
+        seconds = time.perf_counter() - started
+
+        # Kiosk traffic: most messages are a handful of phrasings in varying case and spacing
+        phrasings = queries[:options.distinct]
+        repeated = [rng.choice(phrasings).upper() if rng.random() < 0.5 else rng.choice(phrasings)
+                    for _ in range(options.queries)]
+        cache = LRUCache(CHAT_RESPONSE_CACHE_SIZE)
+        started = time.perf_counter()
+        for query in repeated:
+            normalized = normalize_query(query)
+            cache.get(normalized, lambda: matcher.respond(normalized))
+        cached_seconds = time.perf_counter() - started
+        print(f"{rule_count:>7} rules: compiled in {compile_seconds * 1000:.1f} ms, "
+              f"{options.queries / seconds:,.0f} queries/s, "
+              f"{seconds / options.queries * 1e6:.1f} us/query, {matched} matched; "
+              f"cached {cached_seconds / options.queries * 1e6:.1f} us/query "
+              f"({cache.snapshot()['hit_rate']:.1%} hits over {options.distinct} phrasings)")
+
+def generate_directory_entries(count, rng, image=""):
+    specialties = ["Cardiology", "Dermatology", "Neurology", "Oncology", "Pediatrics", "ENT",
+                   "Orthopedics", "General Medicine"]
+    localities = [f"Sector {i}" for i in range(1, 41)]
+    doctors, hospitals = [], []
+    for i in range(count):
+        doctors.append({"name": f"Dr. Bench {i:05d}", "specialty": rng.choice(specialties),
+                        "image": image, "description": "Benchmark doctor."})
+        hospitals.append({"name": f"Bench Hospital {i:05d}", "available": rng.random() < 0.7,
+                          "image": image, "address": rng.choice(localities), "phone": "0000000000",
+                          "beds": rng.randint(0, 80), "specialties": tuple(rng.sample(specialties, 3))})
+    return doctors, hospitals, specialties, localities
+
+def count_cards(at, css_class):
+    return sum(1 for element in at.markdown if f'class="{css_class}' in element.value)
+
+def cli_bench_directory(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-directory",
+                                     description="Time doctor and hospital page reruns as the directories grow")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=20, help="timed reruns per page and filter")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=60)
+    options = parser.parse_args(args)
+
+    from streamlit.testing.v1 import AppTest
+
+    # AppTest executes the app as __main__; without this it would re-enter the CLI
+    sys.argv = sys.argv[:1]
+    rng = random.Random(options.seed)
+    pages = (("doctor", "doctor_specialty_filter", "doctor-box"),
+             ("availability", "hospital_specialty_filter", "hospital-box"))
+    with tempfile.TemporaryDirectory() as workdir:
+        # One real photo for every entry, so cards go through the thumbnail path as in production
+        photo = os.path.join(workdir, "photo.jpg")
+        Image.new("RGB", (300, 300), (70, 130, 180)).save(photo, quality=85)
+        for size in options.sizes:
+            doctors, hospitals, specialties, _ = generate_directory_entries(size, rng, image=photo)
+            hospitals_path = os.path.join(workdir, f"hospitals-{size}.json")
+            with open(hospitals_path, "w", encoding="utf-8") as f:
+                json.dump(hospitals, f)
+            # The pages read both directories through shared getters: point them at the
+            # generated entries and drop the instances built for the previous size
+            healthcare.DOCTORS = doctors
+            healthcare.HOSPITALS_PATH = hospitals_path
+            get_doctor_directory.cache_clear()
+            get_hospital_snapshot.cache_clear()
+
+            print(f"{size} entries")
+            for page, filter_key, card_class in pages:
+                for specialty in (None, rng.choice(specialties)):
+                    at = AppTest.from_file(APP_SCRIPT, default_timeout=options.timeout)
+                    at.session_state["page"] = page
+                    if specialty:
+                        at.session_state[filter_key] = specialty
+                    # The first rerun builds the directory indexes and thumbnails
+                    at.run()
+                    timings = []
+                    for _ in range(options.runs):
+                        started = time.perf_counter()
+                        at.run()
+                        timings.append((time.perf_counter() - started) * 1000)
+                    if at.exception:
+                        raise RuntimeError(f"{page} page: {at.exception[0].message}")
+                    label = f"{page} page, {specialty or 'all specialties'}"
+                    print(f"  {label:<40} p50 {percentile(timings, 50):6.1f} ms  "
+                          f"p95 {percentile(timings, 95):6.1f} ms  {count_cards(at, card_class)} cards")
+
+def cli_bench_nearest(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-nearest",
+                                     description="Compare KD-tree nearest-hospital queries with a linear scan")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    options = parser.parse_args(args)
+
+    rng = random.Random(options.seed)
+    for size in options.sizes:
+        _, hospitals, specialties, _ = generate_directory_entries(size, rng)
+        # Scattered over a metro-sized area, where neighbours are close and ties are rare
+        for hospital in hospitals:
+            hospital["lat"], hospital["lon"] = rng.uniform(28.40, 28.90), rng.uniform(76.85, 77.45)
+        started = time.perf_counter()
+        tree = build_hospital_tree(hospitals)
+        build_ms = (time.perf_counter() - started) * 1000
+        points = [unit_vector(hospital["lat"], hospital["lon"]) for hospital in hospitals]
+
+        timings = {"kd-tree": [], "linear scan": []}
+        mismatches = 0
+        for _ in range(options.queries):
+            point = unit_vector(rng.uniform(28.40, 28.90), rng.uniform(76.85, 77.45))
+            accept = hospital_filter(rng.choice([None, *specialties]))
+            started = time.perf_counter()
+            fast = tree.nearest(point, options.k, accept)
+            timings["kd-tree"].append((time.perf_counter() - started) * 1e6)
+            started = time.perf_counter()
+            slow = linear_nearest(points, hospitals, point, options.k, accept)
+            timings["linear scan"].append((time.perf_counter() - started) * 1e6)
+            mismatches += [h["name"] for h, _ in fast] != [h["name"] for h, _ in slow]
+
+        speedup = percentile(timings["linear scan"], 50) / percentile(timings["kd-tree"], 50)
+        print(f"{size:>6} hospitals (tree built in {build_ms:.1f} ms): " + ", ".join(
+            f"{label} p50 {percentile(values, 50):,.0f} us, p95 {percentile(values, 95):,.0f} us"
+            for label, values in timings.items()
+        ) + f" ({speedup:.1f}x), mismatched results: {mismatches}")
+        if mismatches:
+            sys.exit(1)
+
+def cli_predict(args):
+    parser = argparse.ArgumentParser(prog="registration.py predict",
+                                     description="Score every row of a CSV with the disease model")
+    parser.add_argument("path", help="CSV with a header row and a symptoms column")
+    parser.add_argument("--output", help="scored CSV to write (default: stdout)")
+    parser.add_argument("--column", default="symptoms")
+    parser.add_argument("--chunk-size", type=int, default=PREDICTION_CHUNK_SIZE)
+    options = parser.parse_args(args)
+
+    model = load_disease_model(DISEASE_MODEL_PATH)
+    output = open(options.output, "w", newline="", encoding="utf-8") if options.output else sys.stdout
+    scored = 0
+    started = time.perf_counter()
+    try:
+        with open(options.path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            if options.column not in (reader.fieldnames or []):
+                raise SystemExit(f"{options.path} has no {options.column!r} column")
+            writer = csv.DictWriter(output, reader.fieldnames + ["predicted_disease", "confidence", "specialty"])
+            writer.writeheader()
+            # Rows are read, encoded and scored a chunk at a time so memory stays flat
+            for chunk in iter(lambda: list(itertools.islice(reader, options.chunk_size)), []):
+                best, confidence = model.predict_batch(model.encode([row[options.column] or "" for row in chunk]))
+                for row, disease, probability in zip(chunk, best.tolist(), confidence.tolist()):
+                    if disease >= 0:
+                        row.update(predicted_disease=model.diseases[disease], confidence=f"{probability:.3f}",
+                                   specialty=model.specialties[disease])
+                    writer.writerow(row)
+                scored += len(chunk)
+    finally:
+        if options.output:
+            output.close()
+    print(f"Scored {scored} patients in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+def cli_bench_predict(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-predict",
+                                     description="Compare per-patient and vectorized disease prediction")
+    parser.add_argument("--patients", type=int, default=1_000_000)
+    parser.add_argument("--single", type=int, default=20000, help="patients scored one at a time")
+    parser.add_argument("--chunk-size", type=int, default=PREDICTION_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=7)
+    options = parser.parse_args(args)
+
+    model = load_disease_model(DISEASE_MODEL_PATH)
+    rng = np.random.default_rng(options.seed)
+    # One to five random symptoms per patient
+    counts = rng.integers(1, 6, size=options.patients)
+    indicators = (rng.random((options.patients, len(model.symptoms)), dtype=np.float32)
+                  < (counts / len(model.symptoms))[:, None]).astype(np.float32)
+    symptom_lists = [np.flatnonzero(row).tolist() for row in indicators[:options.single]]
+
+    started = time.perf_counter()
+    single_timings = []
+    for symptom_ids in symptom_lists:
+        call_started = time.perf_counter()
+        model.predict(symptom_ids)
+        single_timings.append((time.perf_counter() - call_started) * 1000)
+    single_rate = len(symptom_lists) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for offset in range(0, options.patients, options.chunk_size):
+        model.predict_batch(indicators[offset:offset + options.chunk_size])
+    batch_rate = options.patients / (time.perf_counter() - started)
+
+    texts = [", ".join(model.symptoms[i].replace("_", " ") for i in ids) for ids in symptom_lists]
+    started = time.perf_counter()
+    model.predict_batch(model.encode(texts))
+    encoded_rate = len(texts) / (time.perf_counter() - started)
+
+    print(f"single patient: {single_rate:,.0f} patients/s, p50 {percentile(single_timings, 50):.3f} ms, "
+          f"p99 {percentile(single_timings, 99):.3f} ms")
+    print(f"batch scoring:  {batch_rate:,.0f} patients/s ({options.patients:,} patients, "
+          f"{batch_rate / single_rate:.0f}x single)")
+    print(f"batch from text: {encoded_rate:,.0f} patients/s including symptom extraction")
+
+def generate_patient_rows(count, rng):
+    first = ["Aarav", "Vivaan", "Aditya", "Arjun", "Sai", "Ishaan", "Ananya", "Diya", "Aadhya", "Saanvi",
+             "Kavya", "Riya", "Meera", "Rohan", "Kabir", "Neha", "Pooja", "Rahul", "Sneha", "Vikram"]
+    last = ["Sharma", "Verma", "Gupta", "Singh", "Kumar", "Patel", "Reddy", "Nair", "Iyer", "Bhatt",
+            "Mehta", "Joshi", "Chopra", "Malhotra", "Rao", "Das", "Bose", "Kapoor", "Saxena", "Mishra"]
+    localities = [f"Sector {i}" for i in range(1, 201)]
+    for n in range(count):
+        yield (f"{rng.choice(first)} {rng.choice(last)} {n}", rng.randint(1, 99),
+               rng.choice(GENDERS), rng.choice(localities))
+
+def cli_bench_search(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-search",
+                                     description="Measure patient search latency on a large patients table")
+    parser.add_argument("--rows", type=int, default=1_000_000,
+                        help="top the patients table up to this many rows first; use a scratch database")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--pages", type=int, default=5, help="keyset pages followed per query")
+    parser.add_argument("--budget-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=7)
+    options = parser.parse_args(args)
+
+    rng = random.Random(options.seed)
+    database = create_database(pool_size=1)
+    with database.connection() as conn:
+        run_migrations(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM patients")
+        existing = cursor.fetchone()[0]
+        cursor.close()
+    patients = PatientRepository(database, LRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL))
+    if existing < options.rows:
+        started = time.perf_counter()
+        rows = generate_patient_rows(options.rows - existing, rng)
+        for batch in iter(lambda: list(itertools.islice(rows, 10000)), []):
+            patients.add_many(batch)
+        print(f"Seeded {options.rows - existing:,} patients in {time.perf_counter() - started:.1f}s")
+
+    first_names = ["a", "ar", "aad", "k", "ka", "me", "ro", "sn", "vik", "p", "neha", "sai", "ish"]
+    queries = []
+    for _ in range(options.queries):
+        queries.append({
+            "name_prefix": rng.choice(first_names),
+            "locality": f"Sector {rng.randint(1, 200)}" if rng.random() < 0.5 else "",
+            "min_age": rng.choice([None, 18, 40]),
+            "max_age": rng.choice([None, 60, 80]),
+        })
+
+    first_page, deep_pages, cached = [], [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, after = patients.search_uncached(**query)
+        first_page.append((time.perf_counter() - started) * 1000)
+        for _ in range(options.pages - 1):
+            if after is None:
+                break
+            started = time.perf_counter()
+            _, after = patients.search_uncached(after=after, **query)
+            deep_pages.append((time.perf_counter() - started) * 1000)
+        patients.search(**query)
+        started = time.perf_counter()
+        patients.search(**query)
+        cached.append((time.perf_counter() - started) * 1000)
+
+    for label, timings in (("first page", first_page), ("later pages", deep_pages), ("cached", cached)):
+        print(f"{label:>12}: p50 {percentile(timings, 50):.2f} ms, p95 {percentile(timings, 95):.2f} ms, "
+              f"p99 {percentile(timings, 99):.2f} ms ({len(timings)} queries)")
+    worst = max(percentile(first_page, 95), percentile(deep_pages, 95))
+    if worst > options.budget_ms:
+        print(f"FAILED: p95 {worst:.2f} ms is over the {options.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"OK: p95 within the {options.budget_ms:.0f} ms budget")
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def cli_loadtest_booking(args):
+    parser = argparse.ArgumentParser(prog="registration.py loadtest-booking",
+                                     description="Hammer a single slot with concurrent bookers")
+    parser.add_argument("--bookers", type=int, default=300)
+    parser.add_argument("--connections", type=int, default=50)
+    options = parser.parse_args(args)
+
+    pool = create_database(pool_size=options.connections, pool_timeout=60)
+    doctor_ids = get_doctor_ids()
+    # A throwaway slot far in the future so real bookings are never touched
+    starts_at = datetime(2099, 1, 1) + timedelta(minutes=random.randrange(525600))
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO slots (doctor_id, starts_at) VALUES (%s, %s)",
+                       (next(iter(doctor_ids.values())), starts_at))
+        slot_id = cursor.lastrowid
+        cursor.close()
+
+    results = []
+    results_lock = threading.Lock()
+    start_gate = threading.Event()
+
+    def booker(n):
+        start_gate.wait()
+        started = time.perf_counter()
+        with pool.connection() as conn:
+            appointment_id = book_slot(conn, slot_id, f"Load test patient {n}")
+        with results_lock:
+            results.append((appointment_id, time.perf_counter() - started))
+
+    threads = [threading.Thread(target=booker, args=(n,)) for n in range(options.bookers)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    start_gate.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM appointments WHERE slot_id = %s", (slot_id,))
+        stored = cursor.fetchone()[0]
+        cursor.execute("DELETE FROM reminders WHERE appointment_id IN "
+                       "(SELECT id FROM appointments WHERE slot_id = %s)", (slot_id,))
+        cursor.execute("DELETE FROM appointments WHERE slot_id = %s", (slot_id,))
+        cursor.execute("DELETE FROM slots WHERE id = %s", (slot_id,))
+        cursor.close()
+
+    winners = sum(1 for appointment_id, _ in results if appointment_id is not None)
+    latencies = [latency * 1000 for _, latency in results]
+    print(f"{len(results)} bookers in {elapsed:.2f}s ({len(results) / elapsed:,.0f} bookings/s)")
+    print(f"latency p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms, "
+          f"p99 {percentile(latencies, 99):.1f} ms")
+    print(f"winners reported: {winners}, appointments stored: {stored}")
+    if winners != 1 or stored != 1:
+        print("FAILED: the slot was double-booked or lost")
+        sys.exit(1)
+    print("OK: exactly one booking for the slot")
+
+def cli_serve_sessions(args):
+    parser = argparse.ArgumentParser(prog="registration.py serve-sessions",
+                                     description="Run a local stand-in for Redis that backs the session store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    options = parser.parse_args(args)
+
+    server = RespStandInServer((options.host, options.port))
+    print(f"Serving sessions on redis://{options.host}:{server.server_address[1]}/0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def serve_sessions_in_background(port, ready):
+    server = RespStandInServer(("127.0.0.1", port))
+    ready.set()
+    server.serve_forever()
+
+def session_bench_replica(store_url, prefix, sessions, start_at, duration, seed, results):
+    # One replica: every simulated rerun lands on a random session, as it would behind a
+    # load balancer without sticky sessions, restores it, changes a little and persists
+    store = create_session_store(store_url, ttl=600)
+    rng = random.Random(seed)
+    pages = ["registration", "doctor", "appointment", "availability", "patient_search"]
+    doctors = [doctor["name"] for doctor in DOCTORS]
+    latencies = []
+    written = full = 0
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        session_id = f"{prefix}{rng.randrange(sessions):08d}"
+        started = time.perf_counter()
+        state = {}
+        digests = restore_session_state(store, session_id, state)
+        state["page"] = rng.choice(pages)
+        if rng.random() < 0.3:
+            state["selected_doctor"] = rng.choice(doctors)
+            state["selected_date"] = datetime.combine(date.today(), datetime.min.time())
+        if rng.random() < 0.3:
+            history = state.setdefault("chat_history", ChatHistory(session_id))
+            history.append("I have a fever and a headache", True)
+            history.append("Based on the symptoms you described, the closest matches are: Influenza", False)
+        written += persist_session_state(store, session_id, state, digests)
+        latencies.append(time.perf_counter() - started)
+        full += sum(len(encode_session_value(state[key])) for key in PERSISTED_SESSION_KEYS if key in state)
+    results.put((len(latencies), written, full, latencies))
+
+def cli_bench_sessions(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-sessions",
+                                     description="Measure session store throughput from one replica to N")
+    parser.add_argument("--store", default="",
+                        help="session store URL (default: a stand-in server started for the run)")
+    parser.add_argument("--replicas", default="1,2,4", help="comma-separated replica counts to try")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per replica count")
+    options = parser.parse_args(args)
+
+    context = multiprocessing.get_context("spawn")
+    server = None
+    store_url = options.store
+    if not store_url:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        ready = context.Event()
+        server = context.Process(target=serve_sessions_in_background, args=(port, ready), daemon=True)
+        server.start()
+        ready.wait(30)
+        store_url = f"redis://127.0.0.1:{port}/0"
+
+    print(f"Store {store_url}, {options.sessions} sessions, {options.duration:.0f}s per run")
+    try:
+        baseline = None
+        for replicas in [int(count) for count in options.replicas.split(",")]:
+            prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+            results = context.Queue()
+            # Replicas import the app before the clock starts, so startup is not measured
+            start_at = time.time() + 5
+            workers = [context.Process(target=session_bench_replica,
+                                       args=(store_url, prefix, options.sessions, start_at,
+                                             options.duration, n, results))
+                       for n in range(replicas)]
+            for worker in workers:
+                worker.start()
+            collected = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+
+            requests = sum(result[0] for result in collected)
+            written = sum(result[1] for result in collected)
+            full = sum(result[2] for result in collected)
+            latencies = [latency * 1000 for result in collected for latency in result[3]]
+            throughput = requests / options.duration
+            baseline = baseline or throughput
+            print(f"{replicas} replica(s): {throughput:,.0f} reruns/s ({throughput / baseline:.2f}x), "
+                  f"p50 {percentile(latencies, 50):.2f} ms, p95 {percentile(latencies, 95):.2f} ms, "
+                  f"{written / max(requests, 1):,.0f} bytes written per rerun "
+                  f"(full state {full / max(requests, 1):,.0f})")
+    finally:
+        if server is not None:
+            server.terminate()
+
+def cli_reminders(args):
+    parser = argparse.ArgumentParser(prog="registration.py reminders",
+                                     description="Send appointment reminders as they fall due")
+    parser.add_argument("--notifier", default=REMINDER_NOTIFIER, help="'stdout' or 'file:<path>'")
+    parser.add_argument("--once", action="store_true", help="send whatever is due now and exit")
+    options = parser.parse_args(args)
+
+    scheduler = ReminderScheduler(create_database(pool_size=1), create_notifier(options.notifier))
+    if options.once:
+        scheduler.run_once()
+        print(scheduler.snapshot(), file=sys.stderr)
+        return
+    print(f"Sending reminders {', '.join(REMINDER_LEADS)} before each appointment", file=sys.stderr)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print(scheduler.snapshot(), file=sys.stderr)
+
+def find_widget(elements, label):
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"No widget labelled {label!r} on the page")
+
+def run_patient_flow(script_path, n, timeout):
+    # One simulated patient: register, pick a doctor, book, then check hospitals
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(script_path, default_timeout=timeout)
+    timings = []
+
+    def rerun(step):
+        started = time.perf_counter()
+        at.run()
+        timings.append((step, time.perf_counter() - started))
+        if at.exception:
+            raise RuntimeError(f"{step}: {at.exception[0].message}")
+
+    rerun("registration")
+    find_widget(at.text_input, "Full Name").input(f"Bench Patient {n}")
+    find_widget(at.number_input, "Age").set_value(20 + n % 60)
+    find_widget(at.text_input, "Locality").input(f"Sector {n % 40}")
+    find_widget(at.button, "Register").click()
+    rerun("register")
+    find_widget(at.button, f"Schedule with {DOCTORS[n % len(DOCTORS)]['name']}").click()
+    rerun("doctor")
+    find_widget(at.button, "Confirm Appointment").click()
+    rerun("appointment")
+    find_widget(at.button, "Check Hospital Availability").click()
+    rerun("availability")
+    return timings, at
+
+def latency_summary(seconds):
+    millis = [value * 1000 for value in seconds]
+    return {
+        "count": len(millis),
+        "p50": round(percentile(millis, 50), 3),
+        "p95": round(percentile(millis, 95), 3),
+        "p99": round(percentile(millis, 99), 3),
+        "max": round(max(millis, default=0.0), 3),
+    }
+
+def cli_bench_flow(args):
+    parser = argparse.ArgumentParser(prog="registration.py bench-flow",
+                                     description="Drive the registration to availability flow headlessly")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--memory-sessions", type=int, default=10,
+                        help="sessions re-run under tracemalloc to estimate memory per session")
+    parser.add_argument("--output", default="bench_flow.json")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    options = parser.parse_args(args)
+
+    # AppTest executes the app as __main__; without this it would re-enter the CLI.
+    # The app imports its shared objects (connection pool and its counters) from
+    # healthcare, so they are the same ones this process reads below.
+    sys.argv = sys.argv[:1]
+    script_path = APP_SCRIPT
+    pool_before = get_pool_stats()
+
+    timings, errors = [], []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        futures = [executor.submit(run_patient_flow, script_path, n, options.timeout)
+                   for n in range(options.sessions)]
+        for future in futures:
+            try:
+                timings.extend(future.result()[0])
+            except Exception as err:
+                errors.append(str(err))
+    elapsed = time.perf_counter() - started
+    pool_after = get_pool_stats()
+
+    tracemalloc.start()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    kept_alive = []
+    for n in range(options.memory_sessions):
+        try:
+            kept_alive.append(run_patient_flow(script_path, options.sessions + n, options.timeout)[1])
+        except Exception as err:
+            errors.append(str(err))
+    memory_bytes = tracemalloc.get_traced_memory()[0] - baseline_bytes
+    tracemalloc.stop()
+
+    reruns = len(timings)
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "sessions": options.sessions,
+        "concurrency": options.concurrency,
+        "seconds": round(elapsed, 3),
+        "reruns": reruns,
+        "reruns_per_second": round(reruns / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary([seconds for _, seconds in timings]),
+        "steps": {
+            step: latency_summary([seconds for name, seconds in timings if name == step])
+            for step in dict.fromkeys(name for name, _ in timings)
+        },
+        "db_round_trips_per_rerun": round(
+            (pool_after["round_trips"] - pool_before["round_trips"]) / reruns, 3) if reruns else 0.0,
+        "db_connections_opened": pool_after["misses"] - pool_before["misses"],
+        "memory_per_session_kb": round(memory_bytes / max(1, len(kept_alive)) / 1024, 1),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+    }
+    with open(options.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        for label, current, previous in (
+            ("p95 latency", result["latency_ms"]["p95"], baseline["latency_ms"]["p95"]),
+            ("p99 latency", result["latency_ms"]["p99"], baseline["latency_ms"]["p99"]),
+            ("round trips per rerun", result["db_round_trips_per_rerun"], baseline["db_round_trips_per_rerun"]),
+            ("memory per session", result["memory_per_session_kb"], baseline["memory_per_session_kb"]),
+        ):
+            if previous and current > previous * (1 + options.tolerance):
+                regressions.append(f"{label}: {previous} -> {current}")
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against baseline.")
+
+CLI_COMMANDS = {
+    "migrate": cli_migrate,
+    "thumbnails": cli_thumbnails,
+    "import": cli_import,
+    "dedup": cli_dedup,
+    "export": cli_export,
+    "report": cli_report,
+    "drain-queue": cli_drain_queue,
+    "loadtest-booking": cli_loadtest_booking,
+    "reminders": cli_reminders,
+    "bench-directory": cli_bench_directory,
+    "bench-nearest": cli_bench_nearest,
+    "bench-flow": cli_bench_flow,
+    "serve-sessions": cli_serve_sessions,
+    "bench-sessions": cli_bench_sessions,
+    "bench-intents": cli_bench_intents,
+    "bench-search": cli_bench_search,
+    "predict": cli_predict,
+    "bench-predict": cli_bench_predict,
+}
@@ -1,84 +1,74 @@
 import streamlit as st
-import mysql.connector
-import base64
-from datetime import datetime, timedelta
+import functools
+import html
+import sqlite3
+import uuid
+from datetime import date, datetime, timedelta
 import os
-import json
+import secrets
+import sys
+import threading
+from urllib.parse import quote
+from healthcare import (
+    PROFILING_ENABLED, PROFILE_DIR, PROFILE_INTERVAL, get_metrics, traced, SamplingProfiler,
+    DB_ERRORS, get_database, identity_key, get_patients, is_repeat_registration,
+    remember_registration, WRITE_MODE, get_registration_queue, GENDERS, validate_patient,
+    BOOKING_DAYS, get_doctor_ids, find_free_slots, book_slot, DIRECTORY_PAGE_SIZE,
+    get_doctor_directory, unit_vector, hospital_filter, resolve_location, get_hospital_snapshot,
+    ASSET_BASE_URL, get_asset_url, get_thumbnail_srcset, start_http_server, build_static_assets,
+    get_chat_archive, ChatHistory, SESSION_ID_PATTERN, RespError, get_session_store,
+    restore_session_state, persist_session_state, predict_diseases, get_chatbot_response,
+    DASHBOARD_REFRESH_INTERVAL, read_dashboard_counters, get_dashboard_cache,
+)
 
-def connect_to_db():
-    try:
-        conn = mysql.connector.connect(
-            host="localhost",
-            user="root",
-            password="mysql",
-            database="healthcare"
-        )
-        
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.tables
-            WHERE table_schema = 'healthcare' 
-            AND table_name = 'patients'
-        """)
-        
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("""
-                CREATE TABLE patients (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    name VARCHAR(100) NOT NULL,
-                    age INT NOT NULL,
-                    gender VARCHAR(20) NOT NULL,
-                    locality VARCHAR(100) NOT NULL,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
-            st.success("Created patients table in the database")
-            
-        cursor.close()
-        return conn
-        
-    except mysql.connector.Error as err:
-        st.error(f"Database connection error: {err}")
-        return None
+def emit_html(body):
+    get_metrics().rerun_add("html_bytes", len(body.encode("utf-8")))
+    st.markdown(body, unsafe_allow_html=True)
 
-def insert_patient(name, age, gender, locality):
-    conn = connect_to_db()
-    if conn is None:
-        return False
-    
-    try:
-        cursor = conn.cursor()
-        query = "INSERT INTO patients (name, age, gender, locality) VALUES (%s, %s, %s, %s)"
-        values = (name, age, gender, locality)
-        cursor.execute(query, values)
-        conn.commit()
+@traced("db.insert_patient")
+def insert_patient(name, age, gender, locality, client_token=None):
+    key = identity_key(name, age, gender, locality)
+    if WRITE_MODE == "write_behind":
+        # No database round trip here: the queue must accept registrations while the
+        # database is down, and the drain's idempotent insert drops repeats
+        try:
+            get_registration_queue().enqueue(name, age, gender, locality, client_token or str(uuid.uuid4()))
+        except sqlite3.Error as err:
+            st.error(f"Registration queue error: {err}")
+            return False
+        remember_registration(key, client_token)
+        return True
+
+    # A repeat of an existing registration counts as success: the patient is on file
+    if is_repeat_registration(key, client_token):
+        get_metrics().inc("registration_duplicates_total")
         return True
-    except mysql.connector.Error as err:
+
+    try:
+        if not get_patients().add(name, age, gender, locality, client_token):
+            get_metrics().inc("registration_duplicates_total")
+    except DB_ERRORS as err:
         st.error(f"Database error: {err}")
         return False
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
-        if conn.is_connected():
-            conn.close()
+    remember_registration(key, client_token)
+    return True
 
-def get_base64_of_image(image_path):
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode()
-    except Exception as e:
-        st.error(f"Error loading image: {e}")
-        return ""
+def render_image(image_path, width, alt=""):
+    srcset = get_thumbnail_srcset(image_path)
+    if srcset is None:
+        return False
+    src = srcset.split(" ", 1)[0]
+    emit_html(f'<img src="{src}" srcset="{srcset}" width="{width}" alt="{html.escape(alt)}" loading="lazy">')
+    return True
 
+@traced("render.set_background")
 def set_background(image_path):
-    base64_img = get_base64_of_image(image_path)
-    if base64_img:
+    url = get_asset_url(image_path)
+    if url:
         bg_image_style = f"""
         <style>
         .stApp {{
-            background-image: url("data:image/png;base64,{base64_img}");
+            background-image: url("{url}");
             background-size: cover;
             background-position: center;
             background-repeat: no-repeat;
@@ -86,284 +76,101 @@ def set_background(image_path):
         }}
         </style>
         """
-        st.markdown(bg_image_style, unsafe_allow_html=True)
+        emit_html(bg_image_style)
+    else:
+        st.error(f"Error loading image: {image_path}")
 
+@traced("render.apply_custom_css")
 def apply_custom_css():
-    custom_css = """
-    <style>
-    /* Professional color scheme */
-    :root {
-        --primary-color: #005b96;
-        --secondary-color: #0b3d91;
-        --accent-color: #5cb85c;
-        --light-color: #f8f9fa;
-        --dark-color: #343a40;
-    }
-    
-    /* Heading box */
-    .heading-box {
-        background-color: var(--primary-color);
-        padding: 15px;
-        border-radius: 8px;
-        margin-bottom: 25px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Doctor specification box */
-    .doctor-box {
-        background-color: var(--secondary-color);
-        padding: 15px;
-        border-radius: 8px;
-        margin-bottom: 20px;
-        color: white;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-        transition: transform 0.3s ease;
-    }
-    
-    .doctor-box:hover {
-        transform: translateY(-3px);
-    }
-    
-    /* Hospital box */
-    .hospital-box {
-        background-color: var(--light-color);
-        padding: 15px;
-        border-radius: 8px;
-        margin-bottom: 20px;
-        color: var(--dark-color);
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-        border-left: 4px solid var(--accent-color);
-    }
-    
-    .available {
-        border-left: 4px solid #5cb85c;
-    }
-    
-    .not-available {
-        border-left: 4px solid #d9534f;
-    }
-    
-    /* Text color */
-    .stMarkdown, .stTextInput, .stNumberInput, .stSelectbox, .stButton button {
-        color: var(--dark-color);
-    }
-    
-    /* Button styling */
-    .stButton button {
-        background-color: var(--primary-color);
-        color: white;
-        border-radius: 5px;
-        padding: 10px 20px;
-        margin: 5px;
-        border: none;
-        transition: background-color 0.3s ease;
-    }
-    
-    .stButton button:hover {
-        background-color: var(--secondary-color);
-    }
-    
-    /* Content box */
-    .content-box {
-        background-color: rgba(255, 255, 255, 0.9);
-        padding: 20px;
-        border-radius: 8px;
-        margin-bottom: 20px;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Status badges */
-    .badge {
-        padding: 5px 10px;
-        border-radius: 20px;
-        font-size: 0.8em;
-        font-weight: bold;
-        margin-left: 10px;
-    }
-    
-    .available-badge {
-        background-color: #d4edda;
-        color: #155724;
-    }
-    
-    .not-available-badge {
-        background-color: #f8d7da;
-        color: #721c24;
-    }
-    
-    /* Chatbot styles */
-    .chatbot-container {
-        position: fixed;
-        bottom: 20px;
-        right: 20px;
-        width: 350px;
-        height: 500px;
-        background-color: white;
-        border-radius: 10px;
-        box-shadow: 0 5px 15px rgba(0,0,0,0.2);
-        z-index: 1000;
-        display: flex;
-        flex-direction: column;
-        border: 1px solid #ddd;
-    }
-    
-    .chatbot-header {
-        background-color: var(--primary-color);
-        color: white;
-        padding: 15px;
-        border-top-left-radius: 10px;
-        border-top-right-radius: 10px;
-        font-weight: bold;
-        display: flex;
-        justify-content: space-between;
-        align-items: center;
-    }
-    
-    .chatbot-messages {
-        flex-grow: 1;
-        padding: 15px;
-        overflow-y: auto;
-    }
-    
-    .chatbot-input {
-        padding: 15px;
-        border-top: 1px solid #ddd;
-        display: flex;
-    }
-    
-    .chatbot-input input {
-        flex-grow: 1;
-        padding: 10px;
-        border: 1px solid #ddd;
-        border-radius: 20px;
-        margin-right: 10px;
-    }
-    
-    .chatbot-input button {
-        background-color: var(--primary-color);
-        color: white;
-        border: none;
-        border-radius: 20px;
-        padding: 10px 15px;
-        cursor: pointer;
-    }
-    
-    .chatbot-toggle {
-        position: fixed;
-        bottom: 20px;
-        right: 20px;
-        background-color: var(--primary-color);
-        color: white;
-        width: 60px;
-        height: 60px;
-        border-radius: 50%;
-        display: flex;
-        justify-content: center;
-        align-items: center;
-        box-shadow: 0 2px 10px rgba(0,0,0,0.2);
-        cursor: pointer;
-        z-index: 1001;
-    }
-    
-    /* Responsive design */
-    @media (max-width: 768px) {
-        .chatbot-container {
-            width: 100%;
-            height: 70vh;
-            bottom: 0;
-            right: 0;
-            border-radius: 10px 10px 0 0;
-        }
-    }
-    
-    /* Chat message styles */
-    .user-message {
-        background-color: #e3f2fd;
-        padding: 10px 15px;
-        border-radius: 18px;
-        margin-bottom: 10px;
-        max-width: 80%;
-        align-self: flex-end;
-    }
-    
-    .bot-message {
-        background-color: #f1f1f1;
-        padding: 10px 15px;
-        border-radius: 18px;
-        margin-bottom: 10px;
-        max-width: 80%;
-        align-self: flex-start;
-    }
-    
-    .message-container {
-        display: flex;
-        flex-direction: column;
-        padding: 5px;
-    }
-    </style>
+    assets = build_static_assets()
+    if not ASSET_BASE_URL:
+        emit_html(f"<style>{assets['css']['source']}</style>")
+        return
+
+    # The stylesheet and script are attached to <head>, which Streamlit leaves alone on
+    # reruns, so they only need to be sent once per browser session (i.e. per session_state)
+    version = (assets["css"]["url"], assets["js"]["url"])
+    if st.session_state.get('static_assets_version') == version:
+        return
+    loader_html = f"""
+    <script>
+    (function() {{
+        var head = document.head;
+        if (!head.querySelector('link[href="{assets['css']['url']}"]')) {{
+            var link = document.createElement('link');
+            link.rel = 'stylesheet';
+            link.href = '{assets['css']['url']}';
+            head.appendChild(link);
+        }}
+        if (!head.querySelector('script[src="{assets['js']['url']}"]')) {{
+            var script = document.createElement('script');
+            script.src = '{assets['js']['url']}';
+            head.appendChild(script);
+        }}
+    }})();
+    </script>
     """
-    st.markdown(custom_css, unsafe_allow_html=True)
+    get_metrics().rerun_add("html_bytes", len(loader_html.encode("utf-8")))
+    st.html(loader_html, unsafe_allow_javascript=True)
+    st.session_state['static_assets_version'] = version
 
-# Chatbot functionality
 def initialize_chatbot():
     if 'chat_history' not in st.session_state:
-        st.session_state['chat_history'] = []
+        st.session_state['chat_history'] = ChatHistory(str(uuid.uuid4()), archive=get_chat_archive())
     
     if 'chat_open' not in st.session_state:
         st.session_state['chat_open'] = False
 
-def get_chatbot_response(user_input):
-    user_input = user_input.lower()
-    
-    greetings = ["hi", "hello", "hey", "good morning", "good afternoon"]
-    farewells = ["bye", "goodbye", "see you", "thanks"]
-    medicine_queries = ["cough", "cold", "fever", "headache", "pain"]
-    
-    if any(word in user_input for word in greetings):
-        return "Hello! I'm your healthcare assistant. How can I help you today?"
-    
-    if any(word in user_input for word in farewells):
-        return "Goodbye! Feel free to reach out if you have any more questions."
-    
-    if "medicine" in user_input and any(word in user_input for word in medicine_queries):
-        if "cough" in user_input:
-            return """For cough, you can try these home remedies:
-            - Honey and warm water
-            - Ginger tea
-            - Steam inhalation
-            - Saltwater gargle
-            
-            If symptoms persist for more than 3 days, please consult a doctor."""
-        
-        if "cold" in user_input:
-            return """For cold symptoms:
-            - Stay hydrated
-            - Get plenty of rest
-            - Use a humidifier
-            - Try chicken soup
-            
-            Over-the-counter cold medicines may help, but consult a pharmacist first."""
-        
-        if "fever" in user_input:
-            return """For fever management:
-            - Stay hydrated
-            - Rest
-            - Take paracetamol as directed
-            - Use cool compresses
-            
-            If fever is above 102°F (39°C) or lasts more than 3 days, seek medical attention."""
-    
-    if "appointment" in user_input:
-        return "You can schedule an appointment with our doctors through the 'Our Expert Doctors' page. Would you like me to take you there?"
-    
-    if "hospital" in user_input or "availability" in user_input:
-        return "You can check hospital availability on the 'Hospital Availability' page. Would you like me to direct you there?"
-    
-    return "I'm sorry, I didn't understand your question. I can help with information about medicines, appointments, and hospital availability. Please try asking in a different way."
+def restore_session():
+    store = get_session_store()
+    if store is None or '_session_id' in st.session_state:
+        return
+    # The id travels in the URL, so a reload or reconnect lands on the same state
+    # whichever replica serves it
+    session_id = st.query_params.get("sid", "")
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        session_id = secrets.token_urlsafe(16)
+        st.query_params["sid"] = session_id
+    st.session_state['_session_id'] = session_id
+    try:
+        st.session_state['_session_digests'] = restore_session_state(store, session_id, st.session_state)
+    except (sqlite3.Error, OSError, ConnectionError, RespError):
+        get_metrics().inc("session_store_errors_total")
+        st.session_state['_session_digests'] = {}
+
+def persist_session():
+    store = get_session_store()
+    if store is None or '_session_id' not in st.session_state:
+        return
+    try:
+        written = persist_session_state(store, st.session_state['_session_id'], st.session_state,
+                                        st.session_state['_session_digests'])
+    except (sqlite3.Error, OSError, ConnectionError, RespError):
+        # The session keeps working from process memory; only the shared copy goes stale
+        get_metrics().inc("session_store_errors_total")
+        return
+    if written:
+        get_metrics().inc("session_state_writes_total")
+        get_metrics().inc("session_state_bytes_written_total", written)
 
+def persists_session(func):
+    # For fragments: their reruns skip main(), which persists after full reruns
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            persist_session()
+    return wrapper
+
+# Sending a message reruns only this fragment, not the page around it
+@st.fragment
+@persists_session
+@traced("fragment.chatbot")
 def display_chatbot_ui():
     if st.session_state['chat_open']:
-        st.markdown("""
+        # Header and the recent message window go out as one batched element
+        emit_html("""
         <div class="chatbot-container">
             <div class="chatbot-header">
                 <span>Healthcare Assistant</span>
@@ -371,107 +178,102 @@ def display_chatbot_ui():
                         style="background: none; border: none; color: white; cursor: pointer; font-size: 20px;">×</button>
             </div>
             <div class="chatbot-messages" id="chat-messages">
-        """, unsafe_allow_html=True)
-        
-        # Display chat messages
-        for chat in st.session_state['chat_history']:
-            if chat['is_user']:
-                st.markdown(f"""
-                <div class="message-container">
-                    <div class="user-message">{chat['message']}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="message-container">
-                    <div class="bot-message">{chat['message']}</div>
-                </div>
-                """, unsafe_allow_html=True)
-        
-        st.markdown("</div>", unsafe_allow_html=True)
+        """ + st.session_state['chat_history'].render_html() + "</div>")
         
         # Chat input
         user_input = st.text_input("Type your message...", key="chat_input", 
                                  on_change=process_chat_input, 
                                  label_visibility="collapsed")
         
-        st.markdown("""
-            <script>
-            // Scroll to bottom of chat
-            window.parent.document.getElementById('chat-messages').scrollTop = 
-                window.parent.document.getElementById('chat-messages').scrollHeight;
-            </script>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("</div>", unsafe_allow_html=True)
+        emit_html("</div>")
     
     # Chat toggle button
-    st.markdown(f"""
+    emit_html(f"""
     <div class="chatbot-toggle" onclick="window.parent.document.dispatchEvent(new CustomEvent('toggle-chatbot'))">
         <svg xmlns="http://www.w3.org/2000/svg" width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round">
             <path d="M21 15a2 2 0 0 1-2 2H7l-4 4V5a2 2 0 0 1 2-2h14a2 2 0 0 1 2 2z"></path>
         </svg>
     </div>
-    """, unsafe_allow_html=True)
-    
-    # JavaScript to handle toggle
-    st.markdown("""
-    <script>
-    document.addEventListener('toggle-chatbot', function() {
-        // This event will be caught by Streamlit and handled in Python
-        window.parent.document.querySelector('iframe').contentWindow.postMessage('toggle-chatbot', '*');
-    });
-    </script>
-    """, unsafe_allow_html=True)
+    """)
 
 def process_chat_input():
     if st.session_state.chat_input:
         user_input = st.session_state.chat_input
-        st.session_state['chat_history'].append({'message': user_input, 'is_user': True})
+        st.session_state['chat_history'].append(user_input, True)
         
         bot_response = get_chatbot_response(user_input)
-        st.session_state['chat_history'].append({'message': bot_response, 'is_user': False})
+        st.session_state['chat_history'].append(bot_response, False)
         
         # Clear the input
         st.session_state.chat_input = ""
 
+def doctor_card_html(doctor):
+    return f"""
+                <div class="doctor-box">
+                    <h3 style="color: white;">{doctor['name']}</h3>
+                    <p><strong>Specialty:</strong> {doctor['specialty']}</p>
+                    <p><strong>About:</strong> {doctor['description']}</p>
+                </div>
+                """
+
+def hospital_card_html(hospital):
+    status = "Available" if hospital["available"] else "Not Available"
+    badge_class = "available-badge" if hospital["available"] else "not-available-badge"
+    return f"""
+                <div class="hospital-box {'available' if hospital['available'] else 'not-available'}">
+                    <h3>{hospital['name']} <span class="badge {badge_class}">{status}</span></h3>
+                    <p><strong>Address:</strong> {hospital['address']}</p>
+                    <p><strong>Phone:</strong> {hospital['phone']}</p>
+                    <p><strong>Available Beds:</strong> {hospital['beds'] if hospital['available'] else '0'}</p>
+                    <p><strong>Specialties:</strong> {', '.join(hospital['specialties'])}</p>
+                    <div style="margin-top: 10px;">
+                """
+
+def directions_url(hospital):
+    if hospital.get("lat") is not None and hospital.get("lon") is not None:
+        destination = f"{hospital['lat']},{hospital['lon']}"
+    else:
+        destination = f"{hospital['name']}, {hospital['address']}"
+    return f"https://www.google.com/maps/dir/?api=1&destination={quote(destination)}"
+
+def facet_filter(label, directory, facet, key):
+    choice = st.selectbox(label, ["All"] + directory.values(facet), key=key)
+    return None if choice == "All" else choice
+
+def page_selector(total, key, page_size=DIRECTORY_PAGE_SIZE):
+    pages = max(1, -(-total // page_size))
+    if pages == 1:
+        return 1
+    page = st.number_input("Page", min_value=1, max_value=pages, step=1, key=key)
+    st.caption(f"Page {page} of {pages} ({total} results)")
+    return page
+
+@traced("page.doctor")
 def display_doctor_page():
     st.set_page_config(page_title="Doctor Information", page_icon="👨‍⚕️", layout="centered")
     set_background(r"C:\Users\itsga\Downloads\mainwall2.jpg")
     apply_custom_css()
     initialize_chatbot()
 
-    st.markdown("""
+    emit_html("""
     <div class="heading-box">
         <h1 style="color: white; text-align: center;">Our Expert Doctors</h1>
         <p style="color: white; text-align: center;">Meet our team of experienced healthcare professionals</p>
     </div>
-    """, unsafe_allow_html=True)
+    """)
 
-    doctors = [
-        {"name": "Dr. AK Verma", "specialty": "Cardiologist", "image": r"C:\Users\itsga\Downloads\04431a327584e47601fe1c895bd46a24.jpg", "description": "Specialist in heart-related issues with 10+ years of experience."},
-        {"name": "Dr. Kabir Singh", "specialty": "Dermatologist", "image": r"C:\Users\itsga\Downloads\d3.jpg", "description": "Expert in skin care and treatments with 8+ years of experience."},
-        {"name": "Dr. Ashi", "specialty": "Surgeon", "image": r"C:\Users\itsga\Downloads\d2.jpg", "description": "Specialist in surgical procedures with 8+ years of experience."}
-    ]
+    directory = get_doctor_directory()
+    specialty = facet_filter("Specialty", directory, "specialty", "doctor_specialty_filter")
+    matches = directory.match(specialty=specialty)
+    doctors = directory.page(matches, page_selector(len(matches), "doctor_page"))
 
     for doctor in doctors:
         col1, col2 = st.columns([1, 3])
         with col1:
-            try:
-                st.image(doctor["image"], width=150)
-            except:
+            if not render_image(doctor["image"], 150, doctor["name"]):
                 st.warning(f"Could not load image for {doctor['name']}")
         with col2:
-            st.markdown(
-                f"""
-                <div class="doctor-box">
-                    <h3 style="color: white;">{doctor['name']}</h3>
-                    <p><strong>Specialty:</strong> {doctor['specialty']}</p>
-                    <p><strong>About:</strong> {doctor['description']}</p>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+            emit_html(doctor_card_html(doctor))
             if st.button(f"Schedule with {doctor['name']}"):
                 st.session_state['selected_doctor'] = doctor['name']
                 st.session_state['page'] = 'appointment'
@@ -490,41 +292,78 @@ def display_doctor_page():
     
     display_chatbot_ui()
 
+# Changing the date or slot reruns only the picker
+@st.fragment
+@persists_session
+@traced("fragment.slot_picker")
+def display_slot_picker():
+    st.subheader("Select a Date")
+    # Midnight-based options stay identical across reruns, so the keyed selection sticks
+    today = datetime.combine(date.today(), datetime.min.time())
+    dates = [today + timedelta(days=i) for i in range(BOOKING_DAYS)]
+    selected_date = st.selectbox("Choose a date", dates, format_func=lambda x: x.strftime('%Y-%m-%d'),
+                                 key="slot_date")
+
+    doctor_name = st.session_state['selected_doctor']
+    emit_html(f"""
+        <div class="content-box">
+            <h3>Appointment with {doctor_name}</h3>
+        </div>
+        """)
+
+    try:
+        doctor_id = get_doctor_ids()[doctor_name]
+        with get_database().connection() as conn:
+            free_slots = find_free_slots(conn, doctor_id, selected_date.date())
+    except DB_ERRORS as err:
+        st.error(f"Database error: {err}")
+        return
+
+    if not free_slots:
+        st.warning("No free slots on this date. Please choose another date.")
+        return
+
+    slot_labels = {slot_id: starts_at.strftime('%I:%M %p') for slot_id, starts_at in free_slots}
+    selected_slot = st.selectbox("Choose a time slot", list(slot_labels), format_func=slot_labels.get,
+                                 key="slot_choice")
+    patient_name = st.session_state.get('patient_name') or st.text_input("Patient name", key="slot_patient_name")
+
+    if st.button("Confirm Appointment"):
+        if not patient_name:
+            st.error("Please enter the patient's name.")
+            return
+        try:
+            with get_database().connection() as conn:
+                appointment_id = book_slot(conn, selected_slot, patient_name)
+        except DB_ERRORS as err:
+            st.error(f"Database error: {err}")
+            return
+        if appointment_id is None:
+            st.error("Sorry, that slot was just booked by someone else. Please pick another time.")
+        else:
+            st.success(f"Appointment scheduled with {doctor_name} on {selected_date.strftime('%Y-%m-%d')} at {slot_labels[selected_slot]}.")
+            st.session_state['selected_date'] = selected_date
+            st.session_state['selected_time'] = slot_labels[selected_slot]
+            st.session_state['appointment_id'] = appointment_id
+
+@traced("page.appointment")
 def display_appointment_page():
     st.set_page_config(page_title="Doctor Appointment", page_icon="📅", layout="centered")
     set_background(r"C:\Users\itsga\Downloads\mainwall2.jpg")
     apply_custom_css()
     initialize_chatbot()
 
-    st.markdown("""
+    emit_html("""
     <div class="heading-box">
         <h1 style="color: white; text-align: center;">Doctor Appointment Scheduling</h1>
         <p style="color: white; text-align: center;">Please select a date and time to schedule your appointment.</p>
     </div>
-    """, unsafe_allow_html=True)
-
-    st.subheader("Select a Date")
-    today = datetime.today()
-    dates = [today + timedelta(days=i) for i in range(7)]
-    selected_date = st.selectbox("Choose a date", dates, format_func=lambda x: x.strftime('%Y-%m-%d'))
-
-    if 'selected_doctor' in st.session_state:
-        st.markdown(
-            f"""
-            <div class="content-box">
-                <h3>Appointment with {st.session_state['selected_doctor']}</h3>
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+    """)
 
-    time_slots = ["09:00 AM", "11:00 AM", "01:00 PM", "03:00 PM", "05:00 PM"]
-    selected_time = st.selectbox("Choose a time slot", time_slots)
-    
-    if st.button("Confirm Appointment"):
-        st.success(f"Appointment scheduled with {st.session_state['selected_doctor']} on {selected_date.strftime('%Y-%m-%d')} at {selected_time}.")
-        st.session_state['selected_date'] = selected_date
-        st.session_state['selected_time'] = selected_time
+    if 'selected_doctor' not in st.session_state:
+        st.info("Please choose a doctor first.")
+    else:
+        display_slot_picker()
 
     st.markdown("---")
     col1, col2 = st.columns(2)
@@ -539,84 +378,71 @@ def display_appointment_page():
     
     display_chatbot_ui()
 
+@traced("page.availability")
 def display_availability_page():
     st.set_page_config(page_title="Hospital Availability", page_icon="🏥", layout="centered")
     set_background(r"C:\Users\itsga\Downloads\back3rd.jpg")
     apply_custom_css()
     initialize_chatbot()
 
-    st.markdown("""
+    emit_html("""
     <div class="heading-box">
         <h1 style="color: white; text-align: center;">Hospital Availability</h1>
         <p style="color: white; text-align: center;">Check hospital availability and nearby options</p>
     </div>
-    """, unsafe_allow_html=True)
+    """)
 
-    st.markdown("""
+    emit_html("""
     <div class="content-box">
         <h3>Hospital Availability Status</h3>
         <p>Real-time availability of our network hospitals</p>
     </div>
-    """, unsafe_allow_html=True)
+    """)
     
     if 'selected_date' in st.session_state and 'selected_time' in st.session_state:
         st.write(f"Checking availability for {st.session_state['selected_date'].strftime('%Y-%m-%d')} at {st.session_state['selected_time']}...")
     else:
         st.write("No appointment scheduled yet. Please schedule an appointment first.")
     
-    hospitals = [
-        {
-            "name": "VERMA Hospital", 
-            "available": True,
-            "image": r"C:\Users\itsga\Downloads\doctor1.jpg",
-            "address": "Jankpuri West",
-            "phone": "7701815002",
-            "beds": 25,
-            "specialties": ["Cardiology", "General Medicine", "Pediatrics"]
-        },
-        {
-            "name": "Mata Rukmani Devi Hospital", 
-            "available": False,
-            "image": r"C:\Users\itsga\Downloads\hospital3.jpg",
-            "address": "Dwarka Mor",
-            "phone": "8708464668",
-            "beds": 50,
-            "specialties": ["Orthopedics", "Neurology", "Oncology"]
-        },
-        {
-            "name": "Yadav Clinic", 
-            "available": True,
-            "image": r"C:\Users\itsga\Downloads\hospital 2.jpg",
-            "address": "Uttam Nagar",
-            "phone": "7668451843",
-            "beds": 15,
-            "specialties": ["General Practice", "Dermatology", "ENT"]
-        }
-    ]
+    # One read of the state: the directory, the tree and the timestamp all match
+    snapshot = get_hospital_snapshot().state
+    st.caption(f"Availability last updated at {snapshot.loaded_at.strftime('%H:%M:%S')}")
     
-    for hospital in hospitals:
+    directory = snapshot.directory
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        specialty = facet_filter("Specialty", directory, "specialty", "hospital_specialty_filter")
+    with col2:
+        locality = facet_filter("Locality", directory, "locality", "hospital_locality_filter")
+    with col3:
+        available_only = st.checkbox("Available only", key="hospital_available_filter")
+    near = st.text_input("Nearest to (locality or \"lat, lon\")", value=st.session_state.get('patient_locality', ""),
+                         key="hospital_near")
+    location = resolve_location(near) if near.strip() else None
+
+    if location:
+        # Ranked by distance, limited to hospitals that can take a patient now
+        ranked = snapshot.tree.nearest(unit_vector(*location), DIRECTORY_PAGE_SIZE,
+                                       hospital_filter(specialty, locality))
+        st.caption(f"Nearest hospitals with free beds to {near.strip()}")
+    else:
+        if near.strip():
+            st.caption(f"Unknown locality \"{near.strip()}\"; showing all hospitals.")
+        matches = directory.match(specialty=specialty, locality=locality,
+                                  available=True if available_only else None)
+        ranked = [(hospital, None) for hospital in directory.page(matches, page_selector(len(matches), "hospital_page"))]
+
+    if not ranked:
+        st.info("No matching hospitals.")
+    for hospital, distance in ranked:
         col1, col2 = st.columns([1, 3])
         with col1:
-            try:
-                st.image(hospital["image"], width=150)
-            except:
+            if not render_image(hospital["image"], 150, hospital["name"]):
                 st.warning(f"Could not load image for {hospital['name']}")
         with col2:
-            status = "Available" if hospital["available"] else "Not Available"
-            badge_class = "available-badge" if hospital["available"] else "not-available-badge"
-            
-            st.markdown(
-                f"""
-                <div class="hospital-box {'available' if hospital['available'] else 'not-available'}">
-                    <h3>{hospital['name']} <span class="badge {badge_class}">{status}</span></h3>
-                    <p><strong>Address:</strong> {hospital['address']}</p>
-                    <p><strong>Phone:</strong> {hospital['phone']}</p>
-                    <p><strong>Available Beds:</strong> {hospital['beds'] if hospital['available'] else '0'}</p>
-                    <p><strong>Specialties:</strong> {', '.join(hospital['specialties'])}</p>
-                    <div style="margin-top: 10px;">
-                """,
-                unsafe_allow_html=True
-            )
+            emit_html(hospital_card_html(hospital))
+            if distance is not None:
+                st.caption(f"{distance:.1f} km away")
             
             col1, col2 = st.columns(2)
             with col1:
@@ -625,8 +451,7 @@ def display_availability_page():
                     st.session_state['page'] = 'hospital_details'
                     st.rerun()
             with col2:
-                if st.button(f"Get Directions - {hospital['name']}"):
-                    st.write(f"Opening directions to {hospital['name']} in your map application...")
+                st.link_button(f"Get Directions - {hospital['name']}", directions_url(hospital))
     
     st.markdown("---")
     col1, col2 = st.columns(2)
@@ -641,38 +466,193 @@ def display_availability_page():
     
     display_chatbot_ui()
 
+@traced("page.patient_search")
+def display_patient_search_page():
+    st.set_page_config(page_title="Find Patient", page_icon="🔎", layout="centered")
+    set_background(r"C:\Users\itsga\Downloads\mainwall1.jpg")
+    apply_custom_css()
+    initialize_chatbot()
+
+    emit_html("""
+    <div class="heading-box">
+        <h1 style="color: white; text-align: center;">Returning Patient Lookup</h1>
+        <p style="color: white; text-align: center;">Search by name, locality and age</p>
+    </div>
+    """)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        name_prefix = st.text_input("Name starts with", key="search_name")
+    with col2:
+        locality = st.text_input("Locality", key="search_locality")
+    min_age, max_age = st.slider("Age range", 0, 120, (0, 120), key="search_age")
+
+    # Keyset cursors of the pages already visited, so Previous can step back
+    criteria = (name_prefix, locality, min_age, max_age)
+    if st.session_state.get('search_criteria') != criteria:
+        st.session_state['search_criteria'] = criteria
+        st.session_state['search_cursors'] = [None]
+    cursors = st.session_state['search_cursors']
+
+    try:
+        patients, next_after = get_patients().search(
+            name_prefix, locality,
+            min_age if min_age > 0 else None, max_age if max_age < 120 else None,
+            after=cursors[-1]
+        )
+    except DB_ERRORS as err:
+        st.error(f"Database error: {err}")
+        return
+
+    if not patients:
+        st.info("No matching patients.")
+    for patient in patients:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.write(f"**{patient['name']}** · {patient['age']} · {patient['gender']} · {patient['locality']}")
+        with col2:
+            if st.button("Select", key=f"select_patient_{patient['id']}"):
+                st.session_state['patient_name'] = patient['name']
+                st.session_state['patient_locality'] = patient['locality']
+                st.session_state['page'] = 'doctor'
+                st.rerun()
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if len(cursors) > 1 and st.button("Previous"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(cursors)}")
+    with col3:
+        if next_after is not None and st.button("Next"):
+            cursors.append(next_after)
+            st.rerun()
+
+    st.markdown("---")
+    if st.button("Back to Registration"):
+        st.session_state['page'] = 'registration'
+        st.rerun()
+
+    display_chatbot_ui()
+
+@st.fragment(run_every=DASHBOARD_REFRESH_INTERVAL)
+@traced("fragment.dashboard")
+def display_dashboard_counters():
+    day = date.today()
+    try:
+        counters = get_dashboard_cache().get(day, lambda: read_dashboard_counters(get_database(), day))
+    except DB_ERRORS as err:
+        st.error(f"Database error: {err}")
+        return
+    hospitals = get_hospital_snapshot().hospitals
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Registrations today", counters["registrations_today"])
+    col2.metric("Open slots", sum(count for _, count in counters["open_slots"]))
+    col3.metric("Beds free", sum(hospital["beds"] for hospital in hospitals if hospital["available"]))
+
+    st.subheader("Registrations today by locality")
+    st.dataframe([{"Locality": locality, "Registrations": count} for locality, count in counters["localities"]],
+                 hide_index=True, width="stretch")
+    st.subheader("Open slots per doctor")
+    st.dataframe([{"Doctor": name, "Open slots": count} for name, count in counters["open_slots"]],
+                 hide_index=True, width="stretch")
+    st.subheader("Beds per hospital")
+    st.dataframe([{"Hospital": hospital["name"], "Beds": hospital["beds"], "Available": bool(hospital["available"])}
+                  for hospital in hospitals], hide_index=True, width="stretch")
+    st.caption(f"Updated at {datetime.now().strftime('%H:%M:%S')}, refreshing every {DASHBOARD_REFRESH_INTERVAL:g}s")
+
+@traced("page.dashboard")
+def display_dashboard_page():
+    st.set_page_config(page_title="Operations Dashboard", page_icon="📊", layout="centered")
+    set_background(r"C:\Users\itsga\Downloads\mainwall2.jpg")
+    apply_custom_css()
+    initialize_chatbot()
+
+    emit_html("""
+    <div class="heading-box">
+        <h1 style="color: white; text-align: center;">Operations Dashboard</h1>
+        <p style="color: white; text-align: center;">Registrations, appointments and beds at a glance</p>
+    </div>
+    """)
+
+    # Only this fragment re-runs on the refresh timer, not the page script
+    display_dashboard_counters()
+
+    st.markdown("---")
+    if st.button("Back to Registration"):
+        st.session_state['page'] = 'registration'
+        st.rerun()
+
+    display_chatbot_ui()
+
+@traced("page.registration")
 def display_registration_page():
     st.set_page_config(page_title="Patient Registration", page_icon="🏥", layout="centered")
     set_background(r"C:\Users\itsga\Downloads\mainwall1.jpg")
     apply_custom_css()
     initialize_chatbot()
 
-    st.markdown("""
+    emit_html("""
     <div class="heading-box">
         <h1 style="color: white; text-align: center;">Patient Registration Form</h1>
         <p style="color: white; text-align: center;">Please fill out the form below to register.</p>
     </div>
-    """, unsafe_allow_html=True)
+    """)
 
     name = st.text_input("Full Name", placeholder="Enter your full name")
     age = st.number_input("Age", min_value=0, max_value=120, step=1, placeholder="Enter your age")
-    gender = st.selectbox("Gender", ["Male", "Female", "Other"])
+    gender = st.selectbox("Gender", GENDERS)
     locality = st.text_input("Locality", placeholder="Enter your locality")
+    symptoms = st.text_input("Symptoms (optional)", placeholder="e.g. fever, headache and body ache")
+    predictions = predict_diseases(symptoms) if symptoms else []
+    if predictions:
+        st.caption("Possible conditions: " + ", ".join(
+            f"{name} ({probability:.0%})" for name, probability, _ in predictions
+        ) + ". This is not a diagnosis.")
 
+    # One token per filled-in form: a double click, or a rerun that interrupts the first
+    # submit, replays the same token and the database keeps a single row
+    client_token = st.session_state.setdefault('registration_token', str(uuid.uuid4()))
     if st.button("Register"):
-        if name and age and gender and locality:
-            if insert_patient(name, age, gender, locality):
+        error = validate_patient(name, age, gender, locality)
+        if error is None:
+            if insert_patient(name, age, gender, locality, client_token):
                 st.success("Registration successful! Thank you for registering.")
+                st.session_state.pop('registration_token')
+                st.session_state['patient_name'] = name
+                st.session_state['patient_locality'] = locality
+                # Open the doctor list filtered to the specialty of the likeliest condition
+                if predictions and predictions[0][2] in get_doctor_directory().values("specialty"):
+                    st.session_state['doctor_specialty_filter'] = predictions[0][2]
                 st.session_state['page'] = 'doctor'
                 st.rerun()
             else:
                 st.error("Registration failed. Please try again.")
         else:
-            st.error("Please fill out all fields.")
+            st.error(error)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Find a returning patient"):
+            st.session_state['page'] = 'patient_search'
+            st.rerun()
+    with col2:
+        if st.button("Operations dashboard"):
+            st.session_state['page'] = 'dashboard'
+            st.rerun()
     
     display_chatbot_ui()
 
 def main():
+    start_http_server()
+    if WRITE_MODE == "write_behind":
+        # Starts the drain worker, so rows queued before a restart go out without
+        # waiting for the next registration
+        get_registration_queue()
+    restore_session()
+
     if 'page' not in st.session_state:
         st.session_state['page'] = 'registration'
 
@@ -681,14 +661,37 @@ def main():
         st.session_state['chat_open'] = not st.session_state.get('chat_open', False)
         st.session_state.pop('toggle_chatbot')
 
-    if st.session_state['page'] == 'registration':
-        display_registration_page()
-    elif st.session_state['page'] == 'doctor':
-        display_doctor_page()
-    elif st.session_state['page'] == 'appointment':
-        display_appointment_page()
-    elif st.session_state['page'] == 'availability':
-        display_availability_page()
+    metrics = get_metrics()
+    page = st.session_state['page']
+    metrics.begin_rerun()
+    profiler = None
+    # ?profile=1 samples this session's reruns when HEALTHCARE_PROFILING=1
+    if PROFILING_ENABLED and st.query_params.get("profile") == "1":
+        st.session_state.setdefault('profile_id', str(uuid.uuid4()))
+        profiler = SamplingProfiler(threading.get_ident(), PROFILE_INTERVAL).start()
+    try:
+        if page == 'registration':
+            display_registration_page()
+        elif page == 'doctor':
+            display_doctor_page()
+        elif page == 'appointment':
+            display_appointment_page()
+        elif page == 'availability':
+            display_availability_page()
+        elif page == 'patient_search':
+            display_patient_search_page()
+        elif page == 'dashboard':
+            display_dashboard_page()
+    finally:
+        persist_session()
+        if profiler:
+            profiler.stop()
+            profiler.dump(os.path.join(PROFILE_DIR, f"{st.session_state['profile_id']}.folded"))
+        metrics.end_rerun(page)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    from healthcare_cli import CLI_COMMANDS
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        CLI_COMMANDS[sys.argv[1]](sys.argv[2:])
+    else:
+        main()
\ No newline at end of file
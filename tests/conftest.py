@@ -0,0 +1,14 @@
+import pytest
+
+import healthcare
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # A fresh, fully migrated SQLite database per test
+    monkeypatch.setattr(healthcare, "DB_BACKEND", "sqlite")
+    monkeypatch.setattr(healthcare, "SQLITE_PATH", str(tmp_path / "healthcare.db"))
+    database = healthcare.create_database(pool_size=2)
+    with database.connection() as conn:
+        healthcare.run_migrations(conn)
+    return database
+
@@ -0,0 +1,18 @@
+def query(database, sql, params=()):
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+def execute(database, sql, params=()):
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            cursor.close()
@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+
+from healthcare import DB_ERRORS, book_slot, ensure_slots, find_free_slots, seed_doctors
+from tests.support import execute, query
+
+TOMORROW = date.today() + timedelta(days=1)
+
+def open_calendar(database):
+    with database.connection() as conn:
+        doctor_id = sorted(seed_doctors(conn).values())[0]
+        ensure_slots(conn, [doctor_id], TOMORROW, 1)
+        return doctor_id, [slot_id for slot_id, _ in find_free_slots(conn, doctor_id, TOMORROW)]
+
+def race(database, slot_id, patient_names):
+    # Every booker holds its own connection and starts its transaction at the same moment
+    start = threading.Barrier(len(patient_names))
+
+    def booker(patient_name):
+        with database.connection() as conn:
+            start.wait()
+            return book_slot(conn, slot_id, patient_name)
+
+    with ThreadPoolExecutor(len(patient_names)) as pool:
+        return dict(zip(patient_names, pool.map(booker, patient_names)))
+
+def test_two_bookers_racing_for_one_slot_get_one_appointment(database):
+    _, slots = open_calendar(database)
+
+    for slot_id in slots:
+        results = race(database, slot_id, ["Asha", "Ravi"])
+
+        winners = [name for name, appointment_id in results.items() if appointment_id is not None]
+        assert len(winners) == 1
+        assert query(database, "SELECT patient_name FROM appointments WHERE slot_id = %s",
+                     (slot_id,)) == [(winners[0],)]
+
+def test_booked_slot_is_not_offered_again(database):
+    doctor_id, slots = open_calendar(database)
+
+    with database.connection() as conn:
+        assert book_slot(conn, slots[0], "Asha") is not None
+        assert book_slot(conn, slots[0], "Ravi") is None
+        assert [slot_id for slot_id, _ in find_free_slots(conn, doctor_id, TOMORROW)] == slots[1:]
+
+def test_reminders_commit_with_the_booking(database):
+    doctor_id, slots = open_calendar(database)
+    execute(database, """
+        CREATE TRIGGER refuse_reminders BEFORE INSERT ON reminders
+        BEGIN SELECT RAISE(ABORT, 'reminders unavailable'); END
+    """)
+
+    with pytest.raises(DB_ERRORS):
+        with database.connection() as conn:
+            book_slot(conn, slots[0], "Asha")
+
+    assert query(database, "SELECT COUNT(*) FROM appointments") == [(0,)]
+    with database.connection() as conn:
+        assert [slot_id for slot_id, _ in find_free_slots(conn, doctor_id, TOMORROW)] == slots
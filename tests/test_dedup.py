@@ -0,0 +1,90 @@
+from datetime import datetime
+
+from healthcare import IdentityFilter, PatientRepository, dedup_patients, identity_key
+from tests.support import execute, query
+
+def add_legacy(database, name, age, gender, locality, client_token=None):
+    # A row registered before migration 6: no identity key
+    return execute(database, """
+        INSERT INTO patients (name, age, gender, locality, registration_date, client_token, name_key)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (name, age, gender, locality, datetime.now().replace(microsecond=0), client_token, name.lower()))
+
+def patients(database):
+    return query(database, "SELECT id, identity_key, client_token FROM patients ORDER BY id")
+
+def test_repeated_registration_is_stored_once(database):
+    repository = PatientRepository(database)
+
+    assert repository.add("Asha Rao", 30, "Female", "Delhi", client_token="tok-1") is True
+    assert repository.add("Asha Rao", 30, "Female", "Delhi", client_token="tok-1") is False
+    assert repository.add(" asha  rao", 30, "female", "Delhi", client_token="tok-2") is False
+
+    assert len(patients(database)) == 1
+
+def test_identity_filter_never_misses_a_known_key():
+    identity_filter = IdentityFilter(1000, 0.01)
+    known = [identity_key(f"Patient {i}", 30, "Female", "Delhi") for i in range(500)]
+    identity_filter.load(known)
+
+    assert identity_filter.ready
+    assert all(identity_filter.might_contain(key) for key in known)
+    unknown = [identity_key(f"Visitor {i}", 30, "Female", "Delhi") for i in range(1000)]
+    assert sum(identity_filter.might_contain(key) for key in unknown) < 50
+
+def test_legacy_row_wins_over_newer_keyed_row(database):
+    legacy_id = add_legacy(database, "Asha Rao", 30, "Female", "Delhi")
+    PatientRepository(database).add("asha  rao", 30, "female", " Delhi", client_token="tok-new")
+
+    stats = dedup_patients(database)
+
+    assert stats["merged"] == 1
+    assert patients(database) == [(legacy_id, identity_key("Asha Rao", 30, "Female", "Delhi"), "tok-new")]
+
+def test_token_moves_to_the_oldest_duplicate(database):
+    first = add_legacy(database, "Ravi Kumar", 45, "Male", "Sector 5")
+    add_legacy(database, "Ravi  Kumar", 45, "male", "Sector 5", client_token="tok-2")
+
+    stats = dedup_patients(database)
+
+    assert stats["scanned"] == 2
+    assert stats["merged"] == 1
+    assert patients(database) == [(first, identity_key("Ravi Kumar", 45, "Male", "Sector 5"), "tok-2")]
+
+def test_duplicates_across_batches_keep_the_first_row(database):
+    first = add_legacy(database, "Meena Iyer", 62, "Female", "Pune")
+    add_legacy(database, "Meena Iyer", 62, "Female", "Pune", client_token="tok-late")
+
+    stats = dedup_patients(database, batch_size=1)
+
+    assert stats["batches"] == 2
+    assert stats["merged"] == 1
+    assert patients(database) == [(first, identity_key("Meena Iyer", 62, "Female", "Pune"), "tok-late")]
+
+def test_survivor_keeps_its_own_token(database):
+    first = add_legacy(database, "John Das", 28, "Male", "Delhi", client_token="tok-first")
+    PatientRepository(database).add("John Das", 28, "Male", "Delhi", client_token="tok-second")
+
+    dedup_patients(database)
+
+    assert patients(database) == [(first, identity_key("John Das", 28, "Male", "Delhi"), "tok-first")]
+
+def test_distinct_patients_are_keyed_not_merged(database):
+    add_legacy(database, "Asha Rao", 30, "Female", "Delhi")
+    add_legacy(database, "Asha Rao", 31, "Female", "Delhi")
+    PatientRepository(database).add("Asha Rao", 30, "Female", "Mumbai")
+
+    stats = dedup_patients(database)
+    rerun = dedup_patients(database)
+
+    assert stats["merged"] == 0
+    assert rerun["scanned"] == 0
+    assert [row[1] is not None for row in patients(database)] == [True, True, True]
+
+def test_dashboard_counts_follow_the_merge(database):
+    add_legacy(database, "Asha Rao", 30, "Female", "Delhi")
+    add_legacy(database, "Asha Rao", 30, "Female", "Delhi")
+
+    dedup_patients(database)
+
+    assert query(database, "SELECT locality, registrations FROM registration_counts") == [("Delhi", 1)]
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+import healthcare
+from healthcare import HospitalSnapshot
+
+HOSPITAL = {
+    "name": "VERMA Hospital", "available": True, "address": "Jankpuri West", "lat": 28.6292, "lon": 77.0781,
+    "beds": 25, "specialties": ["Cardiology", "Pediatrics"],
+}
+
+def write_hospitals(path, records, version):
+    # Each write gets its own mtime, however fast the test runs
+    path.write_text(records if isinstance(records, str) else json.dumps(records), encoding="utf-8")
+    os.utime(path, ns=(version * 10 ** 9, version * 10 ** 9))
+
+def test_snapshot_reloads_only_when_the_file_changes(tmp_path):
+    path = tmp_path / "hospitals.json"
+    write_hospitals(path, [HOSPITAL], 1)
+    snapshot = HospitalSnapshot(str(path), 30)
+
+    assert snapshot.refresh() is False
+    write_hospitals(path, [HOSPITAL, dict(HOSPITAL, name="Lake Clinic")], 2)
+    assert snapshot.refresh() is True
+
+    hospitals = {hospital["name"]: hospital for hospital in snapshot.hospitals}
+    assert sorted(hospitals) == ["Lake Clinic", "VERMA Hospital"]
+    assert hospitals["VERMA Hospital"]["specialties"] == ("Cardiology", "Pediatrics")
+    assert snapshot.stats["reloads"] == 2
+
+def test_unreadable_file_keeps_the_last_snapshot(tmp_path):
+    path = tmp_path / "hospitals.json"
+    write_hospitals(path, [HOSPITAL], 1)
+    snapshot = HospitalSnapshot(str(path), 30)
+    hospitals = snapshot.hospitals
+
+    write_hospitals(path, "[{", 2)
+    with pytest.raises(ValueError):
+        snapshot.refresh()
+
+    assert snapshot.hospitals is hospitals
+
+def test_reload_swaps_directory_and_tree_together(tmp_path):
+    path = tmp_path / "hospitals.json"
+    write_hospitals(path, [HOSPITAL], 1)
+    snapshot = HospitalSnapshot(str(path), 30)
+    before = snapshot.state
+
+    write_hospitals(path, [dict(HOSPITAL, name="Lake Clinic", lat=19.07, lon=72.87)], 2)
+    snapshot.refresh()
+
+    after = snapshot.state
+    assert before.directory.entries[0]["name"] == "VERMA Hospital"
+    assert [hospital["name"] for hospital in after.directory.entries] == ["Lake Clinic"]
+    assert [hospital["name"] for hospital in after.tree.items] == ["Lake Clinic"]
+    assert after.version != before.version
+
+@pytest.mark.parametrize("record", [
+    "VERMA Hospital",
+    {key: value for key, value in HOSPITAL.items() if key != "name"},
+    dict(HOSPITAL, beds="25"),
+    dict(HOSPITAL, available="yes"),
+    dict(HOSPITAL, specialties="Cardiology"),
+    dict(HOSPITAL, lon=None),
+    dict(HOSPITAL, lat=128.6),
+])
+def test_invalid_record_keeps_the_last_snapshot(tmp_path, record):
+    path = tmp_path / "hospitals.json"
+    write_hospitals(path, [HOSPITAL], 1)
+    snapshot = HospitalSnapshot(str(path), 30)
+    state = snapshot.state
+
+    write_hospitals(path, [dict(HOSPITAL, name="Lake Clinic"), record], 2)
+    with pytest.raises(ValueError):
+        snapshot.refresh()
+
+    assert snapshot.state is state
+
+def test_refresher_logs_a_failed_reload_and_keeps_going(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "hospitals.json"
+    write_hospitals(path, [HOSPITAL], 1)
+    snapshot = HospitalSnapshot(str(path), 30)
+    errors = [KeyError("beds"), TypeError("'NoneType' object is not iterable")]
+
+    def refresh():
+        raise errors.pop(0)
+
+    def sleep(seconds):
+        # Ends the loop once both failures have been handled
+        if not errors:
+            raise SystemExit
+
+    monkeypatch.setattr(snapshot, "refresh", refresh)
+    monkeypatch.setattr(healthcare.time, "sleep", sleep)
+    with pytest.raises(SystemExit):
+        snapshot.run_refresher()
+
+    assert snapshot.stats["errors"] == 2
+    assert capsys.readouterr().err.count("keeping the previous one") == 2
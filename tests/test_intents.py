@@ -0,0 +1,62 @@
+import pytest
+
+from healthcare import CHATBOT_RULES_PATH, IntentMatcher, load_chatbot_rules
+
+RULES = {
+    "fallback": "Sorry?",
+    "intents": [
+        {"name": "greeting", "priority": 10, "keywords": ["hi", "good morning"], "response": "Hello!"},
+        {"name": "cough_medicine", "priority": 5, "keywords": ["cough"], "requires": ["medicine"],
+         "response": "Honey and warm water."},
+        {"name": "appointment", "keywords": ["appointment", "book"], "response": "Use the appointments page."},
+        {"name": "booking_help", "keywords": ["book"], "response": "Ties go to the earlier rule."},
+    ],
+}
+
+@pytest.fixture
+def matcher():
+    return IntentMatcher(RULES)
+
+def test_keywords_match_whole_words_only(matcher):
+    assert matcher.respond("is this thing on") == "Sorry?"
+    assert matcher.respond("Hi there") == "Hello!"
+
+def test_phrases_match_in_order(matcher):
+    assert matcher.respond("Good morning, doctor") == "Hello!"
+    assert matcher.respond("morning is good") == "Sorry?"
+
+def test_required_keywords_must_all_appear(matcher):
+    assert matcher.respond("I have a cough") == "Sorry?"
+    assert matcher.respond("any medicine for my cough?") == "Honey and warm water."
+
+@pytest.mark.parametrize("text", ["medicine for cough", "medicines for cough", "cough medicines please"])
+def test_plurals_match_their_keywords(matcher, text):
+    assert matcher.respond(text) == "Honey and warm water."
+
+def test_short_keywords_have_no_plural(matcher):
+    assert matcher.respond("is his appointment today") == "Use the appointments page."
+
+def test_spelled_out_plural_keeps_its_own_rule():
+    matcher = IntentMatcher({"fallback": "", "intents": [
+        {"name": "hospital", "keywords": ["hospital"], "response": "One."},
+        {"name": "hospitals", "keywords": ["hospitals"], "response": "Many."},
+    ]})
+
+    assert matcher.respond("hospital") == "One."
+    assert matcher.respond("hospitals") == "Many."
+
+def test_higher_priority_wins_and_earlier_rules_win_ties(matcher):
+    assert matcher.respond("hi, can I book an appointment") == "Hello!"
+    assert matcher.respond("book") == "Use the appointments page."
+
+def test_keyword_without_words_is_rejected():
+    with pytest.raises(ValueError):
+        IntentMatcher({"fallback": "", "intents": [{"name": "noise", "keywords": ["!!"], "response": ""}]})
+
+def test_shipped_rules_compile():
+    matcher = IntentMatcher(load_chatbot_rules(CHATBOT_RULES_PATH))
+
+    assert matcher.match("hello")[1] == "greeting"
+    assert matcher.match("which medicine helps a cough")[1] == "cough_medicine"
+    assert matcher.match("medicines for cough")[1] == "cough_medicine"
+    assert matcher.match("this") is None
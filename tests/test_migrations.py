@@ -0,0 +1,93 @@
+import re
+
+import mysql.connector
+import pytest
+
+from healthcare import MIGRATIONS, run_migrations
+
+class FakeMySQL:
+    # Just enough of a MySQL server for run_migrations: the catalog, the bookkeeping
+    # tables and a log of data statements. Repeating a schema change fails as MySQL does.
+    dialect = "mysql"
+
+    def __init__(self, fail_on=None):
+        self.versions = set()
+        self.steps = set()
+        self.objects = set()
+        self.data = []
+        self.fail_on = fail_on
+        self._rows = []
+
+    def cursor(self):
+        return self
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def execute(self, statement, params=()):
+        sql = " ".join(statement.split())
+        self._rows = []
+        if "GET_LOCK" in sql or "RELEASE_LOCK" in sql:
+            self._rows = [(1,)]
+        elif sql.startswith("CREATE TABLE IF NOT EXISTS schema_migration"):
+            pass
+        elif sql == "SELECT version FROM schema_migrations":
+            self._rows = [(version,) for version in self.versions]
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            self.versions.add(params[0])
+        elif sql.startswith("SELECT step FROM schema_migration_steps"):
+            self._rows = [(step,) for version, step in self.steps if version == params[0]]
+        elif sql.startswith("INSERT INTO schema_migration_steps"):
+            self.steps.add(tuple(params))
+        elif sql.startswith("DELETE FROM schema_migration_steps"):
+            self.steps = {(version, step) for version, step in self.steps if version != params[0]}
+        elif "information_schema" in sql:
+            self._rows = [(1,)] if self.objects.intersection(params) else []
+        elif self.fail_on and self.fail_on in sql:
+            self.fail_on = None
+            raise mysql.connector.errors.OperationalError("Lost connection to MySQL server during query")
+        else:
+            match = re.match(r"(?:ALTER TABLE \w+ ADD COLUMN|CREATE (?:UNIQUE )?INDEX|CREATE TRIGGER) (\w+)", sql)
+            if match and match.group(1) in self.objects:
+                raise mysql.connector.errors.ProgrammingError(f"Duplicate name '{match.group(1)}'")
+            if match:
+                self.objects.add(match.group(1))
+            elif not sql.startswith("CREATE TABLE"):
+                self.data.append(sql)
+
+def test_interrupted_migration_resumes_where_it_stopped():
+    server = FakeMySQL(fail_on="'1h'")
+
+    with pytest.raises(mysql.connector.Error):
+        run_migrations(server)
+    run_migrations(server)
+
+    assert server.versions == {version for version, _, _ in MIGRATIONS}
+    assert server.steps == set()
+    assert sum("'24h'" in sql for sql in server.data) == 1
+    assert sum("'1h'" in sql for sql in server.data) == 1
+
+def test_schema_changes_already_in_the_catalog_are_skipped():
+    # The column was added just before a crash lost the step that recorded it
+    server = FakeMySQL()
+    server.versions = {1, 2}
+    server.objects = {"idx_patients_locality", "idx_patients_registration_date", "idx_patients_name", "client_token"}
+
+    assert run_migrations(server) == [version for version, _, _ in MIGRATIONS if version > 2]
+    assert "uq_patients_client_token" in server.objects
@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from healthcare import KDTree, build_hospital_tree, hospital_filter, linear_nearest, resolve_location, unit_vector
+
+def random_places(rng, count):
+    return [(rng.uniform(-70, 70), rng.uniform(-180, 180)) for _ in range(count)]
+
+def hospital(name, lat, lon, **fields):
+    return dict({"name": name, "lat": lat, "lon": lon, "available": True, "beds": 10,
+                 "specialties": ("General Medicine",), "address": "Dwarka"}, **fields)
+
+def test_kd_tree_agrees_with_a_linear_scan():
+    rng = random.Random(7)
+    points = [unit_vector(lat, lon) for lat, lon in random_places(rng, 500)]
+    items = list(range(len(points)))
+    tree = KDTree(points, items)
+
+    for lat, lon in random_places(rng, 50):
+        point = unit_vector(lat, lon)
+        for k, accept in ((1, None), (5, None), (5, lambda item: item % 3 == 0)):
+            expected = linear_nearest(points, items, point, k, accept)
+            found = tree.nearest(point, k, accept)
+            assert [item for item, _ in found] == [item for item, _ in expected]
+            assert [km for _, km in found] == pytest.approx([km for _, km in expected])
+
+def test_distances_are_great_circle_kilometres():
+    tree = KDTree([unit_vector(19.0760, 72.8777)], ["Mumbai"])
+
+    [(item, km)] = tree.nearest(unit_vector(28.6139, 77.2090), 1)
+
+    assert item == "Mumbai"
+    assert km == pytest.approx(1150, rel=0.01)
+
+def test_empty_tree_and_zero_k_find_nothing():
+    point = unit_vector(28.6, 77.2)
+
+    assert KDTree((), ()).nearest(point, 3) == []
+    assert KDTree([point], ["Delhi"]).nearest(point, 0) == []
+
+def test_hospitals_without_coordinates_are_left_out():
+    tree = build_hospital_tree([hospital("Lake Clinic", 28.6, 77.0), hospital("Unmapped", None, None)])
+
+    assert [item["name"] for item, _ in tree.nearest(unit_vector(28.6, 77.0), 5)] == ["Lake Clinic"]
+
+def test_hospital_filter_applies_every_criterion():
+    accept = hospital_filter(specialty="Cardiology", min_beds=5)
+
+    assert accept(hospital("A", 0, 0, specialties=("Cardiology",)))
+    assert not accept(hospital("B", 0, 0))
+    assert not accept(hospital("C", 0, 0, specialties=("Cardiology",), beds=2))
+    assert not accept(hospital("D", 0, 0, specialties=("Cardiology",), available=False))
+
+def test_typed_coordinates_are_resolved_and_range_checked():
+    assert resolve_location(" 28.61, 77.21 ") == (28.61, 77.21)
+    assert resolve_location("95, 10") is None
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import mysql.connector
+import pytest
+
+from healthcare import ConnectionPool
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def ping(self, reconnect=False):
+        if not self.alive:
+            raise mysql.connector.errors.InterfaceError("MySQL server has gone away")
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+class FakeServer:
+    def __init__(self):
+        self.opened = []
+        self.refuse = 0
+
+    def connect(self, **connect_args):
+        if self.refuse:
+            self.refuse -= 1
+            raise mysql.connector.errors.InterfaceError("Can't connect to MySQL server")
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+@pytest.fixture
+def server():
+    server = FakeServer()
+    return server
+
+def make_pool(server, size=2, timeout=1.0, healthcheck_interval=30):
+    return ConnectionPool(size, timeout, healthcheck_interval, server.connect)
+
+def test_released_connection_is_reused(server):
+    pool = make_pool(server)
+
+    with pool.connection():
+        pass
+    with pool.connection():
+        pass
+
+    assert len(server.opened) == 1
+    assert pool.snapshot()["misses"] == 1
+    assert pool.snapshot()["hits"] == 1
+
+def test_checkout_times_out_when_every_connection_is_in_use(server):
+    pool = make_pool(server, size=1, timeout=0.05)
+    pool.get_connection()
+
+    with pytest.raises(mysql.connector.errors.PoolError):
+        pool.get_connection()
+
+    assert pool.snapshot()["timeouts"] == 1
+    assert len(server.opened) == 1
+
+def test_waiting_checkout_gets_the_released_connection(server):
+    pool = make_pool(server, size=1)
+    conn = pool.get_connection()
+    threading.Timer(0.05, pool.release, (conn,)).start()
+
+    assert pool.get_connection() is conn
+    assert pool.snapshot()["waits"] == 1
+
+def test_stale_connection_is_replaced_after_a_failed_ping(server):
+    pool = make_pool(server, healthcheck_interval=0)
+    with pool.connection():
+        pass
+    server.opened[0].alive = False
+    time.sleep(0.01)
+
+    with pool.connection():
+        pass
+
+    assert len(server.opened) == 2
+    assert server.opened[0].closed
+    assert pool.snapshot()["health_check_failures"] == 1
+    assert pool.snapshot()["open"] == 1
+
+def test_failed_block_rolls_back_and_returns_the_connection(server):
+    pool = make_pool(server)
+
+    with pytest.raises(RuntimeError):
+        with pool.connection():
+            raise RuntimeError("boom")
+
+    assert server.opened[0].rollbacks == 1
+    assert pool.snapshot()["idle"] == 1
+
+def test_failed_connect_frees_its_slot(server):
+    pool = make_pool(server, size=1)
+    server.refuse = 1
+
+    with pytest.raises(mysql.connector.errors.InterfaceError):
+        pool.get_connection()
+
+    assert pool.get_connection() is server.opened[0]
+    assert pool.snapshot()["open"] == 1
@@ -0,0 +1,52 @@
+import pytest
+
+from healthcare import DISEASE_MODEL_PATH, DiseaseModel, load_disease_model
+
+SPEC = {
+    "symptoms": {"fever": ["fever", "high temperature"], "cough": ["cough"], "rash": ["rash", "itchy skin"]},
+    "diseases": [
+        {"name": "Flu", "specialty": "General Medicine", "weights": {"fever": 2.0, "cough": 1.5}},
+        {"name": "Dermatitis", "specialty": "Dermatologist", "bias": -0.5, "weights": {"rash": 3.0}},
+    ],
+}
+
+@pytest.fixture
+def model():
+    return DiseaseModel(SPEC)
+
+def test_symptom_phrases_match_whole_words(model):
+    assert model.find_symptoms("A high temperature and a cough") == [0, 1]
+    assert model.find_symptoms("temperature is high, rashly") == []
+
+def test_prediction_ranks_diseases_by_probability(model):
+    predictions = model.predict_text("fever and cough")
+
+    assert [name for name, _, _ in predictions] == ["Flu", "Dermatitis"]
+    assert sum(probability for _, probability, _ in predictions) == pytest.approx(1.0)
+    assert predictions[0][2] == "General Medicine"
+
+def test_no_symptoms_means_no_prediction(model):
+    assert model.predict_text("hello there") == []
+
+def test_batch_agrees_with_single_predictions(model):
+    texts = ["fever and cough", "itchy skin", "nothing to report", "a rash with a fever"]
+
+    best, confidence = model.predict_batch(model.encode(texts))
+
+    for text, index, probability in zip(texts, best, confidence):
+        single = model.predict_text(text)
+        if not single:
+            assert index == -1
+            continue
+        assert model.diseases[index] == single[0][0]
+        assert probability == pytest.approx(single[0][1], rel=1e-5)
+
+def test_shipped_model_agrees_with_itself():
+    model = load_disease_model(DISEASE_MODEL_PATH)
+    texts = ["fever with chills and body ache", "sneezing and a runny nose", "chest pain", "good morning"]
+
+    best, _ = model.predict_batch(model.encode(texts))
+
+    assert [model.diseases[index] if index >= 0 else None for index in best] == [
+        predictions[0][0] if predictions else None for predictions in map(model.predict_text, texts)
+    ]
@@ -0,0 +1,112 @@
+import sqlite3
+
+import mysql.connector
+import pytest
+
+import healthcare
+from healthcare import PatientRepository, RegistrationQueue
+from tests.support import execute, query
+
+# Stands in for a row the database refuses for good, such as a constraint violation
+POISON_TRIGGER = """
+    CREATE TRIGGER reject_poison BEFORE INSERT ON patients WHEN NEW.name = 'Poison'
+    BEGIN SELECT RAISE(ABORT, 'rejected by a constraint'); END
+"""
+
+class UnreachablePatients:
+    def add_queued(self, rows):
+        raise mysql.connector.errors.InterfaceError("Can't connect to MySQL server")
+
+@pytest.fixture
+def registration_queue(tmp_path):
+    return RegistrationQueue(str(tmp_path / "queue.db"))
+
+def test_enqueue_is_idempotent_on_client_token(registration_queue):
+    registration_queue.enqueue("Asha Rao", 30, "Female", "Delhi", "tok-1")
+    registration_queue.enqueue("Asha Rao", 30, "Female", "Delhi", "tok-1")
+
+    assert registration_queue.pending() == 1
+    assert registration_queue.snapshot()["enqueued"] == 1
+
+def test_queued_registrations_survive_a_restart(tmp_path):
+    path = str(tmp_path / "queue.db")
+    RegistrationQueue(path).enqueue("Asha Rao", 30, "Female", "Delhi", "tok-1")
+
+    rows = RegistrationQueue(path).peek(10)
+
+    assert [row[1:5] + row[6:] for row in rows] == [("Asha Rao", 30, "Female", "Delhi", "tok-1")]
+
+def test_write_behind_enqueues_while_the_database_is_unreachable(registration_queue, monkeypatch):
+    import registration
+
+    def unreachable():
+        raise mysql.connector.errors.InterfaceError("2003: Can't connect to MySQL server")
+
+    monkeypatch.setattr(healthcare, "get_database", unreachable)
+    monkeypatch.setattr(registration, "WRITE_MODE", "write_behind")
+    monkeypatch.setattr(registration, "get_registration_queue", lambda: registration_queue)
+    healthcare.get_identity_filter.cache_clear()
+
+    assert registration.insert_patient("Asha Rao", 30, "Female", "Delhi", "tok-1")
+    assert registration.insert_patient("Ravi Kumar", 45, "Male", "Pune")
+
+    assert registration_queue.pending() == 2
+    healthcare.get_identity_filter.cache_clear()
+
+@pytest.fixture
+def draining(registration_queue, database, monkeypatch):
+    monkeypatch.setattr(healthcare, "get_patients", lambda: PatientRepository(database))
+    execute(database, POISON_TRIGGER)
+    return registration_queue
+
+def test_unreachable_database_leaves_the_batch_untouched(registration_queue, monkeypatch):
+    monkeypatch.setattr(healthcare, "get_patients", UnreachablePatients)
+    registration_queue.enqueue("Asha Rao", 30, "Female", "Delhi", "tok-1")
+
+    with pytest.raises(mysql.connector.Error):
+        registration_queue.drain_once(10)
+
+    assert registration_queue.pending() == 1
+    assert registration_queue.snapshot()["failed_rows"] == 0
+
+def test_rejected_row_is_split_out_of_its_batch(draining, database):
+    draining.enqueue("Asha Rao", 30, "Female", "Delhi", "tok-1")
+    draining.enqueue("Poison", 40, "Male", "Delhi", "tok-2")
+    draining.enqueue("Ravi Kumar", 45, "Male", "Pune", "tok-3")
+
+    assert draining.drain_once(10) == 2
+
+    assert draining.pending() == 1
+    assert draining.snapshot()["failed_batches"] == 1
+    assert draining.snapshot()["failed_rows"] == 1
+    assert query(database, "SELECT client_token FROM patients ORDER BY client_token") == [("tok-1",), ("tok-3",)]
+
+def test_rejected_row_is_dead_lettered_after_max_attempts(tmp_path, database, monkeypatch):
+    monkeypatch.setattr(healthcare, "get_patients", lambda: PatientRepository(database))
+    execute(database, POISON_TRIGGER)
+    registration_queue = RegistrationQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    registration_queue.enqueue("Poison", 40, "Male", "Delhi", "tok-1")
+
+    registration_queue.drain_once(10)
+    assert (registration_queue.pending(), registration_queue.dead()) == (1, 0)
+    registration_queue.drain_once(10)
+    assert (registration_queue.pending(), registration_queue.dead()) == (0, 1)
+
+    assert registration_queue.snapshot()["dead_lettered"] == 1
+    assert registration_queue.drain_once(10) == 0
+
+def test_replayed_batch_is_written_once(draining, database):
+    draining.enqueue("Asha Rao", 30, "Female", "Delhi", "tok-1")
+    draining.enqueue("Ravi Kumar", 45, "Male", "Pune", "tok-2")
+
+    # The batch commits but the worker dies before acknowledging it
+    def lost_ack(ids):
+        raise sqlite3.OperationalError("disk I/O error")
+    draining.ack = lost_ack
+    with pytest.raises(sqlite3.OperationalError):
+        draining.drain_once(10)
+    del draining.ack
+
+    assert draining.drain_once(10) == 2
+    assert draining.pending() == 0
+    assert query(database, "SELECT client_token FROM patients ORDER BY client_token") == [("tok-1",), ("tok-2",)]
@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from healthcare import ReminderScheduler, book_slot, seed_doctors
+from tests.support import execute, query
+
+NOW = datetime.now().replace(second=0, microsecond=0)
+
+class RecordingNotifier:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def send(self, reminders):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("notifier unavailable")
+        self.sent.extend((reminder["patient_name"], reminder["kind"]) for reminder in reminders)
+
+def book(database, patient_name, starts_at, doctor=0):
+    with database.connection() as conn:
+        doctor_id = sorted(seed_doctors(conn).values())[doctor]
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO slots (doctor_id, starts_at) VALUES (%s, %s)", (doctor_id, starts_at))
+            slot_id = cursor.lastrowid
+        finally:
+            cursor.close()
+        return book_slot(conn, slot_id, patient_name)
+
+def outbox(database):
+    return query(database, """
+        SELECT a.patient_name, r.kind, r.outcome, r.attempts FROM reminders r
+        JOIN appointments a ON a.id = r.appointment_id ORDER BY r.id
+    """)
+
+def test_booking_writes_only_future_reminders(database):
+    book(database, "Asha", NOW + timedelta(hours=3))
+
+    assert outbox(database) == [("Asha", "1h", None, 0)]
+
+def test_restart_sends_overdue_reminders_once(database):
+    book(database, "Asha", NOW + timedelta(hours=3))
+    first = RecordingNotifier()
+    ReminderScheduler(database, first).run_once(NOW + timedelta(hours=2, minutes=1))
+    book(database, "Ravi", NOW + timedelta(hours=5))
+
+    # A new process, started after Ravi's reminder fell due while nothing was running
+    second = RecordingNotifier()
+    ReminderScheduler(database, second).run_once(NOW + timedelta(hours=4, minutes=30))
+
+    assert first.sent == [("Asha", "1h")]
+    assert second.sent == [("Ravi", "1h")]
+    assert outbox(database) == [("Asha", "1h", "sent", 1), ("Ravi", "1h", "sent", 1)]
+
+def test_late_commit_with_lower_id_is_picked_up(database):
+    book(database, "Asha", NOW + timedelta(hours=3))
+    book(database, "Ravi", NOW + timedelta(hours=3), doctor=1)
+    # Asha's booking took the lower id but has not committed yet when the scheduler looks
+    early = query(database, "SELECT id, appointment_id, kind, due_at FROM reminders ORDER BY id")[0]
+    execute(database, "DELETE FROM reminders WHERE id = %s", (early[0],))
+    notifier = RecordingNotifier()
+    scheduler = ReminderScheduler(database, notifier)
+    assert scheduler.refresh(NOW + timedelta(hours=1, minutes=30)) == 1
+
+    execute(database, "INSERT INTO reminders (id, appointment_id, kind, due_at) VALUES (%s, %s, %s, %s)", early)
+    scheduler.run_once(NOW + timedelta(hours=2, minutes=1))
+
+    assert sorted(notifier.sent) == [("Asha", "1h"), ("Ravi", "1h")]
+
+def test_refresh_skips_reminders_already_queued(database):
+    book(database, "Asha", NOW + timedelta(hours=3))
+    scheduler = ReminderScheduler(database, RecordingNotifier())
+
+    assert scheduler.refresh(NOW + timedelta(hours=1, minutes=30)) == 1
+    assert scheduler.refresh(NOW + timedelta(hours=1, minutes=31)) == 0
+    assert scheduler.snapshot()["queued"] == 1
+
+def test_failed_delivery_is_requeued(database):
+    book(database, "Asha", NOW + timedelta(hours=3))
+    notifier = RecordingNotifier(failures=1)
+    scheduler = ReminderScheduler(database, notifier)
+    due = NOW + timedelta(hours=2, minutes=1)
+    scheduler.refresh(due)
+
+    with pytest.raises(ConnectionError):
+        scheduler.dispatch_due(due)
+    assert outbox(database) == [("Asha", "1h", None, 0)]
+    # Retried after a backoff, not straight away
+    assert scheduler.dispatch_due(due) == 0
+    assert scheduler.dispatch_due(due + timedelta(seconds=5)) == 1
+
+    assert notifier.sent == [("Asha", "1h")]
+    assert outbox(database) == [("Asha", "1h", "sent", 1)]
+    assert scheduler.snapshot()["failed_batches"] == 1
+
+def test_reminder_after_appointment_start_expires(database):
+    book(database, "Asha", NOW + timedelta(hours=3))
+    notifier = RecordingNotifier()
+
+    ReminderScheduler(database, notifier).run_once(NOW + timedelta(hours=3, minutes=5))
+
+    assert notifier.sent == []
+    assert outbox(database) == [("Asha", "1h", "expired", 1)]
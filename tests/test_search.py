@@ -0,0 +1,62 @@
+import pytest
+
+from healthcare import PatientRepository, LRUCache
+from tests.support import execute
+
+NAMES = ["Aarav", "Aditi", "Arjun", "Asha", "Bhavna", "Dev", "Divya", "Ishaan", "Kabir", "Meera"]
+
+@pytest.fixture
+def patients(database):
+    patients = PatientRepository(database, LRUCache(100, 60))
+    patients.add_many([(name, 20 + i, "Female", "Delhi" if i % 2 else "Pune") for i, name in enumerate(NAMES)])
+    return patients
+
+def names(page):
+    return [patient["name"] for patient in page]
+
+def walk(patients, limit, **criteria):
+    pages, after = [], None
+    while True:
+        page, after = patients.search(after=after, limit=limit, **criteria)
+        pages.append(names(page))
+        if after is None:
+            return pages
+
+def test_keyset_pages_cover_every_match_once(patients):
+    assert walk(patients, 3) == [NAMES[0:3], NAMES[3:6], NAMES[6:9], NAMES[9:]]
+
+def test_equal_names_page_by_id(patients):
+    patients.add_many([("Asha", 40, "Female", "Noida"), ("asha", 41, "Female", "Noida")])
+
+    pages = walk(patients, 2, name_prefix="asha")
+
+    assert pages == [["Asha", "Asha"], ["asha"]]
+
+def test_filters_combine_with_the_name_prefix(patients):
+    assert walk(patients, 10, name_prefix=" A", locality="Delhi ") == [["Aditi", "Asha"]]
+    assert walk(patients, 10, min_age=25, max_age=27) == [["Dev", "Divya", "Ishaan"]]
+
+def test_wildcards_in_the_prefix_are_literal(patients):
+    assert walk(patients, 10, name_prefix="a%") == [[]]
+    assert walk(patients, 10, name_prefix="a_") == [[]]
+
+def test_pages_are_cached_until_this_process_writes(patients, database):
+    first = patients.search(name_prefix="a")
+    # Written behind the repository's back, so the cache cannot know
+    execute(database, "DELETE FROM patients WHERE name_key = %s", ("asha",))
+    assert patients.search(name_prefix="a") == first
+
+    patients.add("Anil", 50, "Male", "Delhi")
+
+    assert names(patients.search(name_prefix="a")[0]) == ["Aarav", "Aditi", "Anil", "Arjun"]
+
+def test_write_keeps_pages_it_cannot_appear_on(patients, database):
+    other_prefix = patients.search(name_prefix="d")
+    other_locality = patients.search(name_prefix="a", locality="Pune")
+    execute(database, "DELETE FROM patients WHERE name_key IN (%s, %s)", ("dev", "aarav"))
+
+    patients.add("Anil", 50, "Male", "Delhi")
+
+    assert patients.search(name_prefix="d") == other_prefix
+    assert patients.search(name_prefix="a", locality="Pune") == other_locality
+    assert "Anil" in names(patients.search(name_prefix="a")[0])
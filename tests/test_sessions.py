@@ -0,0 +1,106 @@
+import threading
+import time
+from datetime import date, datetime
+
+import pytest
+
+from healthcare import (
+    RespClient, RespError, RespStandInServer, create_session_store, decode_session_value, encode_session_value,
+    persist_session_state, restore_session_state,
+)
+
+SESSION_ID = "0123456789abcdef0123"
+
+@pytest.fixture
+def resp_server():
+    server = RespStandInServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "redis://%s:%d/0" % server.server_address
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=["sqlite", "redis"])
+def store_url(request, tmp_path):
+    if request.param == "sqlite":
+        return f"sqlite:{tmp_path / 'sessions.db'}"
+    return request.getfixturevalue("resp_server")
+
+class RecordingStore:
+    def __init__(self, store):
+        self.store = store
+        self.saves = []
+
+    def load(self, session_id):
+        return self.store.load(session_id)
+
+    def save(self, session_id, changed, removed):
+        self.saves.append((sorted(changed), sorted(removed)))
+        self.store.save(session_id, changed, removed)
+
+def test_values_round_trip():
+    value = {"selected_date": date(2024, 5, 1), "booked_at": datetime(2024, 5, 1, 9, 30),
+             "slot": (3, "09:00"), "search_cursors": [["asha", 4]], "patient_name": "Asha"}
+
+    assert decode_session_value(encode_session_value(value)) == value
+
+def test_large_values_are_compressed():
+    value = [f"message {i}" for i in range(500)]
+    data = encode_session_value(value)
+
+    assert data[:1] == b"z"
+    assert len(data) < len(str(value))
+    assert decode_session_value(data) == value
+    assert encode_session_value("Asha")[:1] != b"z"
+
+def test_only_changed_keys_are_written_back(store_url):
+    store = RecordingStore(create_session_store(store_url, ttl=60))
+    state = {"page": "Home", "patient_name": "Asha", "search_cursors": [], "registration_form_age": 30}
+    digests = {}
+
+    persist_session_state(store, SESSION_ID, state, digests)
+    state["page"] = "Book Appointment"
+    state["search_cursors"].append(["asha", 4])
+    persist_session_state(store, SESSION_ID, state, digests)
+    persist_session_state(store, SESSION_ID, state, digests)
+    del state["patient_name"]
+    persist_session_state(store, SESSION_ID, state, digests)
+
+    assert store.saves == [
+        (["page", "patient_name", "search_cursors"], []),
+        (["page", "search_cursors"], []),
+        ([], ["patient_name"]),
+    ]
+    restored = {}
+    restore_session_state(store, SESSION_ID, restored)
+    assert restored == {"page": "Book Appointment", "search_cursors": [["asha", 4]]}
+
+def test_unknown_keys_and_corrupt_values_are_skipped(store_url):
+    store = create_session_store(store_url, ttl=60)
+    store.save(SESSION_ID, {"page": b'"Home"', "widget_value": b"1", "search_criteria": b"{not json"}, [])
+
+    restored = {}
+    restore_session_state(store, SESSION_ID, restored)
+
+    assert restored == {"page": "Home"}
+
+def test_sessions_expire_after_the_ttl(store_url):
+    store = create_session_store(store_url, ttl=1)
+    store.save(SESSION_ID, {"page": b'"Home"'}, [])
+    assert store.load(SESSION_ID) == {"page": b'"Home"'}
+
+    time.sleep(1.1)
+
+    assert store.load(SESSION_ID) == {}
+
+def test_resp_client_pipelines_against_the_stand_in(resp_server):
+    client = RespClient(resp_server)
+
+    assert client.execute("PING") == b"PONG"
+    assert client.pipeline([
+        ["HSET", "session", "page", "Home", "chat_open", "1"],
+        ["HDEL", "session", "chat_open"],
+        ["EXPIRE", "session", 60],
+        ["HGETALL", "session"],
+    ]) == [2, 1, 1, [b"page", b"Home"]]
+    with pytest.raises(RespError):
+        client.execute("FLUSHALL")
@@ -0,0 +1,30 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from healthcare import PatientRepository, to_qmark
+from tests.support import query
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    # Far enough from UTC that a UTC timestamp cannot pass for local time
+    monkeypatch.setenv("TZ", "Asia/Kolkata")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_placeholders_are_rewritten_for_sqlite():
+    assert to_qmark("SELECT id FROM patients WHERE name = %s AND age > %s") == \
+        "SELECT id FROM patients WHERE name = ? AND age > ?"
+
+def test_registration_dates_are_stored_in_local_time(database, local_timezone):
+    started = datetime.now().replace(microsecond=0)
+    patients = PatientRepository(database)
+    patients.add("Asha Rao", 30, "Female", "Delhi")
+    patients.add_many([("Ravi Kumar", 45, "Male", "Pune")])
+    finished = datetime.now()
+
+    for (registered_at,) in query(database, "SELECT registration_date FROM patients"):
+        assert started <= datetime.fromisoformat(str(registered_at)) <= finished